@@ -42,6 +42,10 @@ class QDisplaySessionWidget(QWidget):
     """
 
     terminate = pyqtSignal(str)
+    # emitted from the supervisor thread when the viewer of this display starts or ends
+    service_active = pyqtSignal(bool)
+    # emitted from the tunnel monitor thread with the tunnel statistics
+    tunnel_stats = pyqtSignal(dict)
 
     def __init__(self,
                  parent,
@@ -76,6 +80,12 @@ class QDisplaySessionWidget(QWidget):
         self.kill_ico = QIcon()
         self.share_ico = QIcon()
 
+        self.service_active.connect(self.enable_connect_button)
+        self.tunnel_stats.connect(self.update_link_label)
+
+        # vnc encoding profile of the running viewer
+        self.vnc_profile = ''
+
         # threads
         self.kill_thread = None
 
@@ -129,6 +139,10 @@ class QDisplaySessionWidget(QWidget):
         self.resources_label.setText(self.resources)
         display_hor_layout.addWidget(self.resources_label)
 
+        self.link_label = QLabel(self)
+        self.link_label.setMinimumWidth(40)
+        display_hor_layout.addWidget(self.link_label)
+
         self.connect_btn = QPushButton(self)
         self.connect_btn.setIcon(self.connect_ico)
         self.connect_btn.setToolTip('Connect to the remote display')
@@ -160,7 +174,8 @@ class QDisplaySessionWidget(QWidget):
         try:
             logger.info("Connecting to remote display " + str(self.display_name))
             self.parent.remote_connection_manager.submit(self.session,
-                                                         gui_cmd=self.enable_connect_button)
+                                                         gui_cmd=self.on_service_state,
+                                                         stats_cmd=self.on_tunnel_stats)
         except:
             logger.error("Failed to connect to remote display " + str(self.display_name))
 
@@ -249,11 +264,42 @@ class QDisplaySessionWidget(QWidget):
                     self.status = Status.FINISHED
                     self.kill_display()
 
+    def on_service_state(self, active):
+        self.service_active.emit(active)
+
+    def on_tunnel_stats(self, stats):
+        self.tunnel_stats.emit(stats)
+
     def enable_connect_button(self, active):
         if active:
             self.connect_btn.setEnabled(False)
         else:
             self.connect_btn.setEnabled(True)
+            self.vnc_profile = ''
+            self.link_label.setText('')
+            self.link_label.setToolTip('')
+
+    def update_link_label(self, stats):
+        """
+        Show the vnc profile and the round trip time of the ssh tunnel, and its throughput in the tooltip
+        """
+        if 'profile' in stats:
+            self.vnc_profile = stats['profile']
+            self.link_label.setText(self.vnc_profile)
+            self.link_label.setToolTip('Vnc encoding profile chosen for the measured link')
+            return
+        if not stats.get('healthy', False):
+            self.link_label.setText('tunnel down')
+            self.link_label.setToolTip('The ssh tunnel to the display is not working')
+            return
+        if stats.get('rtt') is not None:
+            self.link_label.setText(' '.join(x for x in (self.vnc_profile,
+                                                         "{0:.0f} ms".format(stats['rtt'] * 1000)) if x))
+        tooltip = 'Vnc encoding profile and round trip time through the ssh tunnel'
+        if stats.get('throughput_in') is not None:
+            tooltip += "\nin: {0:.1f} KB/s out: {1:.1f} KB/s".format(stats['throughput_in'] / 1024,
+                                                                     stats['throughput_out'] / 1024)
+        self.link_label.setToolTip(tooltip)
 
     @pyqtSlot(Status)
     def on_status_change(self, status):
@@ -25,17 +25,24 @@ import time
 import traceback
 
 # pyqt5
-from PyQt5.QtCore import Qt, pyqtSlot, QRegExp
-from PyQt5.QtGui import QRegExpValidator
+from PyQt5.QtCore import Qt, pyqtSlot, QRegExp, QTimer
+from PyQt5.QtGui import QRegExpValidator, QFont
 from PyQt5.QtWidgets import QLabel, QLineEdit, QDialog, QComboBox, \
     QHBoxLayout, QVBoxLayout, QPushButton, \
-    QApplication, QTabWidget, QWidget, QSlider, QSizePolicy, QFrame
+    QApplication, QTabWidget, QWidget, QSlider, QSizePolicy, QFrame, QPlainTextEdit
+
+# local includes
+from client.gui.thread import PreviewThread
 
 
 class QDynamicDisplayDialog(QDialog):
 
+    # milliseconds without changes before the job script preview is requested
+    preview_delay = 600
+
     def __init__(self, display_dialog_ui, callback=None,
-                 name_choices=('SCHEDULER', 'SCHEDULER.QUEUE', 'SERVICE', 'SERVICE.COMMAND')):
+                 name_choices=('SCHEDULER', 'SCHEDULER.QUEUE', 'SERVICE', 'SERVICE.COMMAND'),
+                 preview=None):
         QDialog.__init__(self)
 
         if callback:
@@ -45,12 +52,24 @@ class QDynamicDisplayDialog(QDialog):
 
         self.name_choices = name_choices
 
+        # nested ordered dicts, with rcm.load_json_menu the shared subtrees are resolved
+        # when first read through items(), get() or []
         self.display_dialog_ui = display_dialog_ui
         self.tabs = QTabWidget(self)
         self.job = None
         self.choices = dict()
         self.display_name = ''
 
+        # preview(choices) returns the rendered job script, it is called in a thread
+        self.preview = preview
+        self.preview_thread = None
+        self.preview_pending = False
+        self.preview_text = None
+        self.preview_status = None
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.timeout.connect(self.request_preview)
+
         self.setWindowTitle("New display")
         self.setSizePolicy(QSizePolicy.Minimum, QSizePolicy.Minimum)
 
@@ -62,6 +81,21 @@ class QDynamicDisplayDialog(QDialog):
         # Add the job tab
         self.tabs.addTab(self.job, "Job")
 
+        # Add the job script preview tab
+        if self.preview:
+            preview_widget = QWidget(self)
+            preview_layout = QVBoxLayout()
+            self.preview_status = QLabel(self)
+            self.preview_text = QPlainTextEdit(self)
+            self.preview_text.setReadOnly(True)
+            self.preview_text.setLineWrapMode(QPlainTextEdit.NoWrap)
+            self.preview_text.setFont(QFont("Courier"))
+            preview_layout.addWidget(self.preview_status)
+            preview_layout.addWidget(self.preview_text)
+            preview_widget.setLayout(preview_layout)
+            self.tabs.addTab(preview_widget, "Job script")
+            self.choices_changed()
+
         # Ok button
         bottom_layout = QHBoxLayout()
         ok_button = QPushButton('Ok', self)
@@ -82,16 +116,55 @@ class QDynamicDisplayDialog(QDialog):
 
         ok_button.clicked.connect(self.on_ok)
 
-    def on_ok(self):
-        self.choices = dict()
+    def current_choices(self):
+        choices = dict()
 
         for key, value in self.job.choices.items():
-            self.choices[key] = value
+            choices[key] = value
 
         for key, container_widget in self.job.containers.items():
             if not container_widget.isHidden():
                 for key2, value2 in container_widget.choices.items():
-                    self.choices[key2] = value2
+                    choices[key2] = value2
+        return choices
+
+    def choices_changed(self):
+        # debounce: the preview is requested once the user stops changing the fields
+        if self.preview and self.job:
+            self.preview_timer.start(self.preview_delay)
+
+    def request_preview(self):
+        if self.preview_thread and not self.preview_thread.isFinished():
+            # one request at a time, the latest choices are sent when the running one is done
+            self.preview_pending = True
+            return
+        self.start_preview()
+
+    def start_preview(self):
+        self.preview_pending = False
+        self.preview_status.setText("Rendering job script...")
+        self.preview_thread = PreviewThread(self.preview, self.current_choices())
+        self.preview_thread.finished.connect(self.on_preview)
+        self.preview_thread.start()
+
+    def on_preview(self):
+        if self.preview_pending:
+            self.start_preview()
+            return
+        result = self.preview_thread.result
+        if not result:
+            self.preview_status.setText("Job script preview not available " + self.preview_thread.error)
+            return
+        unresolved = result.get('unresolved', [])
+        if unresolved:
+            self.preview_status.setText("Not substituted: " + ", ".join(unresolved))
+        else:
+            self.preview_status.setText(result.get('scheduler', '') + " job for " + result.get('service', ''))
+        self.preview_text.setPlainText(result.get('script', ''))
+
+    def on_ok(self):
+        self.preview_timer.stop()
+        self.choices = self.current_choices()
 
 
         for key in self.name_choices:
@@ -121,6 +194,13 @@ class QContainerWidget(QWidget):
         # list of gui Qt widgets owned by this Qt container
         self.widgets = list()
 
+    def set_choice(self, var, value):
+        self.choices[var] = value
+        # let the dialog refresh the job script preview
+        dialog = self.window()
+        if callable(getattr(dialog, 'choices_changed', None)):
+            dialog.choices_changed()
+
 
 class QJobWidget(QContainerWidget):
     def __init__(self, display_dialog_ui):
@@ -320,7 +400,7 @@ def widget_factory(widget_type):
                 # print("switched to " + key)
 
                 if self.parent_widget:
-                    self.parent_widget.choices[self.var] = self.currentText()
+                    self.parent_widget.set_choice(self.var, self.currentText())
 
                 if self.parent:
                     if key in self.parent.containers:
@@ -420,7 +500,7 @@ def widget_factory(widget_type):
             self.slider_edit.setText(text)
 
             if self.parent_widget:
-                self.parent_widget.choices[self.var] = text
+                self.parent_widget.set_choice(self.var, text)
 
     def sec_to_time(seconds):
         return time.strftime('%H:%M:%S', time.gmtime(seconds))
@@ -463,7 +543,7 @@ def widget_factory(widget_type):
             self.slider_edit.setText(text)
 
             if self.parent_widget:
-                self.parent_widget.choices[self.var] = text
+                self.parent_widget.set_choice(self.var, text)
 
         @pyqtSlot()
         def slider_edit_change(self):
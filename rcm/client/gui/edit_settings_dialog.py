@@ -86,19 +86,16 @@ class QEditSettingsDialog(QDialog):
         ssh_client_group_box = QGroupBox(self)
         self.ssh_client_btn_int = QRadioButton("internal")
         self.ssh_client_btn_ext = QRadioButton("external")
-        if self.settings['ssh_client'] == "internal":
-            self.ssh_client_btn_int.setChecked(True)
-            self.ssh_client_btn_ext.setChecked(False)
-        elif self.settings['ssh_client'] == "external":
-            self.ssh_client_btn_int.setChecked(False)
-            self.ssh_client_btn_ext.setChecked(True)
-        else:
-            self.ssh_client_btn_int.setChecked(False)
-            self.ssh_client_btn_ext.setChecked(False)
+        self.ssh_client_btn_auto = QRadioButton("auto")
+        self.ssh_client_btn_auto.setToolTip('Use the system ssh master connection if available, internal otherwise')
+        self.ssh_client_btn_int.setChecked(self.settings['ssh_client'] == "internal")
+        self.ssh_client_btn_ext.setChecked(self.settings['ssh_client'] == "external")
+        self.ssh_client_btn_auto.setChecked(self.settings['ssh_client'] == "auto")
 
         ssh_client_vbox = QVBoxLayout()
         ssh_client_vbox.addWidget(self.ssh_client_btn_int)
         ssh_client_vbox.addWidget(self.ssh_client_btn_ext)
+        ssh_client_vbox.addWidget(self.ssh_client_btn_auto)
         ssh_client_vbox.addStretch(1)
         ssh_client_group_box.setLayout(ssh_client_vbox)
 
@@ -179,6 +176,8 @@ class QEditSettingsDialog(QDialog):
             self.settings['ssh_client'] = "internal"
         elif self.ssh_client_btn_ext.isChecked():
             self.settings['ssh_client'] = "external"
+        elif self.ssh_client_btn_auto.isChecked():
+            self.settings['ssh_client'] = "auto"
         else:
             self.settings['ssh_client'] = None
         self.settings['preload_command'] = self.findChild(QLineEdit, 'preload_command').text()
@@ -44,10 +44,11 @@ from client.utils.pyinstaller_utils import resource_path
 from client.miscellaneous.logger import logger
 from client.miscellaneous.config_parser import parser, config_file_name, preset_sessions, merge_preset_sessions
 from client.logic import manager
-from client.gui.thread import LoginThread, ReloadThread
+from client.gui.thread import LoginThread, ReloadThread, ConfigRefreshThread
 from client.gui.worker import Worker
 from client.utils.rcm_enum import Status
 import client.logic.rcm_utils as rcm_utils
+import rcm
 import client.utils.pyinstaller_utils as pyinstaller_utils
 
 
@@ -72,12 +73,14 @@ class QSSHSessionWidget(QWidget):
         self.displays = {}
         self.sessions_list = collections.deque(maxlen=5)
         self.platform_config = None
+        self.config_from_cache = False
         self.remote_connection_manager = None
         self.is_logged = False
 
         # threads
         self.login_thread = None
         self.reload_thread = None
+        self.config_refresh_thread = None
 
         # widgets
         self.session_combo = QComboBox(self)
@@ -423,12 +426,31 @@ class QSSHSessionWidget(QWidget):
 
             # update the session list to be shown
             self.reload()
+
+            # the config came from the local cache, check if the server one changed
+            if self.config_from_cache:
+                self.config_refresh_thread = ConfigRefreshThread(self)
+                self.config_refresh_thread.finished.connect(self.on_config_refreshed)
+                self.config_refresh_thread.start()
         else:
             # Show the login widget again
             self.containerLoginWidget.show()
             self.containerSessionWidget.hide()
             self.containerWaitingWidget.hide()
 
+    def on_config_refreshed(self):
+        server_config = self.config_refresh_thread.server_config
+        if not server_config or not self.platform_config:
+            return
+        if server_config.get_string(format='json') == self.platform_config.get_string(format='json'):
+            logger.debug("Cached server configuration is up-to-date")
+            return
+        logger.info("Server configuration updated")
+        version_changed = server_config.get_version() != self.platform_config.get_version()
+        self.platform_config = server_config
+        if version_changed:
+            self.update_executable()
+
     def update_executable(self):
         # update the executable only if we are running in a bundle
         if not pyinstaller_utils.is_bundled():
@@ -521,10 +543,11 @@ class QSSHSessionWidget(QWidget):
         display_dialog_ui = None
         if self.platform_config:
             if 'jobscript_json_menu' in self.platform_config.config:
-                display_dialog_ui = json.loads(self.platform_config.config.get('jobscript_json_menu', '{}'),
-                                               object_pairs_hook=collections.OrderedDict)
+                # shared subtrees of the menu are resolved by the dialog when first accessed
+                display_dialog_ui = rcm.load_json_menu(self.platform_config.config.get('jobscript_json_menu', '{}'))
         if display_dialog_ui:
-            display_dlg = QDynamicDisplayDialog(display_dialog_ui)
+            display_dlg = QDynamicDisplayDialog(display_dialog_ui,
+                                                preview=self.remote_connection_manager.preview)
         else:
             display_dlg = QDisplayDialog(list(self.displays.keys()),
                                          self.platform_config)
@@ -650,6 +673,7 @@ class QSSHSessionWidget(QWidget):
         try:
             self.kill_login_thread()
             self.kill_reload_thread()
+            self.kill_config_refresh_thread()
 
             for display_session_id in self.displays.keys():
                 self.displays[display_session_id].kill_all_threads()
@@ -672,6 +696,12 @@ class QSSHSessionWidget(QWidget):
                 logger.debug("killing reload thread")
                 self.reload_thread.terminate()
 
+    def kill_config_refresh_thread(self):
+        if self.config_refresh_thread:
+            if not self.config_refresh_thread.isFinished():
+                logger.debug("killing config refresh thread")
+                self.config_refresh_thread.terminate()
+
     def sessions_list_names(self):
 
         sessions_list_name=collections.deque()
@@ -42,7 +42,14 @@ class LoginThread(QThread):
                                                                       password=self.password,
                                                                       preload=self.preload)
 
-            self.session_widget.platform_config = self.session_widget.remote_connection_manager.get_config()
+            # render from the config cached at the previous login, it is refreshed in background
+            cached_config = self.session_widget.remote_connection_manager.cached_config()
+            if cached_config:
+                self.session_widget.platform_config = cached_config
+                self.session_widget.config_from_cache = True
+            else:
+                self.session_widget.platform_config = self.session_widget.remote_connection_manager.get_config()
+                self.session_widget.config_from_cache = False
             self.session_widget.is_logged = True
         except Exception as e:
             self.session_widget.is_logged = False
@@ -50,6 +57,39 @@ class LoginThread(QThread):
             logger.error(e)
 
 
+class ConfigRefreshThread(QThread):
+    def __init__(self, session_widget):
+        QThread.__init__(self)
+        self.session_widget = session_widget
+        self.server_config = None
+
+    def run(self):
+        try:
+            # the api version came from the config cache as well
+            self.session_widget.remote_connection_manager.refresh_api_version()
+            self.server_config = self.session_widget.remote_connection_manager.get_config()
+        except Exception as e:
+            logger.warning("Failed to refresh the server configuration")
+            logger.warning(e)
+
+
+class PreviewThread(QThread):
+    def __init__(self, preview, choices):
+        QThread.__init__(self)
+        self.preview = preview
+        self.choices = choices
+        self.result = None
+        self.error = ''
+
+    def run(self):
+        try:
+            self.result = self.preview(self.choices)
+        except Exception as e:
+            self.error = str(e)
+            logger.warning("Failed to preview the job script")
+            logger.warning(e)
+
+
 class KillThread(QThread):
     def __init__(self, session_widget, session, display_widget, current_status):
         QThread.__init__(self)
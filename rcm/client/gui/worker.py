@@ -83,7 +83,8 @@ class Worker(QRunnable):
 
             self.display_widget.session = display_session
             self.remote_connection_manager.submit(display_session,
-                                                  gui_cmd=self.display_widget.enable_connect_button)
+                                                  gui_cmd=self.display_widget.on_service_state,
+                                                  stats_cmd=self.display_widget.on_tunnel_stats)
 
             logger.debug("Worker for display " + str(self.display_id) + " finished")
         except Exception as e:
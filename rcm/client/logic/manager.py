@@ -24,7 +24,11 @@ import sys
 import json
 import os
 import socket
-import paramiko
+import hashlib
+import shlex
+import tempfile
+import threading
+import concurrent.futures
 
 # in order to parse the pickle message coming from the server, we need to import rcm as below
 root_rcm_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -36,8 +40,12 @@ import rcm
 import client.logic.rcm_utils as rcm_utils
 import client.logic.plugin as plugin
 import client.logic.cipher as cipher
-import client.logic.thread as thread
 import client.logic.rcm_protocol_client as rcm_protocol_client
+import client.logic.ssh_pool as ssh_pool
+import client.logic.tunnel as tunnel
+import client.logic.supervisor as supervisor
+import client.logic.vnc_profile as vnc_profile
+import client.logic.route as route
 from client.miscellaneous.logger import logic_logger
 from client.miscellaneous.config_parser import parser, defaults
 
@@ -49,6 +57,20 @@ class RemoteConnectionManager:
     create/start/kill/list display remote sessions.
     """
 
+    # max number of login nodes queried at the same time and seconds allowed for each of them
+    list_max_workers = 8
+    list_timeout = 30
+
+    # seconds allowed to the server commands ( new waits for the job to start ), the commands that can
+    # be run again when the rpc server failed without answering
+    command_timeout = 60
+    command_timeouts = {'new': 600, 'list': list_timeout}
+    idempotent_commands = ('config', 'version', 'loginlist', 'list', 'list_all', 'preview')
+
+    # seconds allowed to the direct and tunnelled route probes, and max login nodes probed
+    route_timeout = 3
+    route_max_login_nodes = 4
+
     def __init__(self):
         self.user = ''
         self.password = ''
@@ -57,7 +79,8 @@ class RemoteConnectionManager:
 
         self.subnet = ''
         self.proxynode = ''
-        self.commandnode = ''
+        # login nodes found by the last sessions list, candidates of the tunnelled routes
+        self.login_nodes = []
 
         self.server_config = None
         self._api_version = None
@@ -67,7 +90,32 @@ class RemoteConnectionManager:
         self.protocol = rcm_protocol_client.get_protocol()
         self.protocol.decorate = self.prex
 
-        self.session_threads = []
+        # authenticated ssh connections reused by all the protocol calls
+        self.ssh_pool = ssh_pool.SSHConnectionPool()
+        try:
+            probe_interval = json.loads(parser.get('Settings', 'tunnel_probe_interval',
+                                                   fallback=defaults['tunnel_probe_interval']))
+        except Exception:
+            probe_interval = 30
+        # a single supervisor watches all the viewers and the ssh processes of the tunnels
+        self.supervisor = supervisor.ProcessSupervisor()
+        self.tunnel_manager = tunnel.TunnelManager(self.ssh_pool, probe_interval=probe_interval,
+                                                   supervisor=self.supervisor)
+
+        # long lived rpc servers, one per login node, and login nodes whose server does not support --rpc
+        self.rpc_transports = dict()
+        self.rpc_unsupported = set()
+        self.rpc_lock = threading.Lock()
+        try:
+            self.use_rpc = json.loads(parser.get('Settings', 'rpc_transport', fallback=defaults['rpc_transport']))
+        except Exception:
+            self.use_rpc = True
+
+        self.service_sessions = []
+        self.route_cache = route.RouteCache()
+        # bandwidth of the ssh path per (proxy node, client network), see select_vnc_profile
+        self.bandwidth_cache = route.RouteCache(os.path.join(rcm_utils.client_folder(), 'cache', 'bandwidth.json'),
+                                                ttl=3600)
         self.rcm_server_command = json.loads(parser.get('Settings',
                                                         'preload_command',
                                                         fallback=defaults['preload_command']))
@@ -83,18 +131,17 @@ class RemoteConnectionManager:
 
         return True
 
-    def prex(self, cmd):
+    def prex(self, cmd, commandnode=''):
         """
         A wrapper around all the remote command execution;
-        accept the input command and
+        accept the input command and the login node to run it on ( default the proxy node ),
         return the remote server output that comes after
         the rcm.serverOutputString separation string
         """
-        if self.commandnode == '':
+        if commandnode == '':
             host = self.proxynode
         else:
-            host = self.commandnode
-            self.commandnode = ''
+            host = commandnode
 
         # build the full command
         if self.preload.strip():
@@ -106,24 +153,30 @@ class RemoteConnectionManager:
         else:
             fullcommand = self.rcm_server_command
 
-        fullcommand += ' ' + cmd
         logic_logger.info("On " + host + " run: <br><span style=\" font-size:5; font-weight:400; color:#101010;\" >" +
-                          fullcommand + "</span>")
-
-        # ssh full command execution
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        try:
-            ssh.connect(host, username=self.user, password=self.password, timeout=10)
-            self.auth_method = ssh.get_transport().auth_handler.auth_method
-            stdin, stdout, stderr = ssh.exec_command(fullcommand)
-            out = ''.join(stdout)
-            err = stderr.readlines()
-        except Exception as e:
-            ssh.close()
-            raise RuntimeError(e)
-        finally:
-            ssh.close()
+                          fullcommand + ' ' + cmd + "</span>")
+
+        # parse the --command=... --arg=value string the same way the remote shell does
+        request = dict()
+        for token in shlex.split(cmd):
+            key, _, value = token.partition('=')
+            request[key.lstrip('-')] = value
+        command = request.pop('command', '')
+        timeout = self.command_timeouts.get(command, self.command_timeout)
+
+        out, err = None, None
+        if self.use_rpc and host not in self.rpc_unsupported:
+            out, err = self.rpc_exec(host, fullcommand, command, request, timeout)
+
+        # ssh full command execution on a pooled connection
+        if out is None:
+            try:
+                out, err, self.auth_method = self.ssh_pool.exec_command(host, self.user, self.password,
+                                                                        fullcommand + ' ' + cmd, timeout=timeout)
+            except socket.timeout:
+                raise RuntimeError("no answer from " + host + " to " + command + " in " + str(timeout) + " s")
+            except Exception as e:
+                raise RuntimeError(e)
 
         if err:
             logic_logger.warning(err)
@@ -140,6 +193,50 @@ class RemoteConnectionManager:
 
         return out
 
+    def rpc_exec(self, host, fullcommand, command, request, timeout=None):
+        """
+        Run command with the request arguments on the rpc server of host, starting it if needed.
+        Return (None, None) when the caller has to fall back to a one shot command: the rpc server
+        is busy with another call, or it does not support --rpc ( older servers ) and the command
+        is idempotent. A server not answering in timeout seconds is an error.
+        """
+        with self.rpc_lock:
+            transport = self.rpc_transports.get(host, None)
+            if transport is not None and not transport.alive():
+                transport.close()
+                transport = None
+            if transport is None:
+                try:
+                    ssh = self.ssh_pool.get(host, self.user, self.password)
+                    transport = rcm_protocol_client.RPCTransport(ssh, fullcommand)
+                except Exception as e:
+                    logic_logger.debug("Failed to start rpc server on " + host + ": " + str(e))
+                    return None, None
+                self.rpc_transports[host] = transport
+                self.auth_method = ssh.get_transport().auth_handler.auth_method
+            if not transport.try_acquire():
+                return None, None
+
+        try:
+            return transport.call(command, request, timeout=timeout)
+        except Exception as e:
+            with self.rpc_lock:
+                if self.rpc_transports.get(host, None) is transport:
+                    del self.rpc_transports[host]
+            transport.close()
+            if isinstance(e, socket.timeout):
+                raise RuntimeError("no answer from " + host + " to " + command + " in " + str(timeout) + " s")
+            if not transport.answered:
+                # the server never answered: most likely it does not know --rpc, but a command
+                # changing the sessions may have been run anyway
+                logic_logger.debug("rpc not supported on " + host + ": " + str(e))
+                self.rpc_unsupported.add(host)
+                if command in self.idempotent_commands:
+                    return None, None
+            raise RuntimeError(e)
+        finally:
+            transport.release()
+
     def list(self):
         # Get the list of sessions for each login node of the cluster
         # and return the merge of all of them
@@ -157,13 +254,37 @@ class RemoteConnectionManager:
             state = ses.hash.get('state', 'killed')
             if nodelogin != '' and not nodelogin in nodeloginList and state != 'killed':
                 nodeloginList.append(nodelogin)
-                self.commandnode = nodelogin
-                # here we call list of rcm_protocol_server to get the sessions
-                o = self.protocol.list(subnet=self.subnet)
+
+        self.login_nodes = list(nodeloginList)
+        if not nodeloginList:
+            return merged_sessions
+
+        # here we call list of rcm_protocol_server on all the login nodes concurrently,
+        # a login node not answering in time is skipped instead of stalling the whole list
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(self.list_max_workers,
+                                                                         len(nodeloginList)))
+        futures = dict()
+        for nodelogin in nodeloginList:
+            futures[executor.submit(self.protocol.list, subnet=self.subnet, commandnode=nodelogin)] = nodelogin
+        try:
+            for future in concurrent.futures.as_completed(futures, timeout=self.list_timeout):
+                nodelogin = futures[future]
+                try:
+                    o = future.result()
+                except Exception as e:
+                    logic_logger.warning("Failed to list sessions on " + nodelogin + ": " + str(e))
+                    continue
                 if o:
                     tmp = rcm.rcm_sessions(o)
                     for sess in tmp.get_sessions():
                         merged_sessions.add_session(sess)
+        except concurrent.futures.TimeoutError:
+            for future, nodelogin in futures.items():
+                if not future.done():
+                    logic_logger.warning("Timeout listing sessions on " + nodelogin)
+        finally:
+            # the late workers end by themselves, within the list command timeout
+            executor.shutdown(wait=False)
 
         return merged_sessions
 
@@ -196,6 +317,18 @@ class RemoteConnectionManager:
         session = rcm.rcm_session(o)
         return session
 
+    def preview(self, choices):
+        """
+        Ask the server to render the job script of choices, without submitting it.
+        Return the dict with script and substitutions, or None if the server has no preview command.
+        """
+        o = self.protocol.preview(choices_string=json.dumps(choices))
+        try:
+            return json.loads(o)
+        except ValueError:
+            logic_logger.warning("Job script preview not available on " + str(self.proxynode))
+            return None
+
     def api_version(self):
         if not self._api_version:
             try:
@@ -215,9 +348,59 @@ class RemoteConnectionManager:
         if 'jobscript_json_menu' in self.server_config.config:
             logic_logger.debug("jobscript gui json: " + self.server_config.config.get('jobscript_json_menu', ''))
 
+        self.store_cached_config(self.server_config)
         return self.server_config
 
-    def submit(self, session=None, otp='', gui_cmd=None, configFile=None):
+    def refresh_api_version(self):
+        """
+        Ask the server its api version again, replacing the one loaded from the config cache
+        """
+        self._api_version = None
+        return self.api_version()
+
+    def config_cache_path(self):
+        # one cache file per (host, user, preload), local data only: the server api version is in the entry
+        key = '|'.join((self.proxynode, self.user, self.preload))
+        return os.path.join(rcm_utils.client_folder(), 'cache',
+                            'config_' + hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def cached_config(self):
+        """
+        Return the server config stored by the last get_config on this (host, user, preload), or None.
+        The server api version stored with it is used until refresh_api_version, no remote call is done
+        apart from the login, checked first so a cached config is never returned for wrong credentials.
+        """
+        self.ssh_pool.get(self.proxynode, self.user, self.password)
+        cache_path = self.config_cache_path()
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            with open(cache_path, 'r') as f:
+                entry = json.load(f)
+            server_config = rcm.rcm_config()
+            server_config.config = entry['config']
+            self.server_config = server_config
+            self._api_version = entry['api_version']
+            logic_logger.debug("config loaded from cache " + cache_path +
+                               " server api version: " + str(self._api_version))
+            return self.server_config
+        except Exception as e:
+            logic_logger.warning("Failed to load cached config " + cache_path + ": " + str(e))
+            return None
+
+    def store_cached_config(self, server_config):
+        try:
+            entry = {'api_version': self.api_version(), 'config': server_config.config}
+            cache_path = self.config_cache_path()
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path))
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            logic_logger.warning("Failed to store config cache: " + str(e))
+
+    def submit(self, session=None, otp='', gui_cmd=None, configFile=None, stats_cmd=None):
         if not session:
             return
 
@@ -231,44 +414,210 @@ class RemoteConnectionManager:
             port_number = 5900 + int(session.hash['display'])
 
         login_node = session.hash['nodelogin']
-        local_port_number = rcm_utils.get_unused_portnumber()
 
         try:
-            tunnelling_method = json.loads(parser.get('Settings', 'ssh_client'))
+            tunnelling_method = json.loads(parser.get('Settings', 'ssh_client', fallback=defaults['ssh_client']))
         except Exception:
             tunnelling_method = "internal"
+        tunnelling_method = tunnel.resolve_method(tunnelling_method)
         logic_logger.info("Using " + str(tunnelling_method) + " ssh tunnelling")
 
-        plugin_exe = plugin.TurboVNCExecutable()
-        plugin_exe.build(session=session, local_portnumber=local_port_number)
+        def acquire_tunnel(via=''):
+            # through the proxy node and the session login node, or through the login node via
+            return self.tunnel_manager.acquire(tunnelling_method,
+                                               via or self.proxynode,
+                                               via or login_node,
+                                               self.user,
+                                               self.password,
+                                               (compute_node, port_number))
+
+        # the viewer connects to the local end of the tunnel, or straight to the compute node when faster
+        session_route, session_tunnel, rtt = self.choose_route(session, compute_node, port_number, acquire_tunnel)
+        direct_address = None
+        if session_tunnel:
+            local_port_number = session_tunnel.local_port
+        else:
+            local_port_number = rcm_utils.get_unused_portnumber()
+            if session_route == 'direct':
+                direct_address = (compute_node, port_number)
+
+        try:
+            profile = self.select_vnc_profile(session, session_tunnel, login_node, rtt)
+            if stats_cmd:
+                stats_cmd({'profile': profile.get('name', '')})
+
+            plugin_exe = plugin.TurboVNCExecutable()
+            plugin_exe.build(session=session,
+                             local_portnumber=local_port_number,
+                             profile=profile,
+                             direct_address=direct_address,
+                             use_tunnel=True if session_tunnel else None)
+
+            service_session = supervisor.ServiceSession(self.supervisor,
+                                                        plugin_exe.command,
+                                                        gui_cmd,
+                                                        configFile,
+                                                        self.tunnel_manager,
+                                                        session_tunnel,
+                                                        stats_cmd)
+        except Exception:
+            if session_tunnel:
+                self.tunnel_manager.release(session_tunnel)
+            raise
+
+        self.service_sessions = [s for s in self.service_sessions if s.service]
+        self.service_sessions.append(service_session)
+        service_session.start()
+
+    def choose_route(self, session, compute_node, port_number, acquire_tunnel):
+        """
+        Return (route, tunnel, rtt): route is 'direct', 'tunnel' or 'server'.
+        acquire_tunnel(via) opens the ssh tunnel to the display through the login node via,
+        acquire_tunnel() the tunnel advised by the server.
+        A tunnel required by the server ( session tunnel_required flag ) is always used. Otherwise the
+        direct connection to compute_node:port_number and the tunnels through each known login node
+        are probed in parallel and the fastest one is used, the decision is cached per
+        (compute node network, client network).
+        If no probe succeeds the server advice ( session tunnel flag ) is followed, route 'server'
+        means the viewer connects as instructed by the server.
+        """
+        server_tunnel = session.hash.get('tunnel', 'y') == 'y'
+        if session.hash.get('tunnel_required', 'n') == 'y' or sys.platform.startswith('darwin'):
+            return 'tunnel', acquire_tunnel(), None
+
+        def follow_server():
+            return ('tunnel', acquire_tunnel(), None) if server_tunnel else ('server', None, None)
+
+        try:
+            probe_routes = json.loads(parser.get('Settings', 'route_probe', fallback=defaults['route_probe']))
+        except Exception:
+            probe_routes = True
+        if not probe_routes:
+            return follow_server()
 
-        st = thread.SessionThread(plugin_exe.command,
-                                  login_node,
-                                  self.proxynode,
-                                  self.user,
-                                  self.password,
-                                  gui_cmd,
-                                  configFile,
-                                  local_port_number,
-                                  compute_node,
-                                  port_number,
-                                  tunnelling_method)
+        key = route.route_key(compute_node, self.proxynode)
+        cached = self.route_cache.get(key)
+        logic_logger.debug("route key: " + key + " cached route: " + str(cached))
+
+        def probe_direct():
+            return vnc_profile.probe_rtt(compute_node, port_number, timeout=self.route_timeout)
+
+        def probe_tunnel(via):
+            t = acquire_tunnel(via)
+            try:
+                return t, t.probe(timeout=self.route_timeout)
+            except Exception:
+                self.tunnel_manager.release(t)
+                raise
+
+        if cached == 'direct':
+            try:
+                return 'direct', None, probe_direct()
+            except Exception as e:
+                logic_logger.info("Cached direct route to " + compute_node + " failed: " + str(e))
+                self.route_cache.set(key, None)
+        elif cached:
+            # tunnel:<login node>
+            try:
+                return 'tunnel', acquire_tunnel(cached.partition(':')[2]), None
+            except Exception as e:
+                logic_logger.info("Cached route " + cached + " to " + compute_node + " failed: " + str(e))
+                self.route_cache.set(key, None)
+
+        # the session login node first, then the other login nodes known from the sessions list
+        login_nodes = []
+        for node in [session.hash.get('nodelogin', ''), self.proxynode] + self.login_nodes:
+            if node and node not in login_nodes:
+                login_nodes.append(node)
+        login_nodes = login_nodes[:self.route_max_login_nodes]
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1 + len(login_nodes))
+        direct_future = executor.submit(probe_direct)
+        tunnel_futures = [(executor.submit(probe_tunnel, node), node) for node in login_nodes]
+        executor.shutdown(wait=True)
+
+        best = None
+        try:
+            best = ('direct', None, direct_future.result(), 'direct')
+        except Exception as e:
+            logic_logger.debug("Direct route to " + compute_node + " not available: " + str(e))
+        for future, node in tunnel_futures:
+            try:
+                tunnel, tunnel_rtt = future.result()
+            except Exception as e:
+                logic_logger.warning("Tunnelled route to " + compute_node + " via " + node +
+                                     " not available: " + str(e))
+                continue
+            if best is None or tunnel_rtt < best[2]:
+                if best and best[1]:
+                    self.tunnel_manager.release(best[1])
+                best = ('tunnel', tunnel, tunnel_rtt, 'tunnel:' + node)
+            else:
+                self.tunnel_manager.release(tunnel)
+
+        if best is None:
+            # nothing answered, follow the server
+            logic_logger.warning("Route probes to " + compute_node + " failed, following the server advice")
+            return follow_server()
+        logic_logger.info("Using " + best[3] + " route to " + compute_node)
+        self.route_cache.set(key, best[3])
+        return best[:3]
+
+    def select_vnc_profile(self, session, session_tunnel, login_node, rtt=None):
+        """
+        Measure the link to the display and pick the vnc encoding profile matching it,
+        unless a profile is forced by the vnc_profile setting.
+        The bandwidth is measured on the ssh path to the proxy node, once per (proxy node, client network)
+        for the ttl of bandwidth_cache; the rtt is measured on every connection.
+        """
+        profiles = vnc_profile.load_profiles()
+        try:
+            wanted = json.loads(parser.get('Settings', 'vnc_profile', fallback=defaults['vnc_profile']))
+        except Exception:
+            wanted = "auto"
+        for profile in profiles:
+            if wanted != "auto" and profile.get('name', '') == wanted:
+                return profile
+
+        bandwidth = None
+        try:
+            if rtt is None and session_tunnel:
+                rtt = session_tunnel.probe()
+            elif rtt is None:
+                rtt = vnc_profile.probe_rtt(login_node, 5900 + int(session.hash['display']))
+            bandwidth_key = self.proxynode + '|' + route.client_network(self.proxynode)
+            bandwidth = self.bandwidth_cache.get(bandwidth_key)
+            if bandwidth is None:
+                bandwidth = vnc_profile.probe_bandwidth(self.ssh_pool, self.proxynode, self.user, self.password)
+                self.bandwidth_cache.set(bandwidth_key, bandwidth)
+        except Exception as e:
+            logic_logger.warning("Failed to measure the link to the display: " + str(e))
+            if rtt is None:
+                return vnc_profile.fallback_profile
 
-        self.session_threads.append(st)
-        st.start()
+        profile = vnc_profile.choose_profile(profiles, rtt, bandwidth)
+        logic_logger.info("Link rtt: " + "{0:.1f} ms".format(rtt * 1000) +
+                          (" bandwidth: {0:.1f} Mbit/s".format(bandwidth * 8 / 1e6) if bandwidth else "") +
+                          ", using vnc profile " + str(profile.get('name', '')))
+        return profile
 
     def kill(self, session):
         sessionid = session.hash['sessionid']
         nodelogin = session.hash['nodelogin']
 
-        self.commandnode = nodelogin
-        self.protocol.kill(session_id=sessionid)
+        self.protocol.kill(session_id=sessionid, commandnode=nodelogin)
 
     def kill_session_thread(self):
         try:
-            if self.session_threads:
-                for thread in self.session_threads:
-                    thread.terminate()
-            self.session_threads = None
+            for service_session in self.service_sessions:
+                service_session.terminate()
+            self.service_sessions = []
         except Exception:
-            logic_logger.error('Failed to kill a session thread still alive')
+            logic_logger.error('Failed to kill a session still alive')
+        self.supervisor.close()
+        with self.rpc_lock:
+            for transport in self.rpc_transports.values():
+                transport.close()
+            self.rpc_transports = dict()
+        self.tunnel_manager.close()
+        self.ssh_pool.close()
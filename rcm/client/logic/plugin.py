@@ -21,6 +21,9 @@
 import sys
 import os
 import json
+import time
+import hashlib
+import subprocess
 import pexpect
 if sys.platform == 'win32':
     from pexpect.popen_spawn import PopenSpawn
@@ -142,11 +145,19 @@ class TurboVNCExecutable(Executable):
             logic_logger.debug("CLASSPATH: " + str(os.environ['CLASSPATH']))
         logic_logger.debug("PATH: " + str(os.environ['PATH']))
 
-    def build(self, session, local_portnumber):
+    def build(self, session, local_portnumber, profile=None, direct_address=None, use_tunnel=None):
+        """
+        profile is the vnc encoding profile ( see vnc_profile ), by default quality 80;
+        direct_address is the (host, port) of the vnc server when it is reached without tunnel;
+        use_tunnel overrides the tunnel flag of the session
+        """
+        if not profile:
+            profile = {'quality': 80}
         nodelogin = session.hash['nodelogin']
         # local_portnumber = rcm_utils.get_unused_portnumber()
 
-        tunnel = session.hash['tunnel']
+        if use_tunnel is None:
+            use_tunnel = session.hash['tunnel'] == 'y'
         try:
             tunnelling_method = json.loads(parser.get('Settings', 'ssh_client'))
         except Exception:
@@ -160,7 +171,11 @@ class TurboVNCExecutable(Executable):
 
         # Darwin
         if sys.platform.startswith('darwin'):
-            self.add_arg_value("-W", "vnc://:" + vncpassword_decrypted + "@127.0.0.1:" + str(local_portnumber))
+            if direct_address:
+                self.add_arg_value("-W", "vnc://:" + vncpassword_decrypted + "@" +
+                                   str(direct_address[0]) + ":" + str(direct_address[1]))
+            else:
+                self.add_arg_value("-W", "vnc://:" + vncpassword_decrypted + "@127.0.0.1:" + str(local_portnumber))
 
         # Win64
         elif sys.platform == 'win32':
@@ -169,16 +184,23 @@ class TurboVNCExecutable(Executable):
             self.add_default_arg("/nonewconn")
             self.add_arg_value("/loglevel", "0")
             self.add_arg_value("/password", vncpassword_decrypted)
+            for option in ('quality', 'compresslevel', 'subsampling'):
+                if option in profile:
+                    self.add_arg_value("/" + option, str(profile[option]))
 
         # Linux
         else:
-            self.add_arg_value("-quality", "80")
+            for option in ('quality', 'compresslevel', 'subsampling'):
+                if option in profile:
+                    self.add_arg_value("-" + option, str(profile[option]))
             self.add_arg_value("-password", vncpassword_decrypted)
             self.add_default_arg("-noreconnect")
             self.add_default_arg("-nonewconn")
 
         if not sys.platform.startswith('darwin'):
-            if tunnel == 'y':
+            if direct_address:
+                self.add_default_arg(str(direct_address[0]) + "::" + str(direct_address[1]))
+            elif use_tunnel:
                 self.add_default_arg("127.0.0.1:" + str(local_portnumber))
             else:
                 self.add_default_arg(nodelogin + ":" + str(session.hash['display']))
@@ -252,7 +274,9 @@ class NativeSSHTunnelForwarder(object):
                  ssh_username,
                  ssh_password,
                  remote_bind_address,
-                 local_bind_address):
+                 local_bind_address,
+                 supervisor=None,
+                 on_exit=None):
 
         ssh_exe = SSHExecutable()
         ssh_exe.build(login_node=login_node,
@@ -265,6 +289,9 @@ class NativeSSHTunnelForwarder(object):
         self.tunnel_process = None
         self.password = ssh_password
         self.thread_tunnel = None
+        # the ssh process is watched by the supervisor, if any, which reports its exit to on_exit
+        self.supervisor = supervisor
+        self.on_exit = on_exit
 
         super(NativeSSHTunnelForwarder, self).__init__()
 
@@ -279,6 +306,12 @@ class NativeSSHTunnelForwarder(object):
             if i == 0:
                 self.tunnel_process.sendline('yes')
 
+            if self.supervisor:
+                tunnel_process = self.tunnel_process
+                self.supervisor.watch(tunnel_process.proc, 'ssh tunnel',
+                                      wait=lambda: tunnel_process.expect(pexpect.EOF, timeout=None),
+                                      on_exit=self.on_exit)
+
         else:
             self.tunnel_process = pexpect.spawn(self.tunnel_command,
                                                 timeout=None)
@@ -302,11 +335,16 @@ class NativeSSHTunnelForwarder(object):
                 self.tunnel_process.sendline(self.password)
                 logic_logger.debug("sent password")
 
-            def wait():
-                self.tunnel_process.expect(pexpect.EOF)
+            if self.supervisor:
+                self.supervisor.watch(self.tunnel_process, 'ssh tunnel',
+                                      fd=self.tunnel_process.child_fd,
+                                      on_exit=self.on_exit)
+            else:
+                def wait():
+                    self.tunnel_process.expect(pexpect.EOF)
 
-            self.thread_tunnel = threading.Thread(target=wait)
-            self.thread_tunnel.start()
+                self.thread_tunnel = threading.Thread(target=wait)
+                self.thread_tunnel.start()
 
             return self
 
@@ -318,3 +356,120 @@ class NativeSSHTunnelForwarder(object):
             logic_logger.debug("Stopping ssh tunnelling")
             self.tunnel_process.close(force=True)
             self.tunnel_process = None
+
+
+_controlmaster_available = None
+
+
+def controlmaster_available():
+    """
+    Capability probe of the system ssh: True if it is OpenSSH with ControlMaster/ControlPersist support.
+    The result is computed once per process.
+    """
+    global _controlmaster_available
+    if _controlmaster_available is None:
+        _controlmaster_available = False
+        exe = rcm_utils.which('ssh')
+        if sys.platform != 'win32' and exe:
+            try:
+                # ssh -G only evaluates the configuration, it does not connect
+                returncode = subprocess.call([exe, '-G', '-o', 'ControlMaster=auto', '-o', 'ControlPersist=60',
+                                              'localhost'],
+                                             stdout=subprocess.DEVNULL,
+                                             stderr=subprocess.DEVNULL,
+                                             timeout=10)
+                _controlmaster_available = returncode == 0
+            except Exception as e:
+                logic_logger.debug("ssh ControlMaster probe failed: " + str(e))
+        logic_logger.debug("ssh ControlMaster available: " + str(_controlmaster_available))
+    return _controlmaster_available
+
+
+class SSHControlMaster(object):
+    """
+    An OpenSSH master connection to login_node, forwardings are added to and removed from it
+    with ssh -O forward / -O cancel, so the data is moved by the native ssh client.
+    The master runs in foreground, watched by the supervisor, if any: the callables in exit_listeners
+    are called when it ends. A master left on the same control path by another client is reused.
+    """
+
+    def __init__(self, login_node, ssh_username, ssh_password, supervisor=None):
+        self.login_node = login_node
+        self.ssh_username = ssh_username
+        self.password = ssh_password
+        self.supervisor = supervisor
+        self.exe = rcm_utils.which('ssh')
+        self.process = None
+        self.exit_listeners = []
+
+        key = (ssh_username + '@' + login_node).encode('utf-8')
+        control_dir = os.path.join(rcm_utils.client_folder(), 'cm')
+        if not os.path.isdir(control_dir):
+            os.makedirs(control_dir)
+            os.chmod(control_dir, 0o700)
+        # unix socket paths are limited to about 100 chars
+        self.control_path = os.path.join(control_dir, hashlib.sha1(key).hexdigest()[:16])
+
+    def _control(self, *args):
+        return [self.exe, '-S', self.control_path] + list(args) + [self.ssh_username + '@' + self.login_node]
+
+    def check(self):
+        return subprocess.call(self._control('-O', 'check'),
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL) == 0
+
+    def start(self, timeout=30):
+        if self.check():
+            return
+        self.stop()
+        # the arguments are passed as they are, the control path may contain spaces
+        args = ['-M', '-N',
+                '-o', 'ControlPath=' + self.control_path,
+                '-o', 'ServerAliveInterval=30',
+                self.ssh_username + '@' + self.login_node]
+        logic_logger.debug("ssh master cmd: " + str([self.exe] + args))
+        master = pexpect.spawn(self.exe, args=args, timeout=None)
+        i = master.expect(['continue connecting', 'password', pexpect.TIMEOUT, pexpect.EOF], timeout=10)
+        if i == 0:
+            master.sendline('yes')
+            logic_logger.debug("accepted host verification")
+            i = master.expect(['password', pexpect.TIMEOUT, pexpect.EOF], timeout=10) + 1
+        if i == 1:
+            master.sendline(self.password)
+            logic_logger.debug("sent password")
+        # the master is ready once its control socket answers
+        deadline = time.time() + timeout
+        while not self.check():
+            if not master.isalive() or time.time() > deadline:
+                master.close(force=True)
+                raise RuntimeError("Failed to start ssh master connection to " + self.login_node)
+            time.sleep(0.2)
+        self.process = master
+        if self.supervisor:
+            self.supervisor.watch(master, 'ssh master', fd=master.child_fd, on_exit=self._exited)
+
+    def _exited(self, returncode):
+        logic_logger.warning("ssh master connection to " + self.login_node + " exited with code " + str(returncode))
+        for listener in list(self.exit_listeners):
+            try:
+                listener()
+            except Exception as e:
+                logic_logger.debug("ssh master exit listener failed: " + str(e))
+
+    def stop(self):
+        if self.process:
+            logic_logger.debug("Stopping ssh master connection to " + self.login_node)
+            self.process.close(force=True)
+            self.process = None
+
+    def forward(self, remote_bind_address, local_bind_address):
+        spec = ':'.join(str(x) for x in tuple(local_bind_address) + tuple(remote_bind_address))
+        subprocess.check_call(self._control('-O', 'forward', '-L', spec),
+                              stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+
+    def cancel(self, remote_bind_address, local_bind_address):
+        spec = ':'.join(str(x) for x in tuple(local_bind_address) + tuple(remote_bind_address))
+        subprocess.call(self._control('-O', 'cancel', '-L', spec),
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL)
@@ -20,8 +20,11 @@
 
 import sys
 import os
+import json
 import types
 import inspect
+import socket
+import threading
 
 root_rcm_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(root_rcm_path)
@@ -45,11 +48,13 @@ def rcm_decorate(fn):
         This is the wrapper for functions into ssh command line, it add debug info before calling actual command
         It uses the prex function defined in manager to get return from ssh command output
         """
+        # the optional commandnode keyword selects the login node the command is run on
+        commandnode = kw.pop('commandnode', '')
         command = '--command=' + name
         for p in list(kw.keys()):
             if p in argnames:
                 command += ' --' + p + '=' + "'" + kw[p] + "'"
-        ret = args[0].decorate(command)
+        ret = args[0].decorate(command, commandnode)
         return ret
     return wrapper
 
@@ -66,5 +71,81 @@ for name, fn in inspect.getmembers(ServerAPIs):
             setattr(ServerAPIs, name, rcm_decorate(fn))
 
 
+class RPCTransport:
+    """
+    A server started with --rpc on an exec channel of an ssh connection, kept open for the whole gui session.
+    Requests and responses are json lines, see CommandParser.serve_rpc on the server side;
+    the server stderr is drained in background into the debug log.
+    Calls are serialized: the caller should use try_acquire/release and fall back to a one shot
+    command when the transport is busy.
+    """
+
+    def __init__(self, ssh, command):
+        self.lock = threading.Lock()
+        self.answered = False
+        self._next_id = 0
+        self.channel = ssh.get_transport().open_session()
+        self.channel.exec_command(command + ' --rpc')
+        self.stdin = self.channel.makefile('wb')
+        self.stdout = self.channel.makefile('rb')
+        stderr_thread = threading.Thread(target=self._drain_stderr, args=(self.channel.makefile_stderr('rb'),))
+        stderr_thread.daemon = True
+        stderr_thread.start()
+
+    @staticmethod
+    def _drain_stderr(stderr):
+        while True:
+            try:
+                line = stderr.readline()
+            except socket.timeout:
+                # the channel timeout of a call in progress
+                continue
+            except Exception:
+                break
+            if not line:
+                break
+            logic_logger.debug("rpc server: " + line.decode('utf-8', 'replace').rstrip())
+
+    def alive(self):
+        return not self.channel.closed and not self.channel.exit_status_ready()
+
+    def try_acquire(self):
+        return self.lock.acquire(False)
+
+    def release(self):
+        self.lock.release()
+
+    def call(self, command, args, timeout=None):
+        """
+        Run command with args, return (output, error lines); raise EOFError if the server went away
+        and socket.timeout if it did not answer in timeout seconds: the transport is then broken
+        """
+        self._next_id += 1
+        request = {'id': self._next_id, 'command': command, 'args': args}
+        self.channel.settimeout(timeout)
+        try:
+            self.stdin.write((json.dumps(request) + '\n').encode('utf-8'))
+            self.stdin.flush()
+            line = self.stdout.readline()
+        finally:
+            self.channel.settimeout(None)
+        if not line:
+            raise EOFError("rpc server closed the channel")
+        response = json.loads(line.decode('utf-8'))
+        if response.get('id', None) != request['id']:
+            raise EOFError("rpc response out of sequence")
+        self.answered = True
+        error = response.get('error', '')
+        return response.get('output', ''), error.splitlines(True) if error else []
+
+    def close(self):
+        try:
+            self.stdin.close()
+            self.channel.shutdown_write()
+            self.channel.close()
+        except Exception as e:
+            logic_logger.debug("closing rpc transport: " + str(e))
+
+
 def get_protocol():
     return ServerAPIs()
@@ -28,8 +28,10 @@ import hashlib
 import urllib.request
 root_rcm_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(root_rcm_path)
+sys.path.append(os.path.join(root_rcm_path, 'server'))
 
 # local includes
+import rcm
 from client.miscellaneous.logger import logic_logger
 import client.utils.pyinstaller_utils as pyinstaller_utils
 
@@ -158,7 +160,8 @@ class _pack_info:
         return {'platform': self.buildPlatformString,
                 'version': self.rcmVersion,
                 'checksum': self.checksumString,
-                'client_info': self.client_info}
+                'client_info': self.client_info,
+                'menu_encodings': [rcm.shared_menu_encoding]}
 
 
 # pack_info is a kind of singleton, this is the only instance
@@ -0,0 +1,109 @@
+#
+# Copyright (c) 2014-2019 CINECA.
+#
+# This file is part of RCM (Remote Connection Manager)
+# (see http://www.hpc.cineca.it/software/rcm).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# std lib
+import os
+import json
+import time
+import socket
+import tempfile
+import threading
+
+# local includes
+import client.logic.rcm_utils as rcm_utils
+from client.miscellaneous.logger import logic_logger
+
+
+def _network(address):
+    # the /24 network of an ipv4 address, the address itself otherwise
+    parts = address.split('.')
+    if len(parts) == 4:
+        return '.'.join(parts[:3])
+    return address
+
+
+def node_network(node):
+    try:
+        return _network(socket.gethostbyname(node))
+    except (socket.error, OSError):
+        # not resolvable from here: the domain identifies the cluster network
+        return node.split('.', 1)[-1]
+
+
+def client_network(proxynode):
+    """
+    The network of the local address used to reach the proxy node
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # connecting an udp socket sends nothing, it only selects the route
+        sock.connect((socket.gethostbyname(proxynode), 22))
+        return _network(sock.getsockname()[0])
+    except (socket.error, OSError):
+        return ''
+    finally:
+        sock.close()
+
+
+def route_key(node, proxynode):
+    return node_network(node) + '|' + client_network(proxynode)
+
+
+class RouteCache:
+    """
+    route decisions per (compute node network, client network), or other link measurements per network
+    key, stored as json, valid for ttl seconds
+    """
+
+    def __init__(self, path='', ttl=86400):
+        self.path = path or os.path.join(rcm_utils.client_folder(), 'cache', 'routes.json')
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return dict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._load().get(key, None)
+        if entry and time.time() - entry[1] < self.ttl:
+            return entry[0]
+        return None
+
+    def set(self, key, route):
+        with self._lock:
+            entries = self._load()
+            if route is None:
+                entries.pop(key, None)
+            else:
+                entries[key] = [route, time.time()]
+            try:
+                cache_dir = os.path.dirname(self.path)
+                os.makedirs(cache_dir, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.path)
+            except (IOError, OSError) as e:
+                logic_logger.warning("Failed to store route cache: " + str(e))
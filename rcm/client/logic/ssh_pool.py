@@ -0,0 +1,140 @@
+#
+# Copyright (c) 2014-2019 CINECA.
+#
+# This file is part of RCM (Remote Connection Manager)
+# (see http://www.hpc.cineca.it/software/rcm).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# std lib
+import time
+import threading
+import paramiko
+
+# local includes
+from client.miscellaneous.logger import logic_logger
+
+
+class SSHConnectionPool:
+    """
+    Keeps one authenticated ssh connection per (host, user) alive and runs every
+    command on a new exec channel of it, so that the key exchange and the authentication
+    (possibly an interactive otp) are paid only once per login node.
+    Connections idle for more than max_idle seconds or whose transport died are replaced,
+    pinned connections ( carrying ssh tunnels ) are never considered idle.
+    """
+
+    def __init__(self, keepalive=30, max_idle=600, connect_timeout=10):
+        self.keepalive = keepalive
+        self.max_idle = max_idle
+        self.connect_timeout = connect_timeout
+        self._lock = threading.Lock()
+        self._key_locks = dict()
+        self._connections = dict()
+        self._pins = dict()
+
+    def _connect(self, host, user, password):
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            ssh.connect(host, username=user, password=password, timeout=self.connect_timeout)
+        except Exception:
+            ssh.close()
+            raise
+        ssh.get_transport().set_keepalive(self.keepalive)
+        logic_logger.debug("Opened pooled ssh connection to " + user + "@" + host)
+        return ssh
+
+    def _evict(self, key):
+        entry = self._connections.pop(key, None)
+        if entry:
+            logic_logger.debug("Closing pooled ssh connection to " + key[1] + "@" + key[0])
+            entry[0].close()
+
+    def _key_lock(self, key):
+        # connections to different hosts are opened concurrently, same host ones are serialized
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, host, user, password):
+        """
+        Return an active SSHClient for (host, user), connecting if needed
+        """
+        key = (host, user)
+        with self._key_lock(key):
+            entry = self._connections.get(key, None)
+            if entry:
+                ssh, last_used = entry
+                transport = ssh.get_transport()
+                idle = time.time() - last_used > self.max_idle and not self._pins.get(key, 0)
+                if transport is None or not transport.is_active() or idle:
+                    self._evict(key)
+                    entry = None
+            if not entry:
+                ssh = self._connect(host, user, password)
+            self._connections[key] = (ssh, time.time())
+            return ssh
+
+    def reset(self, host, user):
+        """
+        Drop the connection to (host, user), the next get opens a new one
+        """
+        key = (host, user)
+        with self._key_lock(key):
+            self._evict(key)
+
+    def pin(self, host, user):
+        key = (host, user)
+        with self._key_lock(key):
+            self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, host, user):
+        key = (host, user)
+        with self._key_lock(key):
+            self._pins[key] = max(0, self._pins.get(key, 0) - 1)
+            if key in self._connections:
+                self._connections[key] = (self._connections[key][0], time.time())
+
+    def exec_command(self, host, user, password, command, timeout=None):
+        """
+        Run command on host. If the pooled connection turns out to be broken when opening
+        the channel, the command is retried once on a fresh connection: nothing has been run yet,
+        so non idempotent commands are never executed twice.
+        Reading the output raises socket.timeout if nothing arrives for timeout seconds.
+        Returns (stdout string, stderr lines, auth method)
+        """
+        for attempt in range(2):
+            ssh = self.get(host, user, password)
+            try:
+                stdin, stdout, stderr = ssh.exec_command(command, timeout=timeout)
+                break
+            except (paramiko.SSHException, EOFError, OSError) as e:
+                logic_logger.debug("Pooled ssh connection to " + host + " failed: " + str(e))
+                with self._key_lock((host, user)):
+                    self._evict((host, user))
+                if attempt:
+                    raise
+        try:
+            out = ''.join(stdout)
+            err = stderr.readlines()
+        except Exception:
+            stdout.channel.close()
+            raise
+        return out, err, ssh.get_transport().auth_handler.auth_method
+
+    def close(self):
+        for key in list(self._connections.keys()):
+            with self._key_lock(key):
+                self._evict(key)
@@ -0,0 +1,347 @@
+#
+# Copyright (c) 2014-2019 CINECA.
+#
+# This file is part of RCM (Remote Connection Manager)
+# (see http://www.hpc.cineca.it/software/rcm).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# std lib
+import os
+import sys
+import time
+import shlex
+import socket
+import selectors
+import threading
+import subprocess
+import collections
+import traceback
+
+# local includes
+from client.miscellaneous.logger import logic_logger
+
+
+class WatchedProcess(object):
+    """
+    A process spawned by the supervisor, with the last lines of its output
+    """
+
+    def __init__(self, process, name, on_output=None, on_exit=None, output_lines=200):
+        self.process = process
+        self.name = name
+        self.on_output = on_output
+        self.on_exit = on_exit
+        self.output = collections.deque(maxlen=output_lines)
+        self._partial = b''
+
+    def feed(self, data):
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines.pop()
+        # a process never printing a newline can not grow the buffer without limits
+        if len(self._partial) > 4096:
+            lines.append(self._partial)
+            self._partial = b''
+        for line in lines:
+            self._line(line)
+
+    def flush(self):
+        if self._partial:
+            self._line(self._partial)
+            self._partial = b''
+
+    def _line(self, line):
+        line = line.decode('utf-8', 'replace').rstrip()
+        if not line:
+            return
+        self.output.append(line)
+        logic_logger.debug(self.name + " stdout: " + line)
+        if self.on_output:
+            self.on_output(line)
+
+    def poll(self):
+        """
+        Exit code of the process, None while it runs. Processes spawned by pexpect are polled through isalive
+        """
+        if hasattr(self.process, 'poll'):
+            return self.process.poll()
+        try:
+            if self.process.isalive():
+                return None
+        except Exception:
+            # already reaped by its owner
+            return -1
+        if self.process.exitstatus is not None:
+            return self.process.exitstatus
+        return -(self.process.signalstatus or 1)
+
+    def terminate(self):
+        if self.poll() is None:
+            logic_logger.debug("Killing " + self.name + " process " + str(self.process.pid))
+            self.process.terminate()
+
+
+class ProcessSupervisor(object):
+    """
+    Runs the client side processes ( vnc viewers ) and watches all of them from a single thread:
+    their output pipes are multiplexed on a selector, exits are reported through the on_exit callback.
+    The ssh processes of the tunnels, spawned by pexpect to answer the password prompt, are watched
+    in the same way through their pseudo terminal.
+    On windows, where pipes can not be selected, each process output is read by its own thread.
+    """
+
+    output_lines = 200
+    poll_interval = 1.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._selector = None
+        self._thread = None
+        self._exiting = []
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+
+    def _start(self):
+        # the supervisor thread is started with the first process
+        if self._thread is None:
+            self._selector = selectors.DefaultSelector()
+            self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+            self._thread = threading.Thread(target=self._loop, name='rcm-supervisor')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_w.send(b'\0')
+        except (socket.error, OSError):
+            pass
+
+    def spawn(self, args, name='service', on_output=None, on_exit=None):
+        process = subprocess.Popen(args,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT,
+                                   stdin=subprocess.DEVNULL,
+                                   shell=False)
+        watched = WatchedProcess(process, name, on_output, on_exit, self.output_lines)
+
+        if sys.platform == 'win32':
+            t = threading.Thread(target=self._read_blocking, args=(watched,))
+            t.daemon = True
+            t.start()
+            return watched
+
+        self._register(process.stdout, watched)
+        return watched
+
+    def watch(self, process, name, fd=None, wait=None, on_output=None, on_exit=None):
+        """
+        Watch a process started elsewhere: its output is read from a copy of the file descriptor fd.
+        Without fd, the blocking wait is run in its own thread and must return when the process ends.
+        """
+        watched = WatchedProcess(process, name, on_output, on_exit, self.output_lines)
+        if fd is None:
+            t = threading.Thread(target=self._wait_blocking, args=(watched, wait))
+            t.daemon = True
+            t.start()
+            return watched
+
+        # the owner of fd keeps using and closes its own copy
+        self._register(os.dup(fd), watched)
+        return watched
+
+    def _register(self, fileobj, watched):
+        fd = fileobj if isinstance(fileobj, int) else fileobj.fileno()
+        os.set_blocking(fd, False)
+        with self._lock:
+            self._start()
+            self._selector.register(fileobj, selectors.EVENT_READ, watched)
+        self._wakeup()
+
+    def _read_blocking(self, watched):
+        for data in iter(lambda: watched.process.stdout.read1(4096), b''):
+            watched.feed(data)
+        watched.flush()
+        self._exited(watched, watched.process.wait())
+
+    def _wait_blocking(self, watched, wait):
+        try:
+            wait()
+        except Exception as e:
+            logic_logger.debug("Waiting for " + watched.name + " failed: " + str(e))
+        self._exited(watched, watched.process.wait())
+
+    def _exited(self, watched, returncode):
+        logic_logger.debug(watched.name + " process " + str(watched.process.pid) +
+                           " exited with code " + str(returncode))
+        if watched.on_exit:
+            try:
+                watched.on_exit(returncode)
+            except Exception as e:
+                logic_logger.error("Error handling exit of " + watched.name + ": " + str(e) +
+                                   " ---- " + str(traceback.format_exc()))
+
+    def _loop(self):
+        while True:
+            events = self._selector.select(self.poll_interval if self._exiting else None)
+            for key, mask in events:
+                if key.data is None:
+                    try:
+                        while self._wakeup_r.recv(512):
+                            pass
+                    except (socket.error, OSError):
+                        pass
+                    continue
+                watched = key.data
+                try:
+                    data = os.read(key.fd, 65536)
+                except (IOError, OSError):
+                    data = b''
+                if data:
+                    watched.feed(data)
+                    continue
+                # end of output, the process is (about to be) gone
+                watched.flush()
+                with self._lock:
+                    self._selector.unregister(key.fileobj)
+                if isinstance(key.fileobj, int):
+                    os.close(key.fileobj)
+                else:
+                    key.fileobj.close()
+                self._exiting.append(watched)
+
+            # reap the processes whose output is closed
+            for watched in list(self._exiting):
+                returncode = watched.poll()
+                if returncode is not None:
+                    self._exiting.remove(watched)
+                    self._exited(watched, returncode)
+
+    def close(self):
+        # the supervisor thread is a daemon, it stays around to reap the terminated processes
+        with self._lock:
+            if self._selector:
+                for key in list(self._selector.get_map().values()):
+                    if key.data is not None:
+                        key.data.terminate()
+
+
+class ServiceSession(object):
+    """
+    A service ( the vnc viewer ) connected to a display, with the ssh tunnel it uses.
+    The tunnel is owned by the TunnelManager: it is released when the service ends.
+    The viewer runs without reconnection: if it exits because its tunnel dropped, and the tunnel works
+    again once checked, the viewer is launched again on the same local port ( at most max_restarts times ).
+    """
+
+    # seconds between the tunnel drop and the viewer exit for the exit to be caused by the drop
+    reconnect_window = 10.0
+    max_restarts = 5
+
+    def __init__(self,
+                 supervisor,
+                 service_cmd='',
+                 gui_cmd=None,
+                 configFile='',
+                 tunnel_manager=None,
+                 tunnel=None,
+                 stats_cmd=None
+                 ):
+        self.supervisor = supervisor
+        self.tunnel_manager = tunnel_manager
+        self.tunnel = tunnel
+        self.stats_cmd = stats_cmd
+        self._lock = threading.Lock()
+
+        self.service_command = service_cmd
+        self.service = None
+        self.started = 0.0
+        self.restarts = 0
+
+        self.gui_cmd = gui_cmd
+        self.configFile = configFile
+
+    def commandlist(self):
+        if self.configFile:
+            commandlist = self.service_command.split()
+            commandlist.append(self.configFile)
+        else:
+            commandlist = shlex.split(self.service_command)
+        return commandlist
+
+    def start(self):
+        if self.gui_cmd:
+            self.gui_cmd(active=True)
+        if self.tunnel and self.stats_cmd:
+            self.tunnel.listeners.append(self.stats_cmd)
+        try:
+            self.started = time.time()
+            self.service = self.supervisor.spawn(self.commandlist(), name='service', on_exit=self.on_exit)
+        except Exception as e:
+            self.terminate()
+            logic_logger.error("Error running service command\n-->" +
+                               self.service_command +
+                               "<--\n Error:" + str(e) + " ---- " + str(traceback.format_exc()))
+
+    def on_exit(self, returncode):
+        if not self.restart():
+            self.terminate()
+
+    def restart(self):
+        """
+        Launch the viewer again if it exited because its tunnel dropped, return False otherwise
+        """
+        tunnel = self.tunnel
+        if tunnel is None or self.service is None or self.tunnel_manager is None:
+            return False
+        if self.restarts >= self.max_restarts:
+            return False
+        # the drop may still be undetected ( ssh process died ): the probe marks it, then the tunnel is rebuilt
+        self.tunnel_manager.check(tunnel)
+        if tunnel.last_drop < self.started or time.time() - tunnel.last_drop > self.reconnect_window:
+            return False
+        if not tunnel.stats['healthy']:
+            return False
+        with self._lock:
+            if self.service is None:
+                # terminated meanwhile
+                return True
+            logic_logger.warning("Tunnel on port " + str(tunnel.local_port) + " dropped, restarting the viewer")
+            self.restarts += 1
+            self.started = time.time()
+            try:
+                self.service = self.supervisor.spawn(self.commandlist(), name='service', on_exit=self.on_exit)
+            except Exception as e:
+                logic_logger.error("Error restarting service command: " + str(e))
+                return False
+        return True
+
+    def terminate(self):
+        with self._lock:
+            service, self.service = self.service, None
+            tunnel, self.tunnel = self.tunnel, None
+            gui_cmd, self.gui_cmd = self.gui_cmd, None
+
+        if service:
+            service.terminate()
+
+        # release the tunnelling, it is closed when no other display uses it
+        if tunnel:
+            if self.stats_cmd in tunnel.listeners:
+                tunnel.listeners.remove(self.stats_cmd)
+            if self.tunnel_manager:
+                self.tunnel_manager.release(tunnel)
+
+        if gui_cmd:
+            gui_cmd(active=False)
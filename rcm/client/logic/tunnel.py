@@ -0,0 +1,388 @@
+#
+# Copyright (c) 2014-2019 CINECA.
+#
+# This file is part of RCM (Remote Connection Manager)
+# (see http://www.hpc.cineca.it/software/rcm).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# std lib
+import time
+import socket
+import select
+import threading
+import paramiko
+
+# local includes
+import client.logic.rcm_utils as rcm_utils
+from client.logic.plugin import NativeSSHTunnelForwarder, SSHControlMaster, controlmaster_available
+from client.miscellaneous.logger import logic_logger
+
+
+class Tunnel(object):
+    """
+    Base of the tunnels: reference count, health probe and traffic statistics.
+    Listeners are called with the stats dict after every probe.
+    last_drop is the time the tunnel was last found broken: the connections through it were lost.
+    """
+
+    def __init__(self):
+        self.local_port = 0
+        self.refcount = 0
+        self.listeners = []
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.stats = {'healthy': True, 'rtt': None, 'throughput_in': None, 'throughput_out': None}
+        self._last_sample = None
+        self.last_drop = 0.0
+
+    def dropped(self):
+        self.last_drop = time.time()
+
+    def probe(self, timeout=5.0):
+        """
+        Return the seconds needed to connect through the tunnel and receive the first bytes
+        ( the RFB banner ) from the remote service. Raise if the tunnel or the service is not working.
+        """
+        start = time.time()
+        sock = socket.create_connection(('127.0.0.1', self.local_port), timeout=timeout)
+        try:
+            if not sock.recv(16):
+                raise IOError("connection closed by the remote end")
+        finally:
+            sock.close()
+        return time.time() - start
+
+    def rebuild(self):
+        raise NotImplementedError()
+
+    def sample(self, healthy, rtt=None):
+        now = time.time()
+        if self._last_sample and self.bytes_in is not None:
+            last_time, last_in, last_out = self._last_sample
+            elapsed = max(now - last_time, 1e-6)
+            self.stats['throughput_in'] = (self.bytes_in - last_in) / elapsed
+            self.stats['throughput_out'] = (self.bytes_out - last_out) / elapsed
+        self._last_sample = (now, self.bytes_in, self.bytes_out)
+        self.stats['healthy'] = healthy
+        self.stats['rtt'] = rtt
+        for listener in list(self.listeners):
+            try:
+                listener(dict(self.stats))
+            except Exception as e:
+                logic_logger.debug("tunnel stats listener failed: " + str(e))
+
+
+class ForwardedTunnel(Tunnel):
+    """
+    Local port forwarded to remote_address through direct-tcpip channels of a pooled ssh connection:
+    every accepted local connection gets its own channel on the same authenticated transport.
+    """
+
+    buffer_size = 32768
+
+    def __init__(self, ssh_pool, host, user, password, remote_address, local_port=0):
+        super(ForwardedTunnel, self).__init__()
+        self.ssh_pool = ssh_pool
+        self.host = host
+        self.user = user
+        self.password = password
+        self.remote_address = remote_address
+        self._closed = False
+        self._connections = set()
+        self._lock = threading.Lock()
+
+        # open the ssh connection first, so that authentication errors are raised here
+        self.ssh_pool.get(host, user, password)
+        self.ssh_pool.pin(host, user)
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self.server.bind(('127.0.0.1', local_port))
+            self.server.listen(16)
+        except Exception:
+            self.server.close()
+            self.ssh_pool.unpin(host, user)
+            raise
+        self.server.settimeout(0.5)
+        self.local_port = self.server.getsockname()[1]
+
+        self._accept_thread = threading.Thread(target=self._accept_loop)
+        self._accept_thread.daemon = True
+        self._accept_thread.start()
+        logic_logger.debug("Forwarding 127.0.0.1:" + str(self.local_port) + " to " +
+                           str(remote_address[0]) + ":" + str(remote_address[1]) + " via " + host)
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn, peer = self.server.accept()
+            except socket.timeout:
+                continue
+            except (socket.error, OSError):
+                break
+            try:
+                transport = self.ssh_pool.get(self.host, self.user, self.password).get_transport()
+                chan = transport.open_channel('direct-tcpip', self.remote_address, peer)
+            except Exception as e:
+                logic_logger.error("Failed to open forwarded channel to " + str(self.remote_address) + ": " + str(e))
+                conn.close()
+                continue
+            with self._lock:
+                self._connections.add((conn, chan))
+            t = threading.Thread(target=self._pump, args=(conn, chan))
+            t.daemon = True
+            t.start()
+
+    def _pump(self, conn, chan):
+        try:
+            while True:
+                readable = select.select([conn, chan], [], [])[0]
+                if conn in readable:
+                    data = conn.recv(self.buffer_size)
+                    if not data:
+                        break
+                    chan.sendall(data)
+                    self.bytes_out += len(data)
+                if chan in readable:
+                    data = chan.recv(self.buffer_size)
+                    if not data:
+                        break
+                    conn.sendall(data)
+                    self.bytes_in += len(data)
+        except Exception as e:
+            if not self._closed:
+                logic_logger.debug("forwarded connection on port " + str(self.local_port) + " closed: " + str(e))
+        finally:
+            transport = chan.get_transport()
+            if not self._closed and (transport is None or not transport.is_active()):
+                self.dropped()
+            with self._lock:
+                self._connections.discard((conn, chan))
+            chan.close()
+            conn.close()
+
+    def rebuild(self, timeout=5.0):
+        """
+        Replace the ssh connection if no channel to remote_address can be opened on it, also when its
+        transport still looks active ( hung network ). The local port is kept: the next connections
+        get their channels on the new ssh connection.
+        A remote end refusing the channel is not an ssh problem, it is raised.
+        """
+        transport = self.ssh_pool.get(self.host, self.user, self.password).get_transport()
+        try:
+            chan = transport.open_channel('direct-tcpip', self.remote_address, ('127.0.0.1', 0), timeout=timeout)
+            chan.close()
+            return
+        except paramiko.ChannelException:
+            raise
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            logic_logger.warning("Rebuilding ssh connection of tunnel on port " + str(self.local_port) + ": " + str(e))
+        self.ssh_pool.reset(self.host, self.user)
+        self.ssh_pool.get(self.host, self.user, self.password)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.server.close()
+        with self._lock:
+            connections = list(self._connections)
+        for conn, chan in connections:
+            chan.close()
+            conn.close()
+        self.ssh_pool.unpin(self.host, self.user)
+        logic_logger.debug("Closed forwarding of 127.0.0.1:" + str(self.local_port))
+
+
+class ExternalTunnel(Tunnel):
+    """
+    Local port forwarded by an external ssh -N -L process, its traffic is not accounted
+    """
+
+    def __init__(self, login_node, user, password, remote_address, local_port=0, supervisor=None):
+        super(ExternalTunnel, self).__init__()
+        self.supervisor = supervisor
+        self.login_node = login_node
+        self.user = user
+        self.password = password
+        self.remote_address = remote_address
+        self.local_port = local_port or rcm_utils.get_unused_portnumber()
+        self.bytes_in = self.bytes_out = None
+        self.forwarder = None
+        self._start()
+
+    def _start(self):
+        self.forwarder = NativeSSHTunnelForwarder(login_node=self.login_node,
+                                                  ssh_username=self.user,
+                                                  ssh_password=self.password,
+                                                  remote_bind_address=self.remote_address,
+                                                  local_bind_address=('127.0.0.1', self.local_port),
+                                                  supervisor=self.supervisor,
+                                                  on_exit=self._exited)
+        self.forwarder.__enter__()
+
+    def _exited(self, returncode):
+        # the forwarded connections are gone with the ssh process
+        logic_logger.debug("ssh tunnel process on port " + str(self.local_port) +
+                           " exited with code " + str(returncode))
+        self.dropped()
+
+    def rebuild(self):
+        logic_logger.warning("Restarting ssh tunnel process on port " + str(self.local_port))
+        self.forwarder.stop()
+        self._start()
+
+    def close(self):
+        self.forwarder.stop()
+
+
+class ControlMasterTunnel(Tunnel):
+    """
+    Local port forwarded by an OpenSSH master connection shared by all the tunnels to the same login node,
+    its traffic is not accounted
+    """
+
+    def __init__(self, master, remote_address, local_port=0):
+        super(ControlMasterTunnel, self).__init__()
+        self.master = master
+        self.remote_address = remote_address
+        self.local_port = local_port or rcm_utils.get_unused_portnumber()
+        self.bytes_in = self.bytes_out = None
+        self.master.start()
+        self.master.forward(self.remote_address, ('127.0.0.1', self.local_port))
+        self.master.exit_listeners.append(self.dropped)
+
+    def rebuild(self):
+        if self.master.check():
+            return
+        logic_logger.warning("Restarting ssh master connection of tunnel on port " + str(self.local_port))
+        self.master.start()
+        self.master.forward(self.remote_address, ('127.0.0.1', self.local_port))
+
+    def close(self):
+        if self.dropped in self.master.exit_listeners:
+            self.master.exit_listeners.remove(self.dropped)
+        self.master.cancel(self.remote_address, ('127.0.0.1', self.local_port))
+
+
+def resolve_method(method):
+    """
+    Map the auto tunnelling method to the best one available on this client
+    """
+    if method == 'auto':
+        return 'controlmaster' if controlmaster_available() else 'internal'
+    return method
+
+
+class TunnelManager(object):
+    """
+    Owns all the ssh tunnels of the client.
+    Tunnels are shared by displays on the same remote endpoint and reference counted:
+    acquire returns an open tunnel, release closes it when the last display using it goes away.
+    Every probe_interval seconds each tunnel is probed end to end, a failing tunnel is rebuilt
+    on the same local port.
+    """
+
+    def __init__(self, ssh_pool, probe_interval=30, probe_timeout=5.0, supervisor=None):
+        self.ssh_pool = ssh_pool
+        # watches the ssh processes of the external and controlmaster tunnels
+        self.supervisor = supervisor
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self._tunnels = dict()
+        self._masters = dict()
+        self._lock = threading.Lock()
+        self._monitor = None
+        self._stop = threading.Event()
+
+    def _start_monitor(self):
+        if self._monitor is None and self.probe_interval > 0:
+            self._stop.clear()
+            self._monitor = threading.Thread(target=self._monitor_loop, name='rcm-tunnel-monitor')
+            self._monitor.daemon = True
+            self._monitor.start()
+
+    def _monitor_loop(self):
+        while not self._stop.wait(self.probe_interval):
+            with self._lock:
+                tunnels = list(self._tunnels.values())
+            for tunnel in tunnels:
+                self.check(tunnel)
+
+    def check(self, tunnel):
+        try:
+            tunnel.sample(True, tunnel.probe(self.probe_timeout))
+            return
+        except Exception as e:
+            logic_logger.warning("Probe of tunnel on port " + str(tunnel.local_port) + " failed: " + str(e))
+            tunnel.dropped()
+        try:
+            tunnel.rebuild()
+            tunnel.sample(True, tunnel.probe(self.probe_timeout))
+        except Exception as e:
+            logic_logger.error("Tunnel on port " + str(tunnel.local_port) + " is not working: " + str(e))
+            tunnel.sample(False)
+
+    def acquire(self, method, host, login_node, user, password, remote_address):
+        method = resolve_method(method)
+        key = (method, host if method == 'internal' else login_node, user, tuple(remote_address))
+        with self._lock:
+            tunnel = self._tunnels.get(key, None)
+            if tunnel is None:
+                if method == 'internal':
+                    tunnel = ForwardedTunnel(self.ssh_pool, host, user, password, tuple(remote_address))
+                elif method == 'external':
+                    tunnel = ExternalTunnel(login_node, user, password, tuple(remote_address),
+                                            supervisor=self.supervisor)
+                elif method == 'controlmaster':
+                    master = self._masters.get((login_node, user), None)
+                    if master is None:
+                        master = SSHControlMaster(login_node, user, password, supervisor=self.supervisor)
+                        self._masters[(login_node, user)] = master
+                    tunnel = ControlMasterTunnel(master, tuple(remote_address))
+                else:
+                    raise ValueError(str(method) + " is not a valid tunnelling method")
+                tunnel.key = key
+                self._tunnels[key] = tunnel
+                self._start_monitor()
+            tunnel.refcount += 1
+            return tunnel
+
+    def release(self, tunnel):
+        with self._lock:
+            tunnel.refcount -= 1
+            if tunnel.refcount > 0:
+                return
+            if self._tunnels.get(tunnel.key, None) is tunnel:
+                del self._tunnels[tunnel.key]
+        tunnel.close()
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            tunnels = list(self._tunnels.values())
+            self._tunnels = dict()
+            masters = list(self._masters.values())
+            self._masters = dict()
+            self._monitor = None
+        for tunnel in tunnels:
+            try:
+                tunnel.close()
+            except Exception as e:
+                logic_logger.warning("Failed to close tunnel: " + str(e))
+        for master in masters:
+            master.stop()
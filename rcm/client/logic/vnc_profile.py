@@ -0,0 +1,108 @@
+#
+# Copyright (c) 2014-2019 CINECA.
+#
+# This file is part of RCM (Remote Connection Manager)
+# (see http://www.hpc.cineca.it/software/rcm).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# std lib
+import json
+import time
+import socket
+
+# local includes
+from client.miscellaneous.logger import logic_logger
+from client.miscellaneous.config_parser import parser, defaults
+
+# TurboVNC encoding profiles, the first one whose limits are met by the link is used.
+# max_rtt is in milliseconds, min_bandwidth in Mbit/s, a missing limit always matches.
+# The table can be replaced by the vnc_profiles entry of the Settings section.
+default_profiles = [
+    {"name": "LAN", "max_rtt": 5, "min_bandwidth": 100, "quality": 95, "compresslevel": 1, "subsampling": "1X"},
+    {"name": "Broadband", "max_rtt": 40, "min_bandwidth": 20, "quality": 80, "compresslevel": 1, "subsampling": "2X"},
+    {"name": "WAN", "max_rtt": 150, "min_bandwidth": 5, "quality": 60, "compresslevel": 2, "subsampling": "4X"},
+    {"name": "Low bandwidth", "quality": 30, "compresslevel": 2, "subsampling": "4X"},
+]
+
+# used when the link can not be measured, it matches the historical viewer options
+fallback_profile = {"name": "Default", "quality": 80}
+
+
+def load_profiles():
+    try:
+        profiles = json.loads(parser.get('Settings', 'vnc_profiles', fallback=defaults['vnc_profiles']))
+        if profiles:
+            return profiles
+    except Exception as e:
+        logic_logger.warning("Invalid vnc_profiles setting: " + str(e))
+    return default_profiles
+
+
+def choose_profile(profiles, rtt, bandwidth):
+    """
+    rtt in seconds, bandwidth in bytes/s, both may be None if not measured
+    """
+    for profile in profiles:
+        max_rtt = profile.get('max_rtt', None)
+        min_bandwidth = profile.get('min_bandwidth', None)
+        if max_rtt is not None and (rtt is None or rtt * 1000 > max_rtt):
+            continue
+        if min_bandwidth is not None and (bandwidth is None or bandwidth * 8 / 1e6 < min_bandwidth):
+            continue
+        return profile
+    return profiles[-1]
+
+
+def probe_rtt(host, port, timeout=5.0):
+    """
+    Seconds to connect to host:port and receive the RFB banner of the vnc server
+    """
+    start = time.time()
+    sock = socket.create_connection((host, port), timeout=timeout)
+    try:
+        if not sock.recv(16):
+            raise IOError("connection closed by the remote end")
+    finally:
+        sock.close()
+    return time.time() - start
+
+
+def probe_bandwidth(ssh_pool, host, user, password, duration=0.5, limit=64 << 20, timeout=5.0):
+    """
+    Bytes/s of the ssh path to host: a remote command streams up to limit bytes, the client counts
+    what arrives in duration seconds from the first received chunk ( command start excluded ),
+    then closes the channel.
+    """
+    ssh = ssh_pool.get(host, user, password)
+    stdin, stdout, stderr = ssh.exec_command('head -c ' + str(limit) + ' /dev/zero')
+    channel = stdout.channel
+    try:
+        channel.settimeout(timeout)
+        if not channel.recv(1 << 16):
+            raise IOError("no data measuring bandwidth")
+        received = 0
+        start = time.time()
+        while time.time() - start < duration:
+            data = channel.recv(1 << 16)
+            if not data:
+                break
+            received += len(data)
+        elapsed = time.time() - start
+    finally:
+        channel.close()
+    if not received:
+        raise IOError("short read measuring bandwidth")
+    return received / max(elapsed, 1e-3)
@@ -29,6 +29,11 @@ parser = RawConfigParser()
 defaults = {
     'debug_log_level' : "false",
     'ssh_client' : '"internal"',
+    'rpc_transport' : "true",
+    'tunnel_probe_interval' : "30",
+    'route_probe' : "true",
+    'vnc_profile' : '"auto"',
+    'vnc_profiles' : "[]",
     'preload_command' : '"module load rcm; python $RCM_HOME/bin/server/rcm_new_server.py"'
 }
 
@@ -0,0 +1,196 @@
+#
+# Copyright (c) 2014-2019 CINECA.
+#
+# This file is part of RCM (Remote Connection Manager)
+# (see http://www.hpc.cineca.it/software/rcm).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Tunnel throughput and latency benchmark.
+# An echo server and a sink server are reached through a tunnel via ssh to --host with every tunnelling method.
+# The direct connection is measured too, as a baseline.
+# By default the servers are started on this machine and forwarded to as 127.0.0.1 from --host,
+# so --host has to be this machine ( default localhost, sshd has to run here ).
+# To benchmark a remote host, start the servers there and pass their addresses, as seen from --host:
+#
+# python benchmark_tunnel.py --user $USER [--host localhost] [--methods internal,external,controlmaster]
+# remote> python benchmark_tunnel.py --serve [--bind 127.0.0.1]
+# python benchmark_tunnel.py --host remote --echo 127.0.0.1:ECHO_PORT --sink 127.0.0.1:SINK_PORT
+
+import argparse
+import getpass
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+# add python path
+rcm_root_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(rcm_root_path)
+
+# local import
+from client.logic.ssh_pool import SSHConnectionPool
+from client.logic.supervisor import ProcessSupervisor
+from client.logic.tunnel import TunnelManager, resolve_method
+
+
+def serve(handler, bind='127.0.0.1'):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((bind, 0))
+    server.listen(8)
+
+    def accept_loop():
+        while True:
+            conn, _ = server.accept()
+            t = threading.Thread(target=handler, args=(conn,))
+            t.daemon = True
+            t.start()
+
+    t = threading.Thread(target=accept_loop)
+    t.daemon = True
+    t.start()
+    return server.getsockname()[1]
+
+
+def echo_handler(conn):
+    with conn:
+        for data in iter(lambda: conn.recv(65536), b''):
+            conn.sendall(data)
+
+
+def sink_handler(conn):
+    # the first 8 bytes are the amount of data that follows, the sink answers when it got all of it
+    with conn:
+        header = b''
+        while len(header) < 8:
+            header += conn.recv(8 - len(header))
+        expected = struct.unpack('!Q', header)[0]
+        received = 0
+        while received < expected:
+            data = conn.recv(1 << 20)
+            if not data:
+                return
+            received += len(data)
+        conn.sendall(b'k')
+
+
+def address(value):
+    host, port = value.rsplit(':', 1)
+    return host, int(port)
+
+
+def connect(target, retries=50):
+    # forwardings set up by external ssh processes need some time to start listening
+    for i in range(retries):
+        try:
+            return socket.create_connection(target, timeout=30)
+        except (socket.error, OSError):
+            if i == retries - 1:
+                raise
+            time.sleep(0.1)
+
+
+def measure_latency(target, rounds, size=64):
+    sock = connect(target)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    payload = b'x' * size
+    samples = []
+    with sock:
+        for i in range(rounds):
+            start = time.perf_counter()
+            sock.sendall(payload)
+            received = 0
+            while received < size:
+                received += len(sock.recv(size - received))
+            samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.95)]
+
+
+def measure_throughput(target, megabytes):
+    total = megabytes << 20
+    chunk = b'x' * (1 << 20)
+    sock = connect(target)
+    with sock:
+        start = time.perf_counter()
+        sock.sendall(struct.pack('!Q', total))
+        for i in range(megabytes):
+            sock.sendall(chunk)
+        sock.recv(1)
+        elapsed = time.perf_counter() - start
+    return megabytes / elapsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='ssh tunnel throughput and latency benchmark')
+    arg_parser.add_argument('--host', default='localhost')
+    arg_parser.add_argument('--user', default=getpass.getuser())
+    arg_parser.add_argument('--password', default=None)
+    arg_parser.add_argument('--methods', default='internal,external,controlmaster')
+    arg_parser.add_argument('--rounds', type=int, default=1000)
+    arg_parser.add_argument('--megabytes', type=int, default=256)
+    arg_parser.add_argument('--echo', type=address, default=None,
+                            help='HOST:PORT of an echo server started with --serve, as seen from --host')
+    arg_parser.add_argument('--sink', type=address, default=None,
+                            help='HOST:PORT of a sink server started with --serve, as seen from --host')
+    arg_parser.add_argument('--serve', action='store_true', help='only run the echo and sink servers')
+    arg_parser.add_argument('--bind', default='127.0.0.1', help='address the servers listen on, with --serve')
+    args = arg_parser.parse_args()
+
+    if args.serve:
+        print("echo {0}:{1}".format(args.bind, serve(echo_handler, args.bind)))
+        print("sink {0}:{1}".format(args.bind, serve(sink_handler, args.bind)))
+        while True:
+            time.sleep(3600)
+
+    echo = args.echo or ('127.0.0.1', serve(echo_handler))
+    sink = args.sink or ('127.0.0.1', serve(sink_handler))
+
+    ssh_pool = SSHConnectionPool()
+    supervisor = ProcessSupervisor()
+    # the benchmark servers do not send a banner, so the tunnel monitor is disabled
+    tunnel_manager = TunnelManager(ssh_pool, probe_interval=0, supervisor=supervisor)
+
+    print("{0:<14} {1:>12} {2:>12} {3:>12}".format('method', 'median ms', 'p95 ms', 'MB/s'))
+    for method in ['direct'] + args.methods.split(','):
+        tunnels = []
+        try:
+            if method == 'direct':
+                targets = (echo, sink)
+            else:
+                method = resolve_method(method)
+                for target in (echo, sink):
+                    tunnels.append(tunnel_manager.acquire(method, args.host, args.host, args.user, args.password,
+                                                          target))
+                targets = tuple(('127.0.0.1', t.local_port) for t in tunnels)
+            median, p95 = measure_latency(targets[0], args.rounds)
+            rate = measure_throughput(targets[1], args.megabytes)
+            print("{0:<14} {1:>12.3f} {2:>12.3f} {3:>12.1f}".format(method, median * 1000, p95 * 1000, rate))
+        except Exception as e:
+            print("{0:<14} failed: {1}".format(method, e))
+        finally:
+            for t in tunnels:
+                tunnel_manager.release(t)
+
+    tunnel_manager.close()
+    supervisor.close()
+    ssh_pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+#
+# Copyright (c) 2014-2019 CINECA.
+#
+# This file is part of RCM (Remote Connection Manager)
+# (see http://www.hpc.cineca.it/software/rcm).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import unittest
+import sys
+import os
+import time
+import shutil
+import socket
+import tempfile
+import threading
+import pexpect
+
+# add python path
+rcm_root_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(rcm_root_path)
+
+# local import
+from client.logic.supervisor import ProcessSupervisor, ServiceSession
+from client.logic.tunnel import Tunnel, TunnelManager
+
+# connects to the port given as argument like a vnc viewer, exits when the connection is lost
+viewer_script = """
+import sys, socket
+sock = socket.create_connection(('127.0.0.1', int(sys.argv[1])))
+sock.recv(12)
+sock.sendall(b'viewer')
+while sock.recv(1024):
+    pass
+sys.exit(1)
+"""
+
+
+class FakeDisplay(object):
+    """
+    Sends the RFB banner to every connection, counts the viewers connected
+    """
+
+    def __init__(self):
+        self.viewers = 0
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(8)
+        self.address = self.server.getsockname()
+        self.connections = []
+        t = threading.Thread(target=self._accept)
+        t.daemon = True
+        t.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, peer = self.server.accept()
+            except (socket.error, OSError):
+                return
+            conn.sendall(b'RFB 003.008\n')
+            self.connections.append(conn)
+            t = threading.Thread(target=self._serve, args=(conn,))
+            t.daemon = True
+            t.start()
+
+    def _serve(self, conn):
+        try:
+            if conn.recv(16) == b'viewer':
+                self.viewers += 1
+        except (socket.error, OSError):
+            pass
+
+    def close(self):
+        self.server.close()
+        for conn in self.connections:
+            conn.close()
+
+
+class RelayTunnel(Tunnel):
+    """
+    Local port relayed to the display, kill_transport drops all the relayed connections
+    as the death of the ssh transport of a tunnel does
+    """
+
+    def __init__(self, remote_address):
+        super(RelayTunnel, self).__init__()
+        self.remote_address = remote_address
+        self.pairs = []
+        self.rebuilds = 0
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(8)
+        self.local_port = self.server.getsockname()[1]
+        self.key = ('relay', remote_address)
+        t = threading.Thread(target=self._accept)
+        t.daemon = True
+        t.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, peer = self.server.accept()
+            except (socket.error, OSError):
+                return
+            remote = socket.create_connection(self.remote_address)
+            self.pairs.append((conn, remote))
+            for a, b in ((conn, remote), (remote, conn)):
+                t = threading.Thread(target=self._pump, args=(a, b))
+                t.daemon = True
+                t.start()
+
+    @staticmethod
+    def _pump(a, b):
+        try:
+            for data in iter(lambda: a.recv(4096), b''):
+                b.sendall(data)
+        except (socket.error, OSError):
+            pass
+        for s in (a, b):
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except (socket.error, OSError):
+                pass
+
+    def kill_transport(self):
+        self.dropped()
+        for conn, remote in self.pairs:
+            for s in (conn, remote):
+                try:
+                    s.shutdown(socket.SHUT_RDWR)
+                except (socket.error, OSError):
+                    pass
+
+    def rebuild(self):
+        self.rebuilds += 1
+
+    def close(self):
+        self.server.close()
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class TestServiceSession(unittest.TestCase):
+    """
+    A viewer exiting because its tunnel dropped is launched again on the same local port
+    """
+
+    def setUp(self):
+        self.display = FakeDisplay()
+        self.tunnel = RelayTunnel(self.display.address)
+        self.tunnel_manager = TunnelManager(ssh_pool=None, probe_interval=0, probe_timeout=2.0)
+        self.tunnel.refcount = 1
+        self.supervisor = ProcessSupervisor()
+        self.active = []
+        self.folder = tempfile.mkdtemp()
+        viewer = os.path.join(self.folder, 'viewer.py')
+        with open(viewer, 'w') as f:
+            f.write(viewer_script)
+        command = '"' + sys.executable + '" "' + viewer + '" ' + str(self.tunnel.local_port)
+        self.session = ServiceSession(self.supervisor, command,
+                                      gui_cmd=lambda active: self.active.append(active),
+                                      tunnel_manager=self.tunnel_manager,
+                                      tunnel=self.tunnel)
+
+    def tearDown(self):
+        self.session.terminate()
+        self.display.close()
+        shutil.rmtree(self.folder)
+
+    def test_tunnel_drop(self):
+        self.session.start()
+        self.assertTrue(wait_for(lambda: self.display.viewers == 1))
+        self.tunnel.kill_transport()
+        # the display comes back: a new viewer connected through the same tunnel
+        self.assertTrue(wait_for(lambda: self.display.viewers == 2))
+        self.assertEqual(self.session.restarts, 1)
+        self.assertIs(self.session.tunnel, self.tunnel)
+        self.assertEqual(self.active, [True])
+
+    def test_display_closed(self):
+        self.session.start()
+        self.assertTrue(wait_for(lambda: self.display.viewers == 1))
+        # the vnc server goes away: the tunnel can not be repaired, the session ends
+        self.display.close()
+        self.assertTrue(wait_for(lambda: self.active == [True, False]))
+        self.assertEqual(self.session.restarts, 0)
+        self.assertIsNone(self.session.tunnel)
+
+
+class TestWatch(unittest.TestCase):
+    """
+    A process spawned by pexpect, like the ssh of the tunnels, is watched through its pseudo terminal
+    """
+
+    def test_pexpect_process(self):
+        supervisor = ProcessSupervisor()
+        process = pexpect.spawn(sys.executable, ['-c', 'import sys, time; print("password:"); '
+                                                       'sys.stdin.readline(); print("ready"); time.sleep(60)'],
+                                timeout=10)
+        process.expect('password')
+        process.sendline('secret')
+        lines = []
+        exits = []
+        watched = supervisor.watch(process, 'ssh tunnel', fd=process.child_fd,
+                                   on_output=lines.append, on_exit=exits.append)
+        self.assertTrue(wait_for(lambda: 'ready' in lines))
+        self.assertEqual(exits, [])
+        supervisor.close()
+        self.assertTrue(wait_for(lambda: len(exits) == 1))
+        self.assertIsNotNone(watched.poll())
+        process.close(force=True)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
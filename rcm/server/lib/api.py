@@ -17,6 +17,7 @@ class ServerAPIs:
       - get the server configuration
       - get the api version
       - get the list of sessions
+      - get the list of sessions of all users (admin)
       - get the list of login nodes to which the client can connect to
       - create a new session
       - kill a session
@@ -62,7 +63,7 @@ class ServerAPIs:
                                                                        client_current_version=client_current_version,
                                                                        client_current_checksum=client_current_checksum)
             conf.set_version(checksum, url)
-        jobscript_json_menu = self.server_manager.get_jobscript_json_menu()
+        jobscript_json_menu = self.server_manager.get_jobscript_json_menu(client_info.get('menu_encodings', []))
         if jobscript_json_menu:
             conf.config['jobscript_json_menu'] = jobscript_json_menu
 
@@ -90,6 +91,18 @@ class ServerAPIs:
         out_sessions = self.server_manager.map_sessions(self.server_manager.extract_running_sessions(), subnet)
         out_sessions.write()
 
+    def list_all(self, subnet=''):
+        """
+        Admin command: stream the sessions of all users on this login node as NDJSON,
+        one json record per line, written as soon as each session is read.
+        Needs read access to the users session folders.
+        """
+        self._server_init()
+        logger.debug("calling api list_all")
+        for record in self.server_manager.iter_all_sessions(subnet=subnet):
+            sys.stdout.write(json.dumps(record) + '\n')
+            sys.stdout.flush()
+
     def new(self, geometry='',
             queue='',
             sessionname='',
@@ -114,8 +127,9 @@ class ServerAPIs:
             
         # sys.stderr.write("----choices string:::>"+ choices_string + "<:::\n")
         self.server_manager.handle_choices(choices_string)
-        for k, v in self.server_manager.top_templates.items():
-            logger.debug(k + " :::>\n" + str(v) + "\n<:")
+        if logger.isEnabledFor(logging.DEBUG):
+            for k, v in self.server_manager.top_templates.items():
+                logger.debug("%s :::>\n%s\n<:", k, v)
 
         try:
             new_session = self.server_manager.create_session(
@@ -133,6 +147,15 @@ class ServerAPIs:
         return_session.write()
         return
 
+    def preview(self, choices_string=''):
+        """
+        Write as json the job script and the substitutions of choices_string, nothing is submitted
+        """
+        self._server_init()
+        logger.debug("calling api preview")
+        preview = self.server_manager.preview(choices_string)
+        sys.stdout.write(rcm.serverOutputString + json.dumps(preview))
+
     def kill(self, session_id=''):
         self._server_init()
         logger.debug("calling api kill")
@@ -0,0 +1,128 @@
+# Cross process single-flight of identical server requests.
+# Concurrent server processes of the same user running the same command with the same arguments
+# serialize on a lock file: the first one runs the command and publishes its output, the
+# ones that arrived while it was running, or shortly after, reuse that output.
+# Commands changing the user state ( new, kill ) are recorded by mark_mutation: an output whose
+# run started before the last of them completed is never reused.
+
+import os
+import sys
+import json
+import time
+import fcntl
+import hashlib
+import tempfile
+import logging
+
+logger = logging.getLogger('rcmServer' + '.' + __name__)
+
+
+class TeeOutput(object):
+    """
+    stdout replacement that records everything written while still forwarding it
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.chunks = []
+
+    def write(self, s):
+        self.chunks.append(s)
+        self.stream.write(s)
+
+    def flush(self):
+        self.stream.flush()
+
+    def getvalue(self):
+        return ''.join(self.chunks)
+
+
+def request_key(username, command, args):
+    normalized = json.dumps([username, command, sorted((str(k), str(v)) for k, v in args.items())])
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def _publish(path, result):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'w') as f:
+        json.dump(result, f)
+    os.rename(tmp_path, path)
+
+
+def _load(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _lock(lock_file, deadline, poll):
+    while True:
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except (IOError, OSError):
+            if time.time() >= deadline:
+                return False
+            time.sleep(poll)
+
+
+def mark_mutation(folder):
+    """
+    Record that a command changing the state seen by the coalesced commands completed now
+    """
+    try:
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        _publish(os.path.join(folder, 'mutation.json'), {'completed': time.time()})
+    except (IOError, OSError) as e:
+        logger.warning("unable to record state change: " + str(e))
+
+
+def single_flight(folder, key, func, window=2.0, wait=120.0, poll=0.05):
+    """
+    Run func() writing on sys.stdout, unless an identical request completed after this one arrived,
+    or at most window seconds before, in which case its recorded output is written instead.
+    Outputs of runs started before the last mark_mutation are not reused.
+    The running identical request is waited for at most wait seconds, then func() is run anyway.
+    """
+    arrived = time.time()
+    try:
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        lock_file = open(os.path.join(folder, key + '.lock'), 'a')
+    except (IOError, OSError) as e:
+        logger.warning("request coalescing disabled: " + str(e))
+        return func()
+
+    result_path = os.path.join(folder, key + '.json')
+    with lock_file:
+        if not _lock(lock_file, arrived + wait, poll):
+            logger.warning("identical request %s still running after %.1f s, not waiting for it", key, wait)
+            return func()
+        try:
+            result = _load(result_path)
+            mutation = _load(os.path.join(folder, 'mutation.json')) or dict()
+            if (result is not None and result.get('completed', 0) >= arrived - window and
+                    result.get('started', 0) >= mutation.get('completed', 0)):
+                logger.debug("reusing output of identical request %s completed %.3f s after this one arrived",
+                             key, result['completed'] - arrived)
+                sys.stdout.write(result.get('output', ''))
+                sys.stdout.flush()
+                return
+
+            started = time.time()
+            tee = TeeOutput(sys.stdout)
+            sys.stdout = tee
+            try:
+                ret = func()
+            finally:
+                sys.stdout = tee.stream
+            try:
+                _publish(result_path, {'started': started, 'completed': time.time(), 'output': tee.getvalue()})
+            except (IOError, OSError) as e:
+                logger.warning("unable to publish request output: " + str(e))
+            return ret
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
@@ -11,11 +11,21 @@ if root_rcm_path not in sys.path:
     sys.path.append(root_rcm_path)
 
 import utils
+from jinja2 import FileSystemBytecodeCache
 
 
 logger = logging.getLogger('rcmServer' + '.' + __name__)
 
 
+def bytecode_cache():
+    # compiled templates of interpolated configuration values, shared by the server processes of the user
+    try:
+        return FileSystemBytecodeCache()
+    except Exception as e:
+        logger.warning("jinja2 bytecode cache disabled: " + str(e))
+        return None
+
+
 def absolute_paths(relative_paths, search_paths=(), glob_suffix=None):
     list_paths = []
     for path in relative_paths:
@@ -112,7 +122,8 @@ def getConfig(name="default", paths=(), glob_suffix="*.yaml"):
         *list_paths,
         interpolate=True,
         method=utils.hiyapyco.METHOD_MERGE,
-        failonmissingfiles=False
+        failonmissingfiles=False,
+        bytecodecache=bytecode_cache()
     )
 
     dict_paths[name] = MyOrderedDict(conf)
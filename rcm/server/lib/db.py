@@ -29,8 +29,11 @@ class DbSessionManager:
     with current sessions and takes care of removing the sessions when their associated job does not exist any more
     """
 
-    def __init__(self):
-        self.username = pwd.getpwuid(os.geteuid())[0]
+    def __init__(self, username=''):
+        if username:
+            self.username = username
+        else:
+            self.username = pwd.getpwuid(os.geteuid())[0]
         self.base_dir = os.path.expanduser("~%s/.rcm" % self.username)
         self.sessions_dir = os.path.abspath(os.path.join(self.base_dir, 'sessions'))
         self.old_sessions_dir = os.path.abspath(os.path.join(self.base_dir, 'old_sessions'))
@@ -61,20 +64,26 @@ class DbSessionManager:
             f.write(script)
         return jobfile
 
-    def sessions(self):
-        sessions = {}
+    def iter_sessions(self):
+        """
+        Lazily yield (session_id, rcm_session) pairs, reading one session file at a time
+        """
         if not os.path.isdir(self.sessions_dir):
-            return sessions
+            return
         for sess_id in os.listdir(self.sessions_dir):
             sess_file = self.session_file_path(sess_id)
             if os.path.exists(sess_file):
                 logger.debug("loading session from file: " + sess_file)
                 try:
-                    sessions[sess_id] = rcm.rcm_session(fromfile=sess_file)
+                    yield sess_id, rcm.rcm_session(fromfile=sess_file)
                 except Exception as e:
                     # print("WARNING: not valid session file %s: %s\n" % (file, e),type(inst),inst.args,file=sys.stderr)
                     sys.stderr.write("%s: %s RCM:EXCEPTION" % (format(e), traceback.format_exc()))
 
+    def sessions(self):
+        sessions = {}
+        for sess_id, ses in self.iter_sessions():
+            sessions[sess_id] = ses
         return sessions
 
     def remove_session(self, sess_id):
@@ -113,3 +122,34 @@ class DbSessionManager:
                 logger.info("removing old session folder: " + folder_to_remove)
                 # shutil.rmtree(folder_to_remove)
 
+
+
+def iter_users_session_managers(sessions_index=''):
+    """
+    Yield a DbSessionManager for every user owning a session store on this node.
+    If sessions_index is the path of a site-wide index file (one username per line),
+    only the listed users are visited, otherwise the whole passwd database is walked.
+    Users are produced one at a time, so memory usage does not grow with the number of users.
+    """
+    if sessions_index and os.path.isfile(sessions_index):
+        logger.info("walking session stores listed in index: " + sessions_index)
+        with open(sessions_index, 'r') as index_file:
+            for line in index_file:
+                username = line.strip()
+                if username and not username.startswith('#'):
+                    yield DbSessionManager(username=username)
+        return
+
+    seen_dirs = set()
+    for pw_entry in pwd.getpwall():
+        sessions_dir = os.path.join(pw_entry.pw_dir, '.rcm', 'sessions')
+        if sessions_dir in seen_dirs:
+            continue
+        seen_dirs.add(sessions_dir)
+        try:
+            if not os.path.isdir(sessions_dir):
+                continue
+        except OSError as e:
+            logger.warning("skipping user " + pw_entry.pw_name + ": " + str(e))
+            continue
+        yield DbSessionManager(username=pw_entry.pw_name)
@@ -30,7 +30,10 @@ def all_interfaces():
             max_possible *= 2
         else:
             break
-    namestr = names.tostring()
+    if hasattr(names, 'tobytes'):
+        namestr = names.tobytes()
+    else:
+        namestr = names.tostring()
     ifaces = []
     for i in range(0, outbytes, struct_size):
         iface_name = bytes.decode(namestr[i:i+16]).split('\0', 1)[0]
@@ -50,7 +53,8 @@ def external_name(subnet):
   logger.debug("external_name")
   ifs = all_interfaces()
   for i in ifs:
-    ip=format_ip(i[1])
+    # all_interfaces already returns dotted addresses
+    ip=i[1]
     if(re.match('^'+subnet,ip)):
         try:
             name=socket.gethostbyaddr(ip)[0]
@@ -72,6 +76,6 @@ if __name__ == "__main__":
   if(name): print("name-->"+name+"<--")
   ifs = all_interfaces()
   for i in ifs:
-    print("%12s   %s" % (i[0], format_ip(i[1])))
+    print("%12s   %s" % (i[0], i[1]))
   for i in ifs:
-    print("%12s   %s" % (i[0], external_name(format_ip(i[1]))))
+    print("%12s   %s" % (i[0], external_name(i[1])))
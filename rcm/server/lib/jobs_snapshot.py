@@ -0,0 +1,164 @@
+# Shared scheduler jobs snapshot.
+# A single broker process per login node periodically dumps the scheduler queue into a
+# world readable file, sorted by user and job id, so that every user rcm server can read just
+# its own jobs ( binary search on the memory mapped file ) instead of querying the scheduler.
+#
+# File layout ( text, one record per line ):
+#   #rcm-jobs-snapshot <unix timestamp>
+#   <user>#<jobid>#<state>#<job name>
+
+import os
+import mmap
+import time
+import tempfile
+import logging
+
+logger = logging.getLogger('rcmServer' + '.' + __name__)
+
+header_tag = b'#rcm-jobs-snapshot '
+
+# squeue output format matching the record layout above
+squeue_params = '-o %u#%i#%t#%j -h -a'.split(' ')
+
+
+def write_snapshot(path, records, timestamp=None):
+    """
+    Atomically replace path with the sorted records, each record is a (user, jobid, state, name) tuple
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    lines = sorted(set('#'.join(r).encode('utf-8') for r in records))
+    snapshot_dir = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=snapshot_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header_tag + repr(timestamp).encode('utf-8') + b'\n')
+            for line in lines:
+                f.write(line + b'\n')
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logger.debug("written jobs snapshot %s with %d records", path, len(lines))
+
+
+def parse_squeue_output(raw_output):
+    records = []
+    for line in raw_output.splitlines():
+        fields = line.split('#', 3)
+        if len(fields) == 4:
+            records.append(tuple(fields))
+    return records
+
+
+def _find_first(mm, start, prefix):
+    """
+    Binary search of the offset of the first line >= prefix, lines from start are sorted
+    """
+    lo, hi = start, len(mm)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        line_start = max(mm.rfind(b'\n', 0, mid) + 1, lo)
+        line_end = mm.find(b'\n', line_start)
+        if line_end == -1:
+            line_end = len(mm)
+        if mm[line_start:line_end] < prefix:
+            lo = line_end + 1
+        else:
+            hi = line_start
+    return lo
+
+
+def _open(path):
+    try:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _header_end(mm, path, max_age):
+    """
+    Offset of the end of the header line, None if the snapshot is invalid or older than max_age seconds
+    """
+    header_end = mm.find(b'\n')
+    if header_end == -1 or not mm[:header_end].startswith(header_tag):
+        logger.warning("invalid jobs snapshot file " + path)
+        return None
+    try:
+        timestamp = float(mm[len(header_tag):header_end])
+    except ValueError:
+        return None
+    if time.time() - timestamp > max_age:
+        logger.debug("jobs snapshot %s is stale", path)
+        return None
+    return header_end
+
+
+def read_user_jobs(path, username, max_age=30):
+    """
+    Return the list of (jobid, state, name) of username, or None if the snapshot is missing or
+    older than max_age seconds, in which case the caller has to query the scheduler directly.
+    """
+    mm = _open(path)
+    if mm is None:
+        return None
+    try:
+        header_end = _header_end(mm, path, max_age)
+        if header_end is None:
+            return None
+
+        prefix = username.encode('utf-8') + b'#'
+        jobs = []
+        pos = _find_first(mm, header_end + 1, prefix)
+        while pos < len(mm):
+            line_end = mm.find(b'\n', pos)
+            if line_end == -1:
+                line_end = len(mm)
+            line = mm[pos:line_end]
+            if not line.startswith(prefix):
+                break
+            fields = line.decode('utf-8').split('#', 3)
+            if len(fields) == 4:
+                jobs.append((fields[1], fields[2], fields[3]))
+            pos = line_end + 1
+        return jobs
+    finally:
+        mm.close()
+
+
+def read_all_jobs(path, max_age=30):
+    """
+    Return the list of (user, jobid, state, name) of all the users, or None if the snapshot is missing or
+    older than max_age seconds, as read_user_jobs
+    """
+    mm = _open(path)
+    if mm is None:
+        return None
+    try:
+        header_end = _header_end(mm, path, max_age)
+        if header_end is None:
+            return None
+        return parse_squeue_output(mm[header_end + 1:].decode('utf-8'))
+    finally:
+        mm.close()
+
+
+def run_broker(path, squeue, interval=10, once=False):
+    """
+    Query the scheduler every interval seconds and publish the snapshot on path
+    """
+    while True:
+        start = time.time()
+        try:
+            raw_output = squeue(*squeue_params, output=str)
+            write_snapshot(path, parse_squeue_output(raw_output), timestamp=start)
+        except Exception as e:
+            logger.warning("Exception: " + str(e) + " in updating jobs snapshot " + path)
+        if once:
+            return
+        time.sleep(max(0, interval - (time.time() - start)))
@@ -1,7 +1,12 @@
 # std import
 import logging
 import copy
+import json
 from collections import OrderedDict
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # python 2
+    from collections import MutableMapping
 
 # local import
 import config
@@ -20,6 +25,157 @@ except NameError:  # no, it doesn't (it's Python3); use 'str' instead
 
 class_table = None
 
+# memo of the AutoChoiceNode substitutions, set only while rendering previews:
+# the substitution of a submitted job always runs, as it selects the plugins as a side effect
+render_memo = None
+
+
+class RenderMemo(object):
+    """
+    Bounded memo of AutoChoiceNode.substitute results, keyed by node and by the choices the node receives.
+    Each node only receives the choices of its own subtree, so changing a choice re-renders
+    just the nodes on the path to the changed branch.
+    """
+
+    def __init__(self, size=512):
+        self.size = size
+        self.entries = OrderedDict()
+
+    @staticmethod
+    def key(node, choices):
+        return id(node), json.dumps(dict(choices.items()), sort_keys=True, default=str)
+
+    def get(self, node, choices):
+        key = self.key(node, choices)
+        if key not in self.entries:
+            return None
+        self.entries[key] = self.entries.pop(key)
+        return copy.deepcopy(self.entries[key])
+
+    def put(self, node, choices, out_subst):
+        self.entries[self.key(node, choices)] = copy.deepcopy(out_subst)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+class ChoiceTrie(MutableMapping):
+    """
+    Choices ( dotted keys -> value ) indexed once in a prefix trie on the key segments:
+    route() and strip() give the choices of a child node with a lookup of its name, instead of
+    splitting every key and comparing it with every child name at every level of the tree.
+    A ChoiceTrie is a layered scope, no choice is copied: reads look up the keys written in the scope,
+    then the choices under its prefix ( seen without their first `strip` segments ), then the defaults.
+    Writes stay in the scope and are not routed to the children.
+    """
+
+    class Index(object):
+        __slots__ = ('keys', 'children')
+
+        def __init__(self):
+            # full key -> number of segments, of the choices under this prefix, in choices order
+            self.keys = OrderedDict()
+            self.children = dict()
+
+    def __init__(self, choices=None, defaults=None):
+        self.values = dict()
+        index = ChoiceTrie.Index()
+        for key, value in (choices or dict()).items():
+            self.values[key] = value
+            segments = key.split('.')
+            node = index
+            node.keys[key] = len(segments)
+            for segment in segments:
+                node = node.children.setdefault(segment, ChoiceTrie.Index())
+                node.keys[key] = len(segments)
+        self._init_scope(index, (), 0, defaults)
+
+    def _init_scope(self, index, path, strip, defaults):
+        self.index = index
+        self.path = path
+        self.strip = strip
+        self.defaults = defaults
+        self.local = OrderedDict()
+        self.prefix = '.'.join(path[:strip]) + '.' if strip else ''
+
+    def _scope(self, index, path, strip, defaults=None):
+        scope = ChoiceTrie.__new__(ChoiceTrie)
+        scope.values = self.values
+        scope._init_scope(index, path, strip, defaults)
+        return scope
+
+    def route(self, name):
+        """
+        the choices whose first segment is name, with the full key ( the ones AutoChoiceNode passes to a child )
+        """
+        if len(self.path) == self.strip:
+            return self._scope(self.index.children.get(name, ChoiceTrie.Index()), self.path + (name,), self.strip)
+        if self.path[self.strip] == name:
+            return self._scope(self.index, self.path, self.strip)
+        return self._scope(ChoiceTrie.Index(), self.path, self.strip)
+
+    def strip_name(self, name):
+        """
+        the choices name.key as key ( the ones ManagerChoiceNode passes to the active child )
+        """
+        routed = self.route(name)
+        return self._scope(routed.index, routed.path, self.strip + 1)
+
+    def overlay(self, defaults):
+        """
+        new scope on the same choices, falling back to defaults for the missing keys
+        """
+        return self._scope(self.index, self.path, self.strip, defaults)
+
+    def _choice_keys(self):
+        offset = len(self.prefix)
+        for key, count in self.index.keys.items():
+            if count > self.strip:
+                yield key[offset:]
+
+    def _choice(self, key):
+        full_key = self.prefix + key
+        if self.index.keys.get(full_key, 0) > self.strip:
+            return True, self.values[full_key]
+        return False, None
+
+    def __getitem__(self, key):
+        if key in self.local:
+            return self.local[key]
+        found, value = self._choice(key)
+        if found:
+            return value
+        if self.defaults is not None and key in self.defaults:
+            return self.defaults[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.local or self._choice(key)[0] or (self.defaults is not None and key in self.defaults)
+
+    def __setitem__(self, key, value):
+        self.local[key] = value
+
+    def __delitem__(self, key):
+        del self.local[key]
+
+    def __iter__(self):
+        # in the order of a dict filled with defaults, updated with the choices and then with the writes
+        if self.defaults is None and not self.local:
+            for key in self._choice_keys():
+                yield key
+            return
+        seen = set()
+        for layer in (self.defaults or (), self._choice_keys(), self.local):
+            for key in layer:
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
 
 class Node(object):
     """
@@ -42,46 +198,56 @@ class Node(object):
         else:
             self.schema_name = 'UNKNOWN'
         if schema:
-            constructor_logger.debug(self.__class__.__name__ + " " + self.NAME + " getting input schema " + str(schema))
+            constructor_logger.debug("%s %s getting input schema %s", self.__class__.__name__, self.NAME, schema)
             self.schema = schema
         else:
             self.schema = config.getConfig()['schema', self.NAME]
-            constructor_logger.debug(
-                self.__class__.__name__ + " " + self.NAME + " getting yaml schema " + str(self.schema))
+            constructor_logger.debug("%s %s getting yaml schema %s", self.__class__.__name__, self.NAME, self.schema)
 
         if defaults:
-            constructor_logger.debug(
-                self.__class__.__name__ + " " + self.NAME + " getting input defaults " + str(defaults))
+            constructor_logger.debug("%s %s getting input defaults %s", self.__class__.__name__, self.NAME, defaults)
             self.defaults = defaults
         else:
             self.defaults = config.getConfig()['defaults', self.NAME]
-            constructor_logger.debug(
-                self.__class__.__name__ + " " + self.NAME + " getting yaml defaults " + str(self.defaults))
+            constructor_logger.debug("%s %s getting yaml defaults %s", self.__class__.__name__, self.NAME,
+                                     self.defaults)
         self.connected_plugin = connected_plugin
-        module_logger.debug(self.__class__.__name__ + ": " + str(self.NAME))
+        module_logger.debug("%s: %s", self.__class__.__name__, self.NAME)
 
         self.templates = copy.deepcopy(self.schema.get('substitutions', OrderedDict()))
-        constructor_logger.debug(
-            self.__class__.__name__ + " " + self.NAME + " templates schema  " + str(self.templates))
+        constructor_logger.debug("%s %s templates schema  %s", self.__class__.__name__, self.NAME, self.templates)
         # needed to prevent crash when key susbstitutions has no following substitutions
         if self.templates is None:
             self.templates = OrderedDict()
         if hasattr(self.defaults, 'get'):
             default_subst = copy.deepcopy(self.defaults.get('substitutions', OrderedDict()))
-            constructor_logger.debug(
-                self.__class__.__name__ + " " + self.NAME + " templates defaults " + str(default_subst))
+            constructor_logger.debug("%s %s templates defaults %s", self.__class__.__name__, self.NAME, default_subst)
             # needed to prevent crash when key susbstitutions has no following substitutions
             if hasattr(default_subst, '__getitem__'):
                 for key in default_subst:
                     self.templates[key] = default_subst[key]
 
-        constructor_logger.debug(self.__class__.__name__ + " " + self.NAME + " templates merged " + str(self.templates))
+        constructor_logger.debug("%s %s templates merged %s", self.__class__.__name__, self.NAME, self.templates)
+
+    def __getstate__(self):
+        # plugin objects are not stored with the tree, see bind_plugins
+        state = self.__dict__.copy()
+        state['connected_plugin'] = None
+        return state
+
+    def bind_plugins(self, plugin_table):
+        """
+        Connect again the nodes of an unpickled tree to the loaded plugins,
+        return False if a plugin used by the tree is not available.
+        """
+        return True
 
     def substitute(self, choices):
-        t = ""
-        if self.templates:
-            t = " -subst- " + str(self.templates)
-        substitute_logger.debug(" " + self.__class__.__name__ + " : " + str(self.NAME) + " : " + t + str(choices))
+        if substitute_logger.isEnabledFor(logging.DEBUG):
+            t = ""
+            if self.templates:
+                t = " -subst- " + str(self.templates)
+            substitute_logger.debug(" %s : %s : %s%s", self.__class__.__name__, self.NAME, t, choices)
 
 
 class LeafNode(Node):
@@ -93,7 +259,7 @@ class LeafNode(Node):
                 options['values'][preset] = self.defaults[preset]
         else:
             options['values'] = copy.deepcopy(self.defaults)
-        gui_logger.debug(self.__class__.__name__ + " gui options " + str(options))
+        gui_logger.debug("%s gui options %s", self.__class__.__name__, options)
         return options
 
     def substitute(self, choices):
@@ -101,9 +267,10 @@ class LeafNode(Node):
         for t in self.templates:
             out_subst[t] = utils.StringTemplate(self.templates[t]).safe_substitute(choices)
 
-        for key, value in out_subst.items():
-            substitute_logger.debug(" " + self.__class__.__name__ + " : " + str(self.NAME) + " : " + " leaf: " + str(
-                self.NAME) + " : " + str(key) + " ::> " + str(value))
+        if substitute_logger.isEnabledFor(logging.DEBUG):
+            for key, value in out_subst.items():
+                substitute_logger.debug(" %s : %s :  leaf: %s : %s ::> %s",
+                                        self.__class__.__name__, self.NAME, self.NAME, key, value)
         return out_subst
 
 
@@ -117,12 +284,18 @@ class CompositeNode(Node):
     def add_child(self, child):
         self.children.append(child)
 
+    def bind_plugins(self, plugin_table):
+        bound = True
+        for child in self.children:
+            bound = child.bind_plugins(plugin_table) and bound
+        return bound
+
     def get_gui_options(self):
         options = OrderedDict()
         for child in self.children:
             options[child.NAME] = child.get_gui_options()
 
-        gui_logger.debug(self.__class__.__name__ + " gui options " + str(options))
+        gui_logger.debug("%s gui options %s", self.__class__.__name__, options)
         return options
 
     def substitute(self, choices):
@@ -162,8 +335,8 @@ class AutoChoiceNode(CompositeNode):
                                                       schema=copy.deepcopy(child_schema),
                                                       defaults=copy.deepcopy(self.defaults[child_name]))
                     else:
-                        constructor_logger.debug(
-                            self.__class__.__name__ + " " + self.NAME + " hadling leaf item: " + child_name)
+                        constructor_logger.debug("%s %s hadling leaf item: %s",
+                                                 self.__class__.__name__, self.NAME, child_name)
                         child = LeafNode(name=child_name,
                                          schema=copy.deepcopy(child_schema),
                                          defaults=copy.deepcopy(self.defaults[child_name]))
@@ -171,49 +344,53 @@ class AutoChoiceNode(CompositeNode):
                 else:
                     if child_schema:
                         if 'children' in child_schema:
-                            constructor_logger.debug(
-                                "skipping complex item: " + child_name + " in schema but not in defaults")
+                            constructor_logger.debug("skipping complex item: %s in schema but not in defaults",
+                                                     child_name)
                         else:
                             if child_schema.get('values', OrderedDict()):
-                                constructor_logger.debug(
-                                    self.__class__.__name__ + " " + self.NAME + " adding leaf item: " +
-                                    child_name + " without defaults")
+                                constructor_logger.debug("%s %s adding leaf item: %s without defaults",
+                                                         self.__class__.__name__, self.NAME, child_name)
                                 child = LeafNode(name=child_name,
                                                  schema=copy.deepcopy(child_schema),
                                                  defaults=OrderedDict())
                                 self.add_child(child)
                             else:
-                                constructor_logger.warning(
-                                    self.__class__.__name__ + " " + self.NAME + " skipping leaf item: " +
-                                    child_name + " without defaults and no values")
+                                constructor_logger.warning("%s %s skipping leaf item: %s without defaults and no values",
+                                                           self.__class__.__name__, self.NAME, child_name)
 
     def substitute(self, choices):
+        if render_memo is None:
+            return self.render(choices)
+        out_subst = render_memo.get(self, choices)
+        if out_subst is None:
+            out_subst = self.render(choices)
+            render_memo.put(self, choices, out_subst)
+        return out_subst
+
+    def render(self, choices):
         # in_subst is the dict of susbstitutions that are passed to child nodes
         # these substs are initialized with self.templates ( current node defined susbstitutions)
         # to provide defaults that are overridden by choices
 
         Node.substitute(self, choices)
+        if not isinstance(choices, ChoiceTrie):
+            choices = ChoiceTrie(choices)
+        if substitute_logger.isEnabledFor(logging.DEBUG):
+            for key, value in choices.items():
+                substitute_logger.debug(" %s : %s substitute %s : %s", self.__class__.__name__, self.NAME, key, value)
+
+        # every child gets the choices of its subtree, in its own scope: leaf nodes write in it their templates
         child_subst = dict()
         for child in self.children:
-            child_subst[child] = dict()
-        for key, value in choices.items():
-            substitute_logger.debug(
-                " " + self.__class__.__name__ + " : " + str(self.NAME) + " substitute " + key + " : " + value)
-            subkey = key.split('.')
-            substitute_logger.debug(subkey)
-            for child in self.children:
-                if child.NAME == subkey[0]:
-                    substitute_logger.debug("stripping subst " + str(self.NAME) + "--" + '.'.join(subkey[1:]))
-                    child_subst[child][key] = value
+            child_subst[child] = choices.route(child.NAME)
 
         collected_subst = OrderedDict()
-        in_subst = copy.deepcopy(self.templates)
-        in_subst.update(copy.deepcopy(choices))
+        in_subst = choices.overlay(self.templates)
 
         for child in self.children:
             if child_subst[child]:
                 subst = child.substitute(child_subst[child])
-                substitute_logger.debug("child: " + child.NAME + " returned " + str(subst))
+                substitute_logger.debug("child: %s returned %s", child.NAME, subst)
                 if subst:
                     for key_sub in subst:
                         in_subst[key_sub] = subst[key_sub]
@@ -223,31 +400,35 @@ class AutoChoiceNode(CompositeNode):
                         if key_sub not in child_subst[child]:
                             collected_subst[child.schema_name + '.' + key_sub] = subst[key_sub]
 
-        out_subst = OrderedDict()
-        for t, val in self.templates.items():
+        # values are inserted as they are, so every template is rendered against the same in_subst
+        rendered = dict()
+        for t in self.templates:
+            val = self.templates[t]
             if type(val) in stringtypes:
-                out_subst[t] = utils.StringTemplate(val).safe_substitute(in_subst)
+                rendered[t] = utils.render_template(val, in_subst)
             else:
                 if type(val) is list:
                     out = list()
                     for v in val:
                         if type(v) in stringtypes:
-                            out.append(utils.StringTemplate(v).safe_substitute(in_subst))
+                            out.append(utils.render_template(v, in_subst))
                         else:
-                            substitute_logger.warning(
-                                " " + self.__class__.__name__ + " : " + str(
-                                    self.NAME) + "key: " + t + " unknown type value " + str(type(v)) + " : " + str(v))
-                    out_subst[t] = out
+                            substitute_logger.warning(" %s : %skey: %s unknown type value %s : %s",
+                                                      self.__class__.__name__, self.NAME, t, type(v), v)
+                    rendered[t] = out
                 else:
-                    substitute_logger.warning(
-                        " " + self.__class__.__name__ + " : " + str(
-                            self.NAME) + "key: " +str( t ) + " unknown type value " + str(type(val)) + " : " +str( val))
-        out_subst.update(copy.deepcopy(choices))
-        out_subst.update(copy.deepcopy(collected_subst))
+                    substitute_logger.warning(" %s : %skey: %s unknown type value %s : %s",
+                                              self.__class__.__name__, self.NAME, t, type(val), val)
+        out_subst = OrderedDict()
+        for t in self.templates:
+            if t in rendered:
+                out_subst[t] = rendered[t]
+        out_subst.update(choices)
+        out_subst.update(collected_subst)
 
-        for key, value in out_subst.items():
-            substitute_logger.debug(
-                " " + self.__class__.__name__ + " : " + str(self.NAME) + " : " + str(key) + " ::> " + str(value))
+        if substitute_logger.isEnabledFor(logging.DEBUG):
+            for key, value in out_subst.items():
+                substitute_logger.debug(" %s : %s : %s ::> %s", self.__class__.__name__, self.NAME, key, value)
 
         return out_subst
 
@@ -273,26 +454,19 @@ class ManagerChoiceNode(ChoiceNode):
 
     def substitute(self, choices):
         Node.substitute(self, choices)
-        child_subst = dict()
+        if not isinstance(choices, ChoiceTrie):
+            choices = ChoiceTrie(choices)
         active_child_name = choices.get(self.NAME, '')
-        for child in self.children:
-            child_subst[child] = dict()
-        for key, value in choices.items():
-            substitute_logger.debug(
-                " " + self.__class__.__name__ + " : " + str(self.NAME) + " substitute " + key + " : " + value)
-            subkey = key.split('.')
-            # logger.debug(subkey)
-            if len(subkey) > 1:
-                if self.NAME == subkey[0]:
-                    for child in self.children:
-                        if child.NAME == active_child_name:
-                            substitute_logger.debug(" " + self.__class__.__name__ + " : " + str(
-                                self.NAME) + " stripping subst" + self.NAME + "--" + '.'.join(subkey[1:]))
-                            child_subst[child]['.'.join(subkey[1:])] = value
+        # the active child gets the choices NAME.key as key
+        child_subst = choices.strip_name(self.NAME)
+        if substitute_logger.isEnabledFor(logging.DEBUG):
+            for key, value in child_subst.items():
+                substitute_logger.debug(" %s : %s stripping subst %s--%s : %s", self.__class__.__name__,
+                                        self.NAME, self.NAME, key, value)
         for child in self.children:
             if child.NAME == active_child_name:
                 self.active_child = child
-                return child.substitute(child_subst[child])
+                return child.substitute(child_subst)
 
 
 class AutoManagerChoiceNode(ManagerChoiceNode):
@@ -303,7 +477,7 @@ class AutoManagerChoiceNode(ManagerChoiceNode):
             for class_name in self.defaults:
                 if class_name in ['description', 'children', 'substitutions']:
                     continue
-                constructor_logger.debug(self.__class__.__name__ + self.NAME + " handling child  : " + class_name)
+                constructor_logger.debug("%s%s handling child  : %s", self.__class__.__name__, self.NAME, class_name)
                 child_schema = copy.deepcopy(self.schema)
                 child_defaults = copy.deepcopy(self.defaults.get(class_name, OrderedDict()))
 
@@ -346,14 +520,13 @@ class ManagedPlugin(ManagedChoiceNode):
             if hasattr(self.connected_plugin, 'PARAMS'):
                 if hasattr(self.connected_plugin.PARAMS, 'get'):
                     for param in self.connected_plugin.PARAMS:
-                        constructor_logger.debug(self.__class__.__name__ + str(
-                            kwargs.get('name', self.NAME)) + " calling connected plugin " +
-                                                 self.connected_plugin.__class__.__name__ + " param " + str(param))
+                        constructor_logger.debug("%s%s calling connected plugin %s param %s",
+                                                 self.__class__.__name__, kwargs.get('name', self.NAME),
+                                                 self.connected_plugin.__class__.__name__, param)
                         computed_param = self.connected_plugin.PARAMS[param](default_params=merged_defaults.get(param, OrderedDict()))
-                        constructor_logger.info(self.__class__.__name__ + str(
-                            kwargs.get('name', self.NAME)) + " asking  connected plugin " +
-                                                self.connected_plugin.__class__.__name__ +
-                                                " param " + param + " returned " + str(computed_param))
+                        constructor_logger.info("%s%s asking  connected plugin %s param %s returned %s",
+                                                self.__class__.__name__, kwargs.get('name', self.NAME),
+                                                self.connected_plugin.__class__.__name__, param, computed_param)
 
 #                        merged_defaults[param] = self.connected_plugin.merge_list(
 #                            merged_defaults.get(param, OrderedDict()),
@@ -363,6 +536,14 @@ class ManagedPlugin(ManagedChoiceNode):
         kwargs['defaults'] = merged_defaults
         super(ManagedPlugin, self).__init__(*args, **kwargs)
 
+    def bind_plugins(self, plugin_table):
+        # schema_name is the name of the managing node, SCHEDULER or COMMAND
+        self.connected_plugin = plugin_table.get(self.schema_name, dict()).get(self.NAME, None)
+        if self.connected_plugin is None:
+            module_logger.warning("no plugin %s for %s", self.NAME, self.schema_name)
+            return False
+        return super(ManagedPlugin, self).bind_plugins(plugin_table)
+
     def substitute(self, choices):
         self.connected_plugin.selected = True
         self.connected_plugin.templates = dict()
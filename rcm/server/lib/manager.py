@@ -26,11 +26,79 @@ import config
 import jobscript_builder
 import db
 import rcm
-import enumerate_interfaces
+import resolver
+import tree_snapshot
 import utils
 
 logger = logging.getLogger('rcmServer' + '.' + __name__)
 
+# session fields holding the vnc credentials, never listed to the admin
+secret_session_fields = ('vncpassword', 'vncpassword_crypted', 'otp')
+
+
+class NetworkRules:
+    """
+    Per subnet mapping and tunnel rules, compiled once from the 'network' configuration section.
+    Mapping is an exact match dict, tunnel patterns are joined in a single regex whose
+    alternatives are tried in configuration order, so the first matching pattern wins as with re.match.
+    The tunnel rules give the route advised to the client, default tunnel; the tunnel_required rules,
+    same format, the nodes without any direct route from the subnet, default none: the client probes
+    the direct route of the other nodes.
+    """
+
+    def __init__(self, mapping=None, tunnel=None, tunnel_required=None, default=True):
+        self.mapping = dict(mapping) if mapping else dict()
+        self.default = default
+        self.required_rules = NetworkRules(tunnel=tunnel_required, default=False) if tunnel_required else None
+        self.tunnel_rules = list(tunnel.items()) if tunnel else []
+        self.tunnel_regex = None
+        self.tunnel_group_rule = dict()
+        self.tunnel_clist = []
+        self.tunnel_cache = dict()
+
+        alternatives = []
+        group_index = 1
+        try:
+            for node_pattern, rule in self.tunnel_rules:
+                if re.search(r'\\\d', node_pattern):
+                    raise re.error("numeric back reference in pattern " + node_pattern)
+                alternatives.append('(' + node_pattern + ')')
+                self.tunnel_group_rule[group_index] = rule
+                group_index += 1 + re.compile(node_pattern).groups
+            if alternatives:
+                self.tunnel_regex = re.compile('|'.join(alternatives))
+        except re.error as e:
+            # patterns with numeric back references can not be combined, match them one by one
+            logger.warning("unable to combine tunnel patterns: %s", e)
+            self.tunnel_regex = None
+            self.tunnel_clist = [(re.compile(p), rule) for p, rule in self.tunnel_rules]
+
+    def map_login_name(self, nodelogin):
+        return self.mapping.get(nodelogin, nodelogin)
+
+    def use_tunnel(self, nodename):
+        try:
+            return self.tunnel_cache[nodename]
+        except KeyError:
+            pass
+        use_tunnel = self.default
+        if self.tunnel_regex is not None:
+            m = self.tunnel_regex.match(nodename)
+            if m:
+                use_tunnel = self.tunnel_group_rule[m.lastindex]
+        else:
+            for node_cpattern, rule in self.tunnel_clist:
+                if node_cpattern.match(nodename):
+                    use_tunnel = rule
+                    break
+        self.tunnel_cache[nodename] = use_tunnel
+        return use_tunnel
+
+    def tunnel_required(self, nodename):
+        if self.required_rules is None:
+            return False
+        return bool(self.required_rules.use_tunnel(nodename))
+
 
 class ServerManager:
     """
@@ -50,15 +118,42 @@ class ServerManager:
         self.top_templates = dict()
         self.configuration = None
         self.info = dict()
+        self.render_memo = None
 
     @property
     def root_node(self):
         try:
             return self._root_node
         except AttributeError:
-            self._root_node = jobscript_builder.AutoChoiceNode(name='TOP')
+            self._root_node = self.load_root_node()
             return self._root_node
 
+    def load_root_node(self):
+        """
+        Reuse the jobscript tree snapshot of the user if it is still valid, otherwise build the tree and store it
+        """
+        max_age = self.configuration['jobscript_cache', 'max_age'] if self.configuration else 0
+        if not max_age:
+            return jobscript_builder.AutoChoiceNode(name='TOP')
+
+        path = os.path.join(self.session_manager.base_dir, 'cache', 'jobscript_tree.pickle')
+        plugin_table = jobscript_builder.class_table
+        key = tree_snapshot.fingerprint(self.configuration.configuration, [self.schedulers, self.services])
+        client_info = self.info.get('client_info', dict())
+        root_node = tree_snapshot.load(path, key, client_info=client_info, max_age=float(max_age))
+        if root_node is not None:
+            if root_node.bind_plugins(plugin_table):
+                logger.debug("jobscript tree loaded from %s", path)
+                return root_node
+            logger.warning("jobscript tree snapshot %s does not match the loaded plugins", path)
+
+        root_node = jobscript_builder.AutoChoiceNode(name='TOP')
+        try:
+            tree_snapshot.save(path, root_node, key, client_info=client_info)
+        except Exception as e:
+            logger.warning("unable to store jobscript tree snapshot: %s", e)
+        return root_node
+
 
     def init(self, info=None):
         if not info is None:
@@ -81,12 +176,10 @@ class ServerManager:
                                                 username=self.session_manager.username,
                                                 options=self.configuration['plugins', 'schedulers', scheduler_str])
                 self.schedulers[scheduler_obj.NAME] = scheduler_obj
-                logger.info('loaded scheduler plugin ' +
-                            scheduler_obj.__class__.__name__ +
-                            " - " + scheduler_obj.NAME)
+                logger.info('loaded scheduler plugin %s - %s', scheduler_obj.__class__.__name__, scheduler_obj.NAME)
             except Exception as e:
-                logger.error("plugin " + scheduler_str + " loading failed")
-                logger.error("Excepion: " + str(e) + " - " + str(traceback.format_exc()))
+                logger.error("plugin %s loading failed", scheduler_str)
+                logger.error("Excepion: %s - %s", e, traceback.format_exc())
 
         # load services
         for service_str in self.configuration['plugins', 'services']:
@@ -97,10 +190,10 @@ class ServerManager:
                 service_obj = service_class(client_info=client_info)
                 print("############## "+str(client_info))
                 self.services[service_obj.NAME] = service_obj
-                logger.info('loaded service plugin ' + service_obj.__class__.__name__ + " - " + service_obj.NAME)
+                logger.info('loaded service plugin %s - %s', service_obj.__class__.__name__, service_obj.NAME)
             except Exception as e:
                 logger.error("plugin loading failed")
-                logger.error("Excepion: " + str(e) + " - " + str(traceback.format_exc()))
+                logger.error("Excepion: %s - %s", e, traceback.format_exc())
 
         # instantiate widget tree
         jobscript_builder.class_table = {'SCHEDULER': self.schedulers,
@@ -109,25 +202,35 @@ class ServerManager:
 
         #self.root_node = jobscript_builder.AutoChoiceNode(name='TOP')
 
+    def network_rules(self, subnet):
+        try:
+            return self.network_map[subnet]
+        except KeyError:
+            logger.debug("compiling network rules for subnet %s", subnet)
+            rules = NetworkRules(mapping=self.configuration['network', subnet, 'mapping'],
+                                 tunnel=self.configuration['network', subnet, 'tunnel'],
+                                 tunnel_required=self.configuration['network', subnet, 'tunnel_required'])
+            self.network_map[subnet] = rules
+            return rules
+
     def map_login_name(self, subnet, nodelogin):
-        logger.debug("mapping login " + nodelogin + " on network " + subnet)
-        return self.configuration['network', subnet, 'mapping'].get(nodelogin, nodelogin)
+        logger.debug("mapping login %s on network %s", nodelogin, subnet)
+        return self.network_rules(subnet).map_login_name(nodelogin)
 
     def use_tunnel(self, subnet, nodename):
-        logger.debug("decide if use tunnel for connecting to node: " + nodename + " on network " + subnet)
-        tunnel_map = self.configuration['network', subnet, 'tunnel']
-        use_tunnel = True
-        for node_pattern in tunnel_map:
-            if re.match(node_pattern, nodename):
-                use_tunnel = tunnel_map[node_pattern]
-                break
-        return use_tunnel
+        logger.debug("decide if use tunnel for connecting to node: %s on network %s", nodename, subnet)
+        return self.network_rules(subnet).use_tunnel(nodename)
 
     def get_login_node_name(self, subnet=''):
         logger.debug("get_login")
 
         if (subnet):
-            nodelogin = enumerate_interfaces.external_name(subnet)
+            nodelogin = resolver.external_name(subnet,
+                                               cache_path=os.path.join(self.session_manager.base_dir,
+                                                                       'cache', 'resolver.json'),
+                                               ttl=int(self.configuration['resolver'].get('cache_ttl', 3600)),
+                                               timeout=float(self.configuration['resolver'].get('dns_timeout', 2)),
+                                               retry_ttl=int(self.configuration['resolver'].get('retry_ttl', 60)))
             if (not nodelogin):
                 nodelogin = self.login_fullname
             nodelogin = self.map_login_name(subnet, nodelogin)
@@ -136,22 +239,20 @@ class ServerManager:
             return self.login_fullname
 
     def map_session(self, ses, subnet):
-        # print("####### input #####\n" + ses.get_string(format='json_indent'))
-        new_session = copy.deepcopy(ses)
-        # print("####### copy  #####\n" + new_session.get_string(format='json_indent'))
-        originalNodeLogin = new_session.hash.get('nodelogin', '')
-        # print("############ ", originalNodeLogin)
-        newNodeLogin = self.map_login_name(subnet, originalNodeLogin)
-        # print("############ ", newNodeLogin)
-        new_session.hash['nodelogin'] = newNodeLogin
+        # shallow overlay: session hash values are plain strings, so copying the top level is enough
+        # to leave the original session untouched
+        new_session = copy.copy(ses)
+        new_session.hash = dict(ses.hash)
+        rules = self.network_rules(subnet)
+        new_session.hash['nodelogin'] = rules.map_login_name(new_session.hash.get('nodelogin', ''))
 
         # set tunnel for node
         node = new_session.hash.get('node', '')
-        use_tunnel = self.use_tunnel(subnet, node)
+        use_tunnel = rules.use_tunnel(node)
         new_session.hash['tunnel'] = 'y' if use_tunnel else 'n'
+        new_session.hash['tunnel_required'] = 'y' if rules.tunnel_required(node) else 'n'
         if not use_tunnel:
-            external_node_name = self.map_login_name(subnet, node)
-            new_session.hash['node'] = external_node_name
+            new_session.hash['node'] = rules.map_login_name(node)
 
         # mapping timeleft
         walltime = ses.hash.get('walltime', '')
@@ -159,7 +260,7 @@ class ServerManager:
         try:
             new_session.hash['timeleft'] = utils.timeleft_string(walltime, created)
         except Exception as e:
-            logger.info("Excepion: " + str(e) + " - " + str(traceback.format_exc()))
+            logger.info("Excepion: %s - %s", e, traceback.format_exc())
             new_session.hash['timeleft'] = utils.notimeleft_string
         return new_session
 
@@ -177,7 +278,7 @@ class ServerManager:
         return out_sessions
 
     def get_checksum_and_url(self, build_platform, client_current_version='', client_current_checksum=''):
-        logger.debug("searching platform " + str(build_platform) )
+        logger.debug("searching platform %s", build_platform)
 
         baseurl = self.downloads.get('baseurl', "")
         platforms = self.downloads.get('platforms', dict())
@@ -187,22 +288,27 @@ class ServerManager:
             for version in sorted(versions.keys()):
                 checksum = versions[version].get('hash',"")
                 downloadurl = baseurl + versions[version].get('path',"")
-                logger.debug("FOUND checksum: " + checksum + " url: " + downloadurl)
+                logger.debug("FOUND checksum: %s url: %s", checksum, downloadurl)
             if version > client_current_version:
-                logger.info("CLIENT UPDATE version: " + version + " checksum: " + checksum + " url: " + downloadurl)
+                logger.info("CLIENT UPDATE version: %s checksum: %s url: %s", version, checksum, downloadurl)
                 return checksum, downloadurl
             else:
-                logger.info("CLIENT NEWER, version: " + client_current_version + " server version: " + version)
+                logger.info("CLIENT NEWER, version: %s server version: %s", client_current_version, version)
                 return "", ""
         else:
-            available_platforms = platforms.keys()
-            available_platforms_string = str(available_platforms)
-            logger.warning("platform: " + str(build_platform) + ' NOT FOUND, available:\n' + available_platforms_string)
+            logger.warning("platform: %s NOT FOUND, available:\n%s", build_platform, list(platforms.keys()))
             return "", ""
 
-    def get_jobscript_json_menu(self):
-        json_string = json.dumps(self.root_node.get_gui_options())
-        logger.debug("################ jobscript_json_gui ##############\n" + json_string + "\n#####################################")
+    def get_jobscript_json_menu(self, encodings=()):
+        """
+        The jobscript gui options as json; with the shared subtrees encoding if among the ones
+        the client can decode, the repeated blocks ( qos, partitions... of every account ) are sent once
+        """
+        gui_options = self.root_node.get_gui_options()
+        if rcm.shared_menu_encoding in encodings:
+            gui_options = rcm.share_subtrees(gui_options)
+        json_string = json.dumps(gui_options)
+        logger.debug("################ jobscript_json_gui ##############\n%s\n#####################################", json_string)
         return json_string
 
     def handle_choices(self, choices_string):
@@ -230,6 +336,35 @@ class ServerManager:
                 self.active_service = service_obj
                 break
 
+    def preview(self, choices_string):
+        """
+        Render the job script of the choices without submitting it.
+        Subtree substitutions are memoized, so repeated previews while the user edits the choices
+        only render again the branches that changed.
+        Session dependent references ( RCM_SESSIONID, RCM_SESSION_FOLDER, RCM_JOBLOG ) are left unrendered.
+        """
+        choices = json.loads(choices_string)
+        if self.render_memo is None:
+            self.render_memo = jobscript_builder.RenderMemo()
+        jobscript_builder.render_memo = self.render_memo
+        try:
+            templates = self.root_node.substitute(choices)
+        finally:
+            jobscript_builder.render_memo = None
+
+        script = templates.get('SCRIPT', '')
+        session_refs = ['RCM_SESSIONID', 'RCM_SESSION_FOLDER', 'RCM_JOBLOG']
+        substitutions = OrderedDict()
+        for key, value in templates.items():
+            if key != 'SCRIPT' and isinstance(value, str):
+                substitutions[key] = value
+        return OrderedDict([('scheduler', choices.get('SCHEDULER', '')),
+                            ('service', choices.get('SERVICE', '')),
+                            ('script', script),
+                            ('substitutions', substitutions),
+                            ('unresolved', [r for r in utils.template_refs(script, braced_only=True)
+                                            if r not in session_refs])])
+
     def create_session(self,
                        sessionname='',
                        subnet='',
@@ -246,10 +381,9 @@ class ServerManager:
                                       sessionname=sessionname,
                                       nodelogin=self.login_fullname,
                                       vncpassword=vncpassword_crypted)
-        logger.debug("session\n---------------\n" +
-                     new_session.get_string(format='json_indent') +
-                     "\n-------------")
-        logger.debug("login_name: " + self.get_login_node_name())
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("session\n---------------\n%s\n-------------", new_session.get_string(format='json_indent'))
+            logger.debug("login_name: %s", self.get_login_node_name())
         printout = "submitting "
         if self.active_service:
             printout += "service: " + self.active_service.NAME
@@ -268,14 +402,18 @@ class ServerManager:
 
         # assembly job script
         script = self.top_templates.get('SCRIPT', 'No script in templates')
-        script = utils.StringTemplate(script).safe_substitute(substitutions)
-        logger.info("job script content:\n--------------start------------\n" +
-                    script +
-                    "\n-------------end--------------")
+        script = utils.render_template(script, substitutions)
+        unresolved = utils.template_refs(script, braced_only=True)
+        if unresolved:
+            logger.warning("unresolved references in job script: %s", ", ".join(unresolved))
+        logger.info("job script content:\n--------------start------------\n%s\n-------------end--------------", script)
 
         service_logfile = self.top_templates.get('SERVICE.COMMAND.LOGFILE', '')
-        service_logfile = utils.StringTemplate(service_logfile).safe_substitute(substitutions)
-        logger.debug("service_logfile:\n" + service_logfile)
+        service_logfile = utils.render_template(service_logfile, substitutions)
+        logger.debug("service_logfile:\n%s", service_logfile)
+        # written by the job script once the service is listening, see SERVICE.READY_SETUP
+        service_ready_file = self.top_templates.get('SERVICE.COMMAND.READY_FILE', '')
+        service_ready_file = utils.render_template(service_ready_file, substitutions)
 
         # here we write the computed script into jobfile
         jobfile = self.session_manager.write_jobscript(session_id, script)
@@ -294,9 +432,9 @@ class ServerManager:
         new_session.hash['jobid'] = jobid
         new_session.hash['walltime'] = self.top_templates.get('SCHEDULER.ACCOUNT.QUEUE.TIMELIMIT', utils.notimeleft_string)
         new_session.serialize(self.session_manager.session_file_path(session_id))
-        logger.debug("serialized  session:\n---------------\n" +
-                     new_session.get_string(format='json_indent') +
-                     "\n-------------")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("serialized  session:\n---------------\n%s\n-------------",
+                         new_session.get_string(format='json_indent'))
 
         try:
             scheduler_timeout = int(self.top_templates.get('SCHEDULER.ACCOUNT.QUEUE.QOS.TIMEOUT', '100'))
@@ -304,7 +442,8 @@ class ServerManager:
             scheduler_timeout = 100
 
         try:
-            session_dict = self.active_service.search_port(service_logfile, timeout=scheduler_timeout)
+            session_dict = self.active_service.search_port(service_logfile, timeout=scheduler_timeout,
+                                                           ready_file=service_ready_file)
         except Exception as e:
             self.active_scheduler.kill_job(jobid)
             raise e
@@ -312,30 +451,65 @@ class ServerManager:
         for k in session_dict :
             new_session.hash[k] = session_dict[k]
         new_session.serialize(self.session_manager.session_file_path(session_id))
-        logger.debug("serialized  session:\n---------------\n" +
-                     new_session.get_string(format='json_indent') +
-                     "\n-------------")
-        logger.info("return valid session job " + jobid + " session_dict: " + str(session_dict))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("serialized  session:\n---------------\n%s\n-------------",
+                         new_session.get_string(format='json_indent'))
+        logger.info("return valid session job %s session_dict: %s", jobid, session_dict)
         return new_session
 
+    def iter_all_sessions(self, subnet=''):
+        """
+        Walk the session stores of all users (or the site-wide index, if configured) and yield
+        one dict per session, joined with a single jobs snapshot per scheduler
+        ( the shared one published by bin/jobs_snapshot, when configured and fresh ).
+        The vnc credentials ( secret_session_fields ) are left out of the records.
+        Nothing is accumulated: each record is produced as soon as its session file is read.
+        """
+        sessions_index = self.configuration['admin', 'sessions_index']
+        jobs_snapshots = {}
+        for user_sessions in db.iter_users_session_managers(sessions_index=sessions_index):
+            try:
+                for sid, ses in user_sessions.iter_sessions():
+                    scheduler_name = ses.hash.get('scheduler', '')
+                    if scheduler_name not in jobs_snapshots:
+                        jobs_snapshots[scheduler_name] = None
+                        if scheduler_name in self.schedulers:
+                            try:
+                                jobs_snapshots[scheduler_name] = self.schedulers[scheduler_name].get_all_jobs()
+                            except NotImplementedError:
+                                logger.warning("scheduler %s does not support jobs snapshot", scheduler_name)
+                    if subnet:
+                        ses = self.map_session(ses, subnet)
+                    record = dict((k, v) for k, v in ses.hash.items() if k not in secret_session_fields)
+                    record['username'] = user_sessions.username
+                    record['sessionid'] = sid
+                    snapshot = jobs_snapshots[scheduler_name]
+                    if snapshot is None:
+                        record['job_state'] = 'unknown'
+                    else:
+                        record['job_state'] = snapshot.get(ses.hash.get('jobid', ''), 'finished')
+                    yield record
+            except OSError as e:
+                logger.warning("skipping sessions of user %s: %s", user_sessions.username, e)
+
     def extract_running_sessions(self):
         active_sessions = {}
         expired_sessions = {}
-        logger.debug("initialized acitve session to " + str(active_sessions))
+        logger.debug("initialized acitve session to %s", active_sessions)
         active_jobs = {}
         for sid, ses in list(self.session_manager.sessions().items()):
             scheduler_name = ses.hash.get('scheduler', '')
             if not scheduler_name in active_jobs:
                 if scheduler_name in self.schedulers:
-                    logger.debug("getting active jobs for scheduler " +
-                                 scheduler_name + " and user " + self.session_manager.username)
+                    logger.debug("getting active jobs for scheduler %s and user %s",
+                                 scheduler_name, self.session_manager.username)
                     active_jobs[scheduler_name] = self.schedulers[scheduler_name].get_user_jobs(
                         self.session_manager.username)
-                    logger.debug(str(active_jobs[scheduler_name]))
+                    logger.debug("%s", active_jobs[scheduler_name])
             jobid = ses.hash.get('jobid', '')
-            logger.debug("searching job " + jobid)
+            logger.debug("searching job %s", jobid)
             if jobid in active_jobs.get(scheduler_name, dict()):
-                logger.debug("found job " + jobid + " in active jobs " + str(active_jobs.get(scheduler_name, dict())))
+                logger.debug("found job %s in active jobs %s", jobid, active_jobs.get(scheduler_name, dict()))
                 active_sessions[sid] = ses
             else:
                 if scheduler_name in self.schedulers:
@@ -4,6 +4,18 @@ import api
 import argparse
 import sys
 import logging
+import os
+import json
+import traceback
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import coalesce
+import config
+import db
 
 logger = logging.getLogger('rcmServer' + '.' + __name__)
 
@@ -17,15 +29,25 @@ class CommandParser:
         parser.handle(["--command=config","--build_platform=linux"])
     """
 
-    def __init__(self, protocol):
+    def __init__(self, protocol, coalesce_options=None):
         self.protocol = protocol
+        # commands run by concurrent identical requests just once, see coalesce.single_flight
+        if coalesce_options is None:
+            coalesce_options = dict()
+        self.coalesce_commands = coalesce_options.get('commands', [])
+        self.coalesce_window = float(coalesce_options.get('window', 2))
+        self.coalesce_wait = float(coalesce_options.get('wait', 120))
+        self.mutating_commands = coalesce_options.get('mutating', [])
         self.functions = dict()
         parameters = dict()
         help = 'rcm_server commands\n'
 
         for name, func in inspect.getmembers(api.ServerAPIs):
             if self._is_class_method(name, func):
-                f_args = inspect.getargspec(func)[0]
+                if hasattr(inspect, 'getfullargspec'):
+                    f_args = inspect.getfullargspec(func)[0]
+                else:
+                    f_args = inspect.getargspec(func)[0]
                 self.functions[str(name)] = (func, f_args)
                 help += "\n --command=" + str(name)
                 for arg in f_args:
@@ -38,6 +60,9 @@ class CommandParser:
                                  type=int,
                                  default=0,
                                  help='set debug level')
+        self.parser.add_argument("--rpc",
+                                 action='store_true',
+                                 help='serve newline delimited json requests from stdin, see serve_rpc')
         self.parser.add_argument("--command",
                                  default='',
                                  help='set the api command ' + str(self.functions.keys()))
@@ -59,7 +84,7 @@ class CommandParser:
             else:
                 return False
 
-    def handle(self, args=None):
+    def handle(self, args=None, rpc_outstream=None):
         if args:
             flags = self.parser.parse_args(args).__dict__
             logger.debug("parsing command " + str(args))
@@ -68,6 +93,10 @@ class CommandParser:
             flags = self.parser.parse_args().__dict__
             logger.debug("parsing command line")
 
+        if flags.get('rpc', False):
+            self.serve_rpc(outstream=rpc_outstream)
+            return
+
         if 'command' not in flags:
             logger.error("please specify a command")
             return
@@ -81,11 +110,110 @@ class CommandParser:
             logger.error("command " + command + " undefined")
             return
 
-        func = self.functions[command][0]
         func_flags = dict()
         # collect all the relevant parameters for the function and pass it
         for parameter in self.functions[command][1]:
             flag = flags.get(parameter, '')
             if flag != '':
                 func_flags[parameter] = flag
-        func(self.protocol, **func_flags)
+        self.dispatch(command, func_flags)
+
+    def dispatch(self, command, func_flags):
+        func = self.functions[command][0]
+        if command in self.coalesce_commands and self.coalesce_wait > 0:
+            session_manager = db.DbSessionManager()
+            key = coalesce.request_key(session_manager.username, command, func_flags)
+            coalesce.single_flight(os.path.join(session_manager.base_dir, 'coalesce'),
+                                   key,
+                                   lambda: func(self.protocol, **func_flags),
+                                   window=self.coalesce_window,
+                                   wait=self.coalesce_wait)
+        elif command in self.mutating_commands and self.coalesce_wait > 0:
+            session_manager = db.DbSessionManager()
+            try:
+                func(self.protocol, **func_flags)
+            finally:
+                coalesce.mark_mutation(os.path.join(session_manager.base_dir, 'coalesce'))
+        else:
+            func(self.protocol, **func_flags)
+
+    def serve_rpc(self, instream=None, outstream=None):
+        """
+        Serve requests for the whole life of the ssh channel, reusing the same ServerAPIs instance.
+        Each request is a json line {"id": ..., "command": ..., "args": {...}}, each response a json line
+        {"id": ..., "status": <exit code>, "output": <command stdout>, "error": <command stderr>}.
+        The responses are written on outstream, by default a copy of stdout: stdout itself is then
+        redirected to stderr, bin/server does it before configuring the logging. The console logging
+        configured by the commands ( ServerManager.init ) goes to stderr as well, so nothing else
+        can corrupt the responses stream.
+        """
+        if instream is None:
+            instream = sys.stdin
+        if outstream is None:
+            sys.stdout.flush()
+            outstream = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+            os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+        self._stderr_logging()
+        logger.debug("serving rpc requests")
+
+        for line in iter(instream.readline, ''):
+            line = line.strip()
+            if not line:
+                continue
+            response = {'id': None, 'status': 0, 'output': '', 'error': ''}
+            try:
+                request = json.loads(line)
+                response['id'] = request.get('id', None)
+                command = request.get('command', '')
+                if command not in self.functions:
+                    raise ValueError("command " + str(command) + " undefined")
+                args = request.get('args', dict())
+                func_flags = dict()
+                for parameter in self.functions[command][1]:
+                    if args.get(parameter, '') != '':
+                        func_flags[parameter] = str(args[parameter])
+            except Exception as e:
+                response['status'] = 1
+                response['error'] = "invalid rpc request: " + str(e)
+            else:
+                response['status'], response['output'], response['error'] = self._captured(command, func_flags)
+            outstream.write(json.dumps(response) + '\n')
+            outstream.flush()
+        logger.debug("rpc input closed")
+
+    @staticmethod
+    def _stderr_logging():
+        # the logging configuration is applied by the first command, while its stdout and stderr
+        # are captured: point the console handlers to the process stderr instead
+        configuration = config.getConfig('default')
+        handlers = configuration.configuration.get('logging_configs', dict()).get('handlers', dict())
+        for handler in handlers.values():
+            if handler.get('stream', '') in ('ext://sys.stdout', 'ext://sys.stderr'):
+                handler['stream'] = 'ext://sys.__stderr__'
+
+    @staticmethod
+    def _release_handlers(captured, stream):
+        # stream handlers created on the captured buffers ( logging configured with other streams )
+        # would keep on writing in them after the command
+        loggers = [logging.getLogger()] + list(logging.Logger.manager.loggerDict.values())
+        for log in loggers:
+            for handler in getattr(log, 'handlers', []):
+                if isinstance(handler, logging.StreamHandler) and handler.stream in captured:
+                    handler.stream = stream
+
+    def _captured(self, command, func_flags):
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = StringIO(), StringIO()
+        status = 0
+        try:
+            self.dispatch(command, func_flags)
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            status = 1
+            sys.stderr.write("%s: %s RCM:EXCEPTION" % (format(e), traceback.format_exc()))
+        finally:
+            self._release_handlers((sys.stdout, sys.stderr), stderr)
+            output, error = sys.stdout.getvalue(), sys.stderr.getvalue()
+            sys.stdout, sys.stderr = stdout, stderr
+        return status, output, error
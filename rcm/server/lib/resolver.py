@@ -0,0 +1,179 @@
+# Resolve the external name of the login node on a given subnet.
+# Interfaces are read from the SIOCGIFCONF ioctl (IPv4) and /proc/net/if_inet6 (IPv6),
+# reverse DNS lookups run in parallel with a global deadline and their results are kept
+# in a small on-disk json cache with a time to live, shorter for the lookups without an answer.
+
+import os
+import re
+import json
+import time
+import socket
+import tempfile
+import threading
+import binascii
+import logging
+
+import enumerate_interfaces
+
+logger = logging.getLogger('rcmServer' + '.' + __name__)
+
+proc_if_inet6 = '/proc/net/if_inet6'
+
+
+def ipv6_interfaces():
+    ifaces = []
+    try:
+        with open(proc_if_inet6, 'r') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 6:
+                    addr = socket.inet_ntop(socket.AF_INET6, binascii.unhexlify(fields[0]))
+                    ifaces.append((fields[5], addr))
+    except (IOError, OSError, ValueError) as e:
+        logger.debug("unable to read ipv6 interfaces from %s: %s", proc_if_inet6, e)
+    return ifaces
+
+
+def all_addresses():
+    """
+    Return the list of (interface name, address) of all the IPv4 and IPv6 interfaces
+    """
+    try:
+        ifaces = enumerate_interfaces.all_interfaces()
+    except (IOError, OSError) as e:
+        logger.warning("unable to enumerate ipv4 interfaces: " + str(e))
+        ifaces = []
+    return ifaces + ipv6_interfaces()
+
+
+def _definitive(error):
+    # the resolver answered that the address has no name, as opposed to a temporary failure
+    if isinstance(error, socket.gaierror):
+        return error.errno != getattr(socket, 'EAI_AGAIN', None)
+    if isinstance(error, socket.herror):
+        # h_errno TRY_AGAIN
+        return error.errno != 2
+    return False
+
+
+def reverse_lookup(addresses, timeout=2.0):
+    """
+    Run gethostbyaddr on all the addresses concurrently and wait at most timeout seconds overall.
+    Returns a dict address -> name of the definitive answers, name is None when the resolver answered
+    that the address has no name. Addresses whose lookup failed temporarily, or did not complete
+    in time, are missing.
+    Lookups run on daemon threads, so a hanging resolver never delays the process exit.
+    """
+    results = dict()
+
+    def lookup(address):
+        try:
+            results[address] = socket.gethostbyaddr(address)[0]
+        except Exception as e:
+            logger.warning("ERROR {0}: in reverse lookup of ip->".format(e) + address + "<")
+            if _definitive(e):
+                results[address] = None
+
+    threads = []
+    for address in addresses:
+        t = threading.Thread(target=lookup, args=(address,))
+        t.daemon = True
+        t.start()
+        threads.append(t)
+
+    deadline = time.time() + timeout
+    for t in threads:
+        t.join(max(0.0, deadline - time.time()))
+
+    out = dict()
+    for address, t in zip(addresses, threads):
+        if t.is_alive():
+            logger.warning("reverse lookup of ip->" + address + "< timed out after " + str(timeout) + " s")
+        elif address in results:
+            out[address] = results[address]
+    return out
+
+
+class ResolverCache:
+    """
+    address -> name cache stored as json, entries older than ttl seconds, or than their own ttl
+    if set, are ignored.
+    Failed lookups are cached too, so a broken reverse DNS costs the timeout once per ttl.
+    """
+
+    def __init__(self, path='', ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self.entries = dict()
+        self.changed = False
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self.entries = json.load(f)
+            except (IOError, OSError, ValueError) as e:
+                logger.warning("ignoring unreadable resolver cache " + self.path + ": " + str(e))
+                self.entries = dict()
+
+    def get(self, address):
+        """
+        Return (found, name)
+        """
+        entry = self.entries.get(address, None)
+        if entry and time.time() - entry[1] < (entry[2] if len(entry) > 2 else self.ttl):
+            return True, entry[0]
+        return False, None
+
+    def set(self, address, name, ttl=None):
+        self.entries[address] = [name, time.time()] if ttl is None else [name, time.time(), ttl]
+        self.changed = True
+
+    def save(self):
+        if not self.path or not self.changed:
+            return
+        try:
+            cache_dir = os.path.dirname(self.path)
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.entries, f)
+            os.rename(tmp_path, self.path)
+            self.changed = False
+        except (IOError, OSError) as e:
+            logger.warning("unable to write resolver cache " + self.path + ": " + str(e))
+
+
+def external_name(subnet, cache_path='', ttl=3600, timeout=2.0, retry_ttl=60):
+    """
+    Return the name of the first interface whose address is in subnet, or None.
+    The lookups without a definitive answer ( timed out ) are cached as failed for retry_ttl seconds only.
+    """
+    logger.debug("external_name subnet %s", subnet)
+    addresses = [addr for iface, addr in all_addresses() if re.match('^' + subnet, addr)]
+    if not addresses:
+        return None
+
+    cache = ResolverCache(path=cache_path, ttl=ttl)
+    names = dict()
+    to_lookup = []
+    for address in addresses:
+        found, name = cache.get(address)
+        if found:
+            names[address] = name
+        else:
+            to_lookup.append(address)
+
+    if to_lookup:
+        answers = reverse_lookup(to_lookup, timeout=timeout)
+        for address in to_lookup:
+            if address in answers:
+                names[address] = answers[address]
+                cache.set(address, answers[address])
+            else:
+                cache.set(address, None, ttl=retry_ttl)
+        cache.save()
+
+    for address in addresses:
+        if names.get(address):
+            return names[address]
+    return None
@@ -14,6 +14,7 @@ import json
 # local import
 import plugin
 import utils
+import jobs_snapshot
 
 
 logger = logging.getLogger('rcmServer' + '.' + __name__)
@@ -28,7 +29,7 @@ def convert_memory_to_megabytes(mem_string):
 #        return {'G' : 1024, 'M' : 1}.get(mem_string[-1:], 0) * int(mem_string[:-1])
     except:
         megabytes = 2048
-        logger.info("error in matching-->"+mem_string+"<-->"+str(unity)+"<>"+str(value)+"<--")
+        logger.info("error in matching-->%s<-->%s<>%s<--", mem_string, unity, value)
         #return 0
     return megabytes
 
@@ -55,6 +56,12 @@ class Scheduler(plugin.Plugin):
     def get_user_jobs(self, username=''):
         raise NotImplementedError()
 
+    def get_all_jobs(self):
+        """
+        Return a snapshot of the jobs of all users as a dict jobid -> state
+        """
+        raise NotImplementedError()
+
     def kill_job(self, jobid=''):
         raise NotImplementedError()
 
@@ -69,19 +76,19 @@ class Scheduler(plugin.Plugin):
                     f.write(script)
             if jobfile_executable:
                 os.chmod(jobfile, stat.S_IRWXU)
-            self.logger.info(self.__class__.__name__ + " " + self.NAME + " submitting " + jobfile)
+            self.logger.info("%s %s submitting %s", self.__class__.__name__, self.NAME, jobfile)
 
             batch = self.COMMANDS.get(batch_command, None)
             if batch:
                 raw_output = batch(jobfile,
                                    output=str)
-                self.logger.debug("generic_submit raw_output: " + raw_output)
+                self.logger.debug("generic_submit raw_output: %s", raw_output)
                 jobid_regex = self.templates.get('JOBID_REGEX', "Submitted  (\d*)")
-                self.logger.debug("generic_submit jobid_regex " + jobid_regex)
+                self.logger.debug("generic_submit jobid_regex %s", jobid_regex)
                 r = re.match(jobid_regex, raw_output)
                 if (r):
                     jobid = r.group(1)
-                    self.logger.info("scheduler: " + self.NAME + " jobid: " + str(jobid))
+                    self.logger.info("scheduler: %s jobid: %s", self.NAME, jobid)
                     return jobid
                 else:
                     raise Exception("Unable to extract jobid from output: %s" % raw_output)
@@ -141,7 +148,7 @@ class OSScheduler(Scheduler):
             params = []
             if username:
                 params.extend(('-u ' + username).split(' '))
-            self.logger.debug("params " + str(params))
+            self.logger.debug("params %s", params)
             raw_output = ps(*params,
                             output=str)
 
@@ -151,10 +158,24 @@ class OSScheduler(Scheduler):
             for jline in raw:
                 processid = jline.lstrip().split(' ')[0]
                 jid = self.prefix + str(processid)
-                self.logger.debug("job_id " + str(jid))
+                self.logger.debug("job_id %s", jid)
                 jobs[jid] = jline
             return jobs
 
+    def get_all_jobs(self):
+        ps = self.COMMANDS.get('ps', None)
+        if ps:
+            params = '-e -o pid=,stat='.split(' ')
+            raw_output = ps(*params,
+                            output=str)
+
+            jobs = {}
+            for jline in filter(None, raw_output.split('\n')):
+                fields = jline.split()
+                if len(fields) == 2:
+                    jobs[self.prefix + fields[0]] = fields[1]
+            return jobs
+
     def kill_job(self, jobid=''):
         """
         kill the process that has been launched ( jobid ) and all it's children,
@@ -162,7 +183,7 @@ class OSScheduler(Scheduler):
         https://stackoverflow.com/questions/392022/whats-the-best-way-to-send-a-signal-to-all-members-of-a-process-group/15139734#15139734
         """
 
-        self.logger.debug("Scheduler: " + self.NAME + "asked to kill_job: " + jobid)
+        self.logger.debug("Scheduler: %sasked to kill_job: %s", self.NAME, jobid)
         processid = jobid.split('.')[-1:][0]
         if processid:
             try:
@@ -170,7 +191,7 @@ class OSScheduler(Scheduler):
                 if ps:
                     params = ['opgid=', str(processid)]
                     process_group = ps(*params, output=str).strip()
-                    logger.debug("killing process_group: " + process_group)
+                    logger.debug("killing process_group: %s", process_group)
                     kill = self.COMMANDS.get('kill', None)
                     # it seems that in order to kill all process of a group, prepend the group with -
                     params = ['-TERM', '-' + process_group]
@@ -216,7 +237,7 @@ class SlurmScheduler(BatchScheduler):
                     self.COMMANDS['lua'] = None
                     self.delete_tempfile = lua_job_submit_options.get('delete_tempfile', True)
             except Exception as e:
-                logger.warning("Exception: " + str(e) + " in Slurm plugin options ")
+                logger.warning("Exception: %s in Slurm plugin options ", e)
 
         super(SlurmScheduler, self).__init__(*args, **kwargs)
         #self._cluster_name = self.get_cluster_name()
@@ -282,7 +303,7 @@ class SlurmScheduler(BatchScheduler):
             cluster_match = re.search(r'ClusterName\s*=\s*(\w*)', raw_output)
             if cluster_match:
                 cluster_name = cluster_match.group(1)
-                self.logger.debug("computed cluster name:::>" + cluster_name + "<:::")
+                self.logger.debug("computed cluster name:::>%s<:::", cluster_name)
         return cluster_name
 
 
@@ -292,7 +313,7 @@ class SlurmScheduler(BatchScheduler):
             sacctmgr = self.COMMANDS.get('sacctmgr', None)
             if sacctmgr:
                 param_string = "show user " + self.username + " " + "withass where cluster=" + self.cluster_name + " " + "format=account%20,qos%120 -P"
-                self.logger.debug("retrieving account and qos with command sacctmgr ::>" + param_string + "<::")
+                self.logger.debug("retrieving account and qos with command sacctmgr ::>%s<::", param_string)
                 params = param_string.split(' ')
                 raw_output = sacctmgr(*params, output=str)
                 for l in raw_output.splitlines()[1:]:
@@ -314,7 +335,7 @@ class SlurmScheduler(BatchScheduler):
         sacctmgr = self.COMMANDS.get('sacctmgr', None)
         if sacctmgr:
             param_string = "show qos format=Name%20,MaxWall%20,MaxTRES%40,Flags%60,MaxTRESPerNode%60 -P"
-            self.logger.debug("retrieving all qos info with command sacctmgr ::>" + param_string + "<::")
+            self.logger.debug("retrieving all qos info with command sacctmgr ::>%s<::", param_string)
             params = param_string.split(' ')
             raw_output = sacctmgr(*params, output=str)
             for l in raw_output.splitlines()[1:]:
@@ -335,7 +356,7 @@ class SlurmScheduler(BatchScheduler):
                             qos[name]['max_per_node_' + key]  = val
 
                 except Exception as e:
-                    self.logger.warning("Exception: " + str(e) + " in processing line:\n" + l)
+                    self.logger.warning("Exception: %s in processing line:\n%s", e, l)
 
         return qos
 
@@ -381,7 +402,7 @@ class SlurmScheduler(BatchScheduler):
                     if partitions[partition]['MaxCPUsPerNode'] == 'UNLIMITED':
                         partitions[partition]['MaxCPUsPerNode'] = cpu_string
                 except Exception as e:
-                    self.logger.warning("Exception: " + str(e) + " in processing line:\n" + l)
+                    self.logger.warning("Exception: %s in processing line:\n%s", e, l)
 
         return partitions
 
@@ -446,10 +467,10 @@ class SlurmScheduler(BatchScheduler):
                     tmp.flush()
                     params = [tmp.name]
                     raw_output = lua(*params, output=str)
-                    self.logger.debug("\n#######################\nlua plugin output-->\n" + raw_output + "\n#########################")
+                    self.logger.debug("\n#######################\nlua plugin output-->\n%s\n#########################", raw_output)
                     return json.loads(raw_output)
             except Exception as e:
-                self.logger.warning("Exception: " + str(e) + " in lua processing")
+                self.logger.warning("Exception: %s in lua processing", e)
                 return dict()
         return dict()
 
@@ -570,7 +591,7 @@ class SlurmScheduler(BatchScheduler):
 
                 for reservation,reservation_partition in self.valid_reservations_partitions(account):
                     if reservation in partitions_schema:
-                        self.logger.warning("Reservation named as partition: " + str(reservation) + " skipping" )
+                        self.logger.warning("Reservation named as partition: %s skipping", reservation)
                     else:
                         #forcefully add a substitution entry 'QUEUE_NAME' equal to partition
                         #old#reservation_schema = copy.deepcopy(partitions_schema.get(reservation_partition,  OrderedDict()))
@@ -599,13 +620,33 @@ class SlurmScheduler(BatchScheduler):
     def submit(self, script='', jobfile=''):
         return self.generic_submit(script=script, jobfile=jobfile, batch_command='sbatch')
 
+    def jobs_snapshot_options(self):
+        """
+        Path and max age of the shared jobs snapshot published by bin/jobs_snapshot, if configured
+        """
+        snapshot_options = self.options.get('jobs_snapshot', dict())
+        return os.path.expandvars(snapshot_options.get('file', '')), snapshot_options.get('max_age', 30)
+
     def get_user_jobs(self, username=''):
+        # read the jobs from the shared snapshot when it is fresh
+        snapshot_file, max_age = self.jobs_snapshot_options()
+        if snapshot_file and username:
+            snapshot_jobs = jobs_snapshot.read_user_jobs(snapshot_file, username, max_age=max_age)
+            if snapshot_jobs is not None:
+                self.logger.debug("using jobs snapshot %s", snapshot_file)
+                jobs = {}
+                for jobid, state, name in snapshot_jobs:
+                    if self.NAME in name:
+                        jobs[jobid] = name
+                return jobs
+            self.logger.debug("jobs snapshot %s not available, querying squeue", snapshot_file)
+
         squeue = self.COMMANDS.get('squeue', None)
         if squeue:
             params = '-o %i#%t#%j#%a -h -a'.split(' ')
             if username:
                 params.extend(('-u ' + username).split(' '))
-                self.logger.debug("squeue params " + str(params))
+                self.logger.debug("squeue params %s", params)
             raw_output = squeue(*params,
                                 output=str)
 
@@ -613,26 +654,54 @@ class SlurmScheduler(BatchScheduler):
             raw = raw_output.split('\n')
             # logger.debug("raw output lines:\n" + str(raw))
             jobs = {}
+            debug = self.logger.isEnabledFor(logging.DEBUG)
             for j in raw:
-                self.logger.debug("jobline: " + str(j))
                 mo = j.split('#')
-                self.logger.debug("mo split #" + str(len(mo)) + " " + ' '.join(str(p) for p in mo))
+                if debug:
+                    self.logger.debug("jobline: %s", j)
+                    self.logger.debug("mo split #%d %s", len(mo), ' '.join(str(p) for p in mo))
                 if len(mo) == 4 and check_rcm_job_string in mo[2]:
                     sid = mo[0]
                     jobs[sid] = mo[2]
             return jobs
 
+    def get_all_jobs(self):
+        check_rcm_job_string = self.NAME
+        # the admin listings read the shared snapshot too, when it is fresh
+        snapshot_file, max_age = self.jobs_snapshot_options()
+        if snapshot_file:
+            snapshot_jobs = jobs_snapshot.read_all_jobs(snapshot_file, max_age=max_age)
+            if snapshot_jobs is not None:
+                self.logger.debug("using jobs snapshot %s", snapshot_file)
+                return dict((jobid, state) for user, jobid, state, name in snapshot_jobs
+                            if check_rcm_job_string in name)
+            self.logger.debug("jobs snapshot %s not available, querying squeue", snapshot_file)
+
+        squeue = self.COMMANDS.get('squeue', None)
+        if squeue:
+            params = '-o %i#%t#%j#%u -h -a'.split(' ')
+            raw_output = squeue(*params,
+                                output=str)
+
+            jobs = {}
+            for j in raw_output.split('\n'):
+                mo = j.split('#')
+                if len(mo) == 4 and check_rcm_job_string in mo[2]:
+                    jobs[mo[0]] = mo[1]
+            self.logger.debug("squeue snapshot: %d rcm jobs", len(jobs))
+            return jobs
+
     def kill_job(self, jobid=''):
-        self.logger.debug("Scheduler: " + self.NAME + "asked to kill_job: " + jobid)
+        self.logger.debug("Scheduler: %sasked to kill_job: %s", self.NAME, jobid)
         if jobid:
             try:
                 scancel = self.COMMANDS.get('scancel', None)
                 if scancel:
                     params = [str(jobid)]
                     out = scancel(*params, output=str)
-                    self.logger.debug("removed job: " + str(jobid) + " output:\n" + out)
+                    self.logger.debug("removed job: %s output:\n%s", jobid, out)
                     return True
             except Exception as e:
-                self.logger.warning("Exception: " + str(e) + " in killing job " + str(jobid))
+                self.logger.warning("Exception: %s in killing job %s", e, jobid)
                 sys.stderr.write("Can not kill  job: %s." % jobid)
         return False
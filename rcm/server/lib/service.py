@@ -1,5 +1,6 @@
 #
 import logging
+import json
 import re
 import os
 import time
@@ -36,7 +37,26 @@ class Service(plugin.Plugin):
             for t in self.templates:
                 self.logger.debug("plugin template: " + t + "--->" + str(self.templates[t]) + "<--")
 
-    def search_logfile(self, logfile, regex_list=None, regex_list_key='START_REGEX_LIST', wait=1, timeout=0, timeout_key='TIMEOUT'):
+    def read_ready_file(self, ready_file):
+        """
+        The readiness record ( node, display, port, pid, timestamps ) the job script writes once
+        the service is listening, None if not written yet
+        """
+        try:
+            with open(ready_file, 'r') as f:
+                ready = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if isinstance(ready, dict):
+            return ready
+        return None
+
+    def search_logfile(self, logfile, regex_list=None, regex_list_key='START_REGEX_LIST', wait=1, timeout=0, timeout_key='TIMEOUT',
+                       ready_file=''):
+        """
+        Wait for the readiness file, if given, and look for the regex in logfile as fallback,
+        for the templates that do not write it. The log is searched again only when it grows.
+        """
         if regex_list == None:
             regex_list = self.templates.get(regex_list_key, [])
         try:
@@ -44,7 +64,7 @@ class Service(plugin.Plugin):
         except:
             timeout = 100
 
-        if logfile and regex_list:
+        if ready_file or (logfile and regex_list):
             regex_clist = []
             for regex_string in regex_list:
                 self.logger.debug("compiling regex: -->"+ str(regex_string) + "<--")
@@ -52,23 +72,29 @@ class Service(plugin.Plugin):
 
             secs = 0
             step = wait
+            log_size = -1
             while (secs < timeout):
-                if os.path.isfile(logfile):
-                    #print(secs, "logfile:", logfile,)
-                    f=open(logfile,'r')
-                    with open(logfile, 'r') as f:
-                        log_string=f.read()
-                    #print("log_string:\n", log_string)
-                    for r in regex_clist:
-                        x = r.search(log_string)
-                        if x:
-                            return x.groupdict()
+                if ready_file:
+                    ready = self.read_ready_file(ready_file)
+                    if ready:
+                        self.logger.debug("found ready file %s: %s", ready_file, ready)
+                        return ready
+                if logfile and regex_clist and os.path.isfile(logfile):
+                    size = os.path.getsize(logfile)
+                    if size != log_size:
+                        log_size = size
+                        with open(logfile, 'r') as f:
+                            log_string=f.read()
+                        for r in regex_clist:
+                            x = r.search(log_string)
+                            if x:
+                                return x.groupdict()
                 secs+=step
                 time.sleep(step)
             raise Exception("Timeouted (%d seconds) job not correcty running!!!" % (timeout) )
         raise Exception("Unable to search_logfile: %s with regex %s" % (logfile, str(regex_list)))
 
-    def search_port(self, logfile='', timeout=0):
+    def search_port(self, logfile='', timeout=0, ready_file=''):
         raise NotImplementedError()
 
 
@@ -108,13 +134,13 @@ class VncService(ScreenService):
                          'vncserver': None}
         super(VncService, self).__init__(*args, **kwargs)
 
-    def search_port(self, logfile='', timeout=0):
+    def search_port(self, logfile='', timeout=0, ready_file=''):
         for t in self.templates:
             self.logger.debug("Searching port, plugin template: "+ t+ "--->"+str(self.templates[t])+"<--")
-        groupdict = self.search_logfile(logfile, timeout=timeout)
+        groupdict = self.search_logfile(logfile, timeout=timeout, ready_file=ready_file)
         res_dict = dict()
         for k in groupdict:
-            self.logger.debug("searching port, key: " + k + " ==> " + groupdict[k])
+            self.logger.debug("searching port, key: " + k + " ==> " + str(groupdict[k]))
             if k == 'display' :
                 res_dict[k] = int(groupdict[k])
                 res_dict['port'] =  5900 + int(groupdict[k])
@@ -0,0 +1,103 @@
+# Per user snapshot of the jobscript tree.
+# Building ServerManager.root_node asks every scheduler plugin for its parameters ( accounts, partitions,
+# qos... through the scheduler commands ), so the built tree is pickled in the user .rcm folder and reused
+# by the following config and new requests while it is younger than max_age seconds and the fingerprint
+# of configuration and loaded plugins is unchanged.
+# Plugin objects are not stored, the ManagedPlugin nodes are bound again to the live ones after loading.
+
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import tempfile
+import logging
+
+logger = logging.getLogger('rcmServer' + '.' + __name__)
+
+# bump when the stored layout changes
+snapshot_version = 1
+
+
+def _module_mtime(module_name):
+    module = sys.modules.get(module_name, None)
+    try:
+        return os.path.getmtime(module.__file__)
+    except (AttributeError, TypeError, OSError):
+        return None
+
+
+def plugin_descriptor(plugin):
+    return [plugin.__class__.__module__,
+            plugin.__class__.__name__,
+            _module_mtime(plugin.__class__.__module__),
+            getattr(plugin, 'NAME', None),
+            getattr(plugin, 'options', None),
+            getattr(plugin, 'COMMANDS', None)]
+
+
+def fingerprint(configuration, plugin_collections):
+    """
+    Digest of the merged configuration, of the plugins in plugin_collections ( dicts of name -> plugin object )
+    and of the tree building code
+    """
+    state = [snapshot_version,
+             _module_mtime('jobscript_builder'),
+             configuration,
+             [[plugin_descriptor(plugins[name]) for name in sorted(plugins)] for plugins in plugin_collections]]
+    normalized = json.dumps(state, default=str)
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def save(path, root_node, key, client_info=None):
+    """
+    Atomically replace path with the pickled tree, readable by the owner only
+    """
+    snapshot_dir = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(snapshot_dir):
+        os.makedirs(snapshot_dir)
+    fd, tmp_path = tempfile.mkstemp(dir=snapshot_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({'version': snapshot_version,
+                         'fingerprint': key,
+                         'client_info': client_info if client_info else dict(),
+                         'timestamp': time.time(),
+                         'root_node': root_node}, f, pickle.HIGHEST_PROTOCOL)
+        os.chmod(tmp_path, 0o600)
+        os.rename(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logger.debug("written jobscript tree snapshot %s", path)
+
+
+def load(path, key, client_info=None, max_age=600):
+    """
+    Return the stored root node, or None if the snapshot is missing, older than max_age seconds
+    or built from a different configuration.
+    The client_info the tree was built with must match, unless no client_info is given
+    ( the new command does not receive it and has to use the tree shown by the client ).
+    """
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+    except (IOError, OSError):
+        return None
+    except Exception as e:
+        logger.warning("invalid jobscript tree snapshot " + path + ": " + str(e))
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('version', None) != snapshot_version:
+        return None
+    if time.time() - snapshot.get('timestamp', 0) > max_age:
+        logger.debug("jobscript tree snapshot %s is stale", path)
+        return None
+    if snapshot.get('fingerprint', None) != key:
+        logger.debug("jobscript tree snapshot %s was built from a different configuration", path)
+        return None
+    if client_info and snapshot.get('client_info', None) != client_info:
+        logger.debug("jobscript tree snapshot %s was built for a different client", path)
+        return None
+    return snapshot.get('root_node', None)
@@ -5,6 +5,7 @@ import datetime
 import sys
 import os
 import logging
+from collections import OrderedDict
 
 logger = logging.getLogger('RCM.protocol')
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -15,6 +16,99 @@ if sys.version_info >= (3, 0):
 
 serverOutputString = "server output->"
 
+# jobscript menu encoding where the repeated subtrees are sent once
+shared_menu_encoding = 'shared_subtrees'
+shared_ref_key = '$ref'
+
+
+def _subtree_keys(node, keys, counts):
+    # canonical json of every dict and list, built bottom up, keys order included
+    if isinstance(node, dict):
+        key = '{' + ','.join(json.dumps(k) + ':' + _subtree_keys(v, keys, counts) for k, v in node.items()) + '}'
+    elif isinstance(node, list):
+        key = '[' + ','.join(_subtree_keys(v, keys, counts) for v in node) + ']'
+    else:
+        return json.dumps(node)
+    keys[id(node)] = key
+    counts[key] = counts.get(key, 0) + 1
+    return key
+
+
+def share_subtrees(tree, min_length=32):
+    """
+    Encode the jobscript menu moving the dicts found more than once, and longer than min_length
+    once serialized, in a shared table: every occurrence is replaced by {'$ref': index in the table}.
+    Only dicts that are values of a dict are replaced, the table entries are encoded in the same way.
+    """
+    keys = dict()
+    counts = dict()
+    _subtree_keys(tree, keys, counts)
+    table = []
+    indexes = dict()
+
+    def encode(node):
+        if isinstance(node, dict):
+            encoded = OrderedDict()
+            for k, v in node.items():
+                if isinstance(v, dict):
+                    key = keys[id(v)]
+                    if counts[key] > 1 and len(key) >= min_length:
+                        if key not in indexes:
+                            entry = encode(v)
+                            indexes[key] = len(table)
+                            table.append(entry)
+                        encoded[k] = {shared_ref_key: indexes[key]}
+                        continue
+                encoded[k] = encode(v)
+            return encoded
+        if isinstance(node, list):
+            return [encode(v) for v in node]
+        return node
+
+    encoded_tree = encode(tree)
+    return OrderedDict([('encoding', shared_menu_encoding), ('shared', table), ('tree', encoded_tree)])
+
+
+class shared_tree(OrderedDict):
+    """
+    Ordered dict of a menu decoded by load_json_menu: the values referencing the shared table are
+    resolved, and replaced by the shared entry, when first accessed.
+    Read it through its methods ( [], get, items, values ): json.dumps and the dict C api see the references.
+    """
+    def __init__(self, pairs=(), table=None):
+        OrderedDict.__init__(self, pairs)
+        self.table = table
+
+    def __getitem__(self, key):
+        value = OrderedDict.__getitem__(self, key)
+        if isinstance(value, dict) and len(value) == 1 and shared_ref_key in value and self.table is not None:
+            value = self.table[OrderedDict.__getitem__(value, shared_ref_key)]
+            OrderedDict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def items(self):
+        return [(k, self[k]) for k in self]
+
+    def values(self):
+        return [self[k] for k in self]
+
+
+def load_json_menu(json_string):
+    """
+    Decode the jobscript menu, plain or encoded by share_subtrees, to nested ordered dicts
+    """
+    table = []
+    menu = json.loads(json_string, object_pairs_hook=lambda pairs: shared_tree(pairs, table))
+    if isinstance(menu, dict) and menu.get('encoding', None) == shared_menu_encoding:
+        table.extend(menu.get('shared', []))
+        menu = menu.get('tree', shared_tree())
+    return menu
+
 
 class rcm_session:
     def __init__(self,
@@ -107,8 +201,10 @@ class rcm_session:
         elif format == 'json_indent':
             return json.dumps(self.hash, indent=4)
 
-    def write(self, outstream=sys.stdout):
+    def write(self, outstream=None):
         logger.debug("Write session rcm_session.write")
+        if outstream is None:
+            outstream = sys.stdout
         outsring = self.get_string()
         outstream.write(serverOutputString)
         outstream.write(outsring)
@@ -174,8 +270,10 @@ class rcm_sessions:
             out_sess.append(s)
         return out_sess
 
-    def write(self, outstream=sys.stdout):
+    def write(self, outstream=None):
         logger.debug("Write sessions rcm_sessions.write ")
+        if outstream is None:
+            outstream = sys.stdout
         outsring = self.get_string()
         outstream.write(serverOutputString)
         outstream.write(outsring)
@@ -0,0 +1,118 @@
+# Server latency with logging at INFO and at DEBUG level.
+# Every round runs in a fresh process, as a real server invocation does, and times:
+#   config: yaml configuration loading, plugin loading, jobscript tree and json menu building
+#   new:    substitution of the first choices of the menu and job script rendering ( nothing is submitted )
+# Log records are formatted and written to /dev/null, the jobscript tree snapshot is not used.
+#
+# python benchmark_logging.py [--rounds 10] [--config_paths etc/test_hierarchical/slurm_gres ...]
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+current_path = os.path.dirname(os.path.abspath(__file__))
+server_path = os.path.dirname(current_path)
+rcm_root_path = os.path.dirname(server_path)
+
+default_config_paths = [os.path.join(current_path, 'etc', 'test_hierarchical', p)
+                        for p in ('slurm_gres', 'network', 'other')]
+
+
+def set_levels(level):
+    logging.getLogger().setLevel(level)
+    for name, item in list(logging.Logger.manager.loggerDict.items()):
+        if isinstance(item, logging.Logger):
+            item.setLevel(level)
+            for handler in item.handlers:
+                handler.setLevel(level)
+
+
+def first_choices(menu, prefix=''):
+    # pick the first value of every choice, following the selected branch
+    choices = dict()
+    for name, options in menu.items():
+        if not isinstance(options, dict):
+            continue
+        key = prefix + name
+        values = options.get('values', None)
+        if isinstance(values, dict) and values:
+            selected = list(values.keys())[0]
+            choices[key] = selected
+            if isinstance(values[selected], dict):
+                choices.update(first_choices(values[selected].get('children', values[selected]), key + '.'))
+        elif 'children' in options:
+            choices.update(first_choices(options['children'], key + '.'))
+    return choices
+
+
+def run_round(level, config_paths):
+    sys.path.insert(0, server_path)
+    sys.path.insert(0, os.path.join(server_path, 'lib'))
+    sys.path.insert(0, rcm_root_path)
+    logging.basicConfig(stream=open(os.devnull, 'w'))
+    set_levels(level)
+
+    start = time.perf_counter()
+    import config
+    import manager
+    import utils
+    config.getConfig('default', tuple(config_paths))
+    config.dict_paths['default'].configuration['jobscript_cache'] = {'max_age': 0}
+    server_manager = manager.ServerManager()
+    server_manager.init()
+    # the logging configuration of the server has just been applied, override its levels
+    set_levels(level)
+    menu = json.loads(server_manager.get_jobscript_json_menu())
+    config_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    server_manager.handle_choices(json.dumps(first_choices(menu)))
+    script = utils.render_template(server_manager.top_templates.get('SCRIPT', ''),
+                                   {'RCM_SESSIONID': 'benchmark-1'})
+    logging.getLogger('rcmServer.manager').info("job script content:\n%s", script)
+    new_time = time.perf_counter() - start
+    return config_time, new_time
+
+
+def median(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='server latency with logging at INFO and DEBUG level')
+    arg_parser.add_argument('--rounds', type=int, default=10)
+    arg_parser.add_argument('--config_paths', nargs='*', default=default_config_paths)
+    arg_parser.add_argument('--round', default=None, help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.round:
+        # child process: print the timings of a single round, the log handlers write to stdout
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        result = run_round(logging.getLevelName(args.round), args.config_paths)
+        stdout.write(json.dumps(result) + '\n')
+        return
+
+    results = dict()
+    for level in ('INFO', 'DEBUG'):
+        samples = []
+        for i in range(args.rounds):
+            out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--round', level,
+                                           '--config_paths'] + list(args.config_paths))
+            samples.append(json.loads(out.decode().strip().splitlines()[-1]))
+        results[level] = [median(s[0] for s in samples), median(s[1] for s in samples)]
+
+    print("{0:<8} {1:>12} {2:>12} {3:>8}".format('command', 'INFO ms', 'DEBUG ms', 'ratio'))
+    for index, command in enumerate(('config', 'new')):
+        info, debug = results['INFO'][index], results['DEBUG'][index]
+        print("{0:<8} {1:>12.1f} {2:>12.1f} {3:>8.2f}".format(command, info * 1000, debug * 1000,
+                                                               debug / max(info, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
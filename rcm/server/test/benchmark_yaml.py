@@ -0,0 +1,78 @@
+# YAML parse time of the shipped configuration files with the loaders of hiyapyco:
+#   python: the pure python PyYAML loader ( odyldo.ODYL )
+#   libyaml: the libyaml based parser, if the PyYAML in use has it ( odyldo.ODYCL ): the vendored one is
+#            pure python, an installed PyYAML with libyaml is used in its place
+# Every file is read once and parsed from memory, the parsed data of the two loaders is checked to be the same.
+#
+# python benchmark_yaml.py [--rounds 10] [--paths etc/defaults etc/test_hierarchical ...]
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+current_path = os.path.dirname(os.path.abspath(__file__))
+server_path = os.path.dirname(current_path)
+rcm_root_path = os.path.dirname(server_path)
+
+sys.path.insert(0, rcm_root_path)
+
+from utils.external.hiyapyco import odyldo
+import yaml
+
+default_paths = [os.path.join(server_path, 'etc', 'defaults'),
+                 os.path.join(current_path, 'etc')]
+
+
+def yaml_files(paths):
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, '**', '*.yaml'), recursive=True)))
+    return files
+
+
+def parse_all(contents, loader):
+    return [yaml.load(content, loader) for content in contents]
+
+
+def median_time(contents, loader, rounds):
+    samples = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        parse_all(contents, loader)
+        samples.append(time.perf_counter() - start)
+    return sorted(samples)[len(samples) // 2]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='yaml parse time of the configuration files')
+    arg_parser.add_argument('--rounds', type=int, default=10)
+    arg_parser.add_argument('--paths', nargs='*', default=default_paths)
+    args = arg_parser.parse_args()
+
+    files = yaml_files(args.paths)
+    contents = []
+    for path in files:
+        with open(path, 'r') as f:
+            contents.append(f.read())
+    print("{0} files, {1} bytes".format(len(files), sum(len(c) for c in contents)))
+
+    loaders = [('python', odyldo.ODYL)]
+    if odyldo.ODYCL is not None:
+        loaders.append(('libyaml', odyldo.ODYCL))
+        if repr(parse_all(contents, odyldo.ODYL)) != repr(parse_all(contents, odyldo.ODYCL)):
+            print("WARNING: the loaders parsed different data")
+    else:
+        print("libyaml not found, only the pure python loader is timed")
+
+    reference = None
+    print("{0:<8} {1:>12} {2:>8}".format('loader', 'ms', 'speedup'))
+    for name, loader in loaders:
+        elapsed = median_time(contents, loader, args.rounds)
+        reference = reference or elapsed
+        print("{0:<8} {1:>12.1f} {2:>8.1f}".format(name, elapsed * 1000, reference / max(elapsed, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import unittest
+import os
+import sys
+import random
+from collections import OrderedDict
+
+# set prefix.
+current_file = os.path.realpath(os.path.expanduser(__file__))
+current_path = os.path.dirname(os.path.dirname(current_file))
+rcm_root_path = os.path.dirname(current_path)
+
+# Add lib folder in current prefix to default  import path
+current_lib_path = os.path.join(current_path, "lib")
+current_utils_path = os.path.join(rcm_root_path, "utils")
+
+sys.path.insert(0, current_path)
+sys.path.insert(0, current_lib_path)
+sys.path.insert(0, current_utils_path)
+
+from jobscript_builder import ChoiceTrie
+
+
+def route(choices, name):
+    # the key scan of AutoChoiceNode before the trie
+    return OrderedDict((k, v) for k, v in choices.items() if k.split('.')[0] == name)
+
+
+def strip_name(choices, name):
+    # the key scan of ManagerChoiceNode before the trie
+    out = OrderedDict()
+    for k, v in choices.items():
+        subkey = k.split('.')
+        if len(subkey) > 1 and subkey[0] == name:
+            out['.'.join(subkey[1:])] = v
+    return out
+
+
+class TestChoiceTrie(unittest.TestCase):
+    """
+    Routing the choices through the trie must give the keys, values and order of the key scans.
+    """
+    segments = ['A', 'B', 'C', '']
+
+    def random_choices(self, rng):
+        choices = OrderedDict()
+        for i in range(rng.randint(0, 12)):
+            key = '.'.join(rng.choice(self.segments) for _ in range(rng.randint(1, 4)))
+            choices[key] = str(i)
+        return choices
+
+    def assertSameScope(self, scope, reference):
+        self.assertEqual(list(scope.items()), list(reference.items()))
+        self.assertEqual(len(scope), len(reference))
+        for key in self.segments + ['A.B', 'B.', 'A.A.A', 'X']:
+            self.assertEqual(key in scope, key in reference, key)
+            self.assertEqual(scope.get(key, None), reference.get(key, None), key)
+
+    def test_random_routes(self):
+        rng = random.Random(0)
+        for i in range(2000):
+            choices = self.random_choices(rng)
+            scope, reference = ChoiceTrie(choices), choices
+            self.assertSameScope(scope, reference)
+            for depth in range(4):
+                name = rng.choice(self.segments)
+                if rng.random() < 0.5:
+                    scope, reference = scope.route(name), route(reference, name)
+                else:
+                    scope, reference = scope.strip_name(name), strip_name(reference, name)
+                self.assertSameScope(scope, reference)
+
+    def test_layers(self):
+        choices = ChoiceTrie(OrderedDict([('A', '1'), ('A.B', '2'), ('C', '3')]))
+        scope = choices.route('A').overlay(OrderedDict([('T', 't'), ('A', 'default')]))
+        self.assertEqual(list(scope.items()), [('T', 't'), ('A', '1'), ('A.B', '2')])
+        scope['T'] = 'written'
+        scope['A.B.C'] = '4'
+        self.assertEqual(list(scope.items()), [('T', 'written'), ('A', '1'), ('A.B', '2'), ('A.B.C', '4')])
+        # writes stay in their scope
+        self.assertNotIn('A.B.C', choices)
+        self.assertNotIn('A.B.C', choices.route('A'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import tempfile
+import threading
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# set prefix.
+current_file = os.path.realpath(os.path.expanduser(__file__))
+current_path = os.path.dirname(os.path.dirname(current_file))
+
+# Add lib folder in current prefix to default  import path
+current_lib_path = os.path.join(current_path, "lib")
+
+sys.path.insert(0, current_lib_path)
+
+import coalesce
+
+
+class TestSingleFlight(unittest.TestCase):
+    """
+    Only the requests arriving while an identical one is running, or within window seconds after it
+    completed, reuse its output, unless the state changed meanwhile.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.key = coalesce.request_key('user', 'list', {})
+        self.runs = 0
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        shutil.rmtree(self.folder)
+
+    def command(self):
+        self.runs += 1
+        sys.stdout.write('run %d' % self.runs)
+
+    def single_flight(self, window=0.5, wait=5.0):
+        sys.stdout = StringIO()
+        coalesce.single_flight(self.folder, self.key, self.command, window=window, wait=wait, poll=0.01)
+        return sys.stdout.getvalue()
+
+    def test_window(self):
+        self.assertEqual(self.single_flight(), 'run 1')
+        self.assertEqual(self.single_flight(), 'run 1')
+        time.sleep(0.6)
+        self.assertEqual(self.single_flight(), 'run 2')
+        self.assertEqual(self.single_flight(window=0), 'run 3')
+
+    def test_mutation(self):
+        self.assertEqual(self.single_flight(), 'run 1')
+        coalesce.mark_mutation(self.folder)
+        self.assertEqual(self.single_flight(), 'run 2')
+        self.assertEqual(self.single_flight(), 'run 2')
+
+    def test_running(self):
+        # an identical request holds the lock and completes after this one arrived
+        lock_file = open(os.path.join(self.folder, self.key + '.lock'), 'a')
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        started = time.time()
+
+        def complete():
+            with open(os.path.join(self.folder, self.key + '.json'), 'w') as f:
+                json.dump({'started': started, 'completed': time.time(), 'output': 'running request'}, f)
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            lock_file.close()
+
+        timer = threading.Timer(0.2, complete)
+        timer.start()
+        self.assertEqual(self.single_flight(window=0), 'running request')
+        timer.join()
+        self.assertEqual(self.runs, 0)
+
+    def test_lock_timeout(self):
+        with open(os.path.join(self.folder, self.key + '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            start = time.time()
+            self.assertEqual(self.single_flight(wait=0.2), 'run 1')
+            self.assertLess(time.time() - start, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import os
+import sys
+import glob
+import copy
+import random
+from collections import OrderedDict
+
+# set prefix.
+current_file = os.path.realpath(os.path.expanduser(__file__))
+current_path = os.path.dirname(os.path.dirname(current_file))
+rcm_root_path = os.path.dirname(current_path)
+
+sys.path.insert(0, rcm_root_path)
+
+from utils.external import hiyapyco
+from utils.external.hiyapyco import odyldo
+import yaml
+from jinja2 import Environment, Undefined
+
+
+class TestInterpolation(unittest.TestCase):
+    """
+    Strings without jinja markers are not compiled, the result must be the one of a compiled template.
+    """
+    chars = ['a', ' ', '1', '.', '\n', '\r', '\x0b', '\x85', '{', '}', '%', '#', 'b']
+
+    def test_plain_strings(self):
+        reference = Environment(undefined=Undefined)
+        rng = random.Random(0)
+        for i in range(5000):
+            s = ''.join(rng.choice(self.chars) for _ in range(rng.randint(0, 8)))
+            if hiyapyco._hasmarkers(s):
+                continue
+            self.assertEqual(hiyapyco._renderplain(s), reference.from_string(s).render(), repr(s))
+
+    def test_interpolate(self):
+        data = hiyapyco.load("a: '{{ b }}x'\n"
+                             "b: 3\n"
+                             "c: \"plain\\n\"\n"
+                             "d: ['{{ a }}', 'no {markers}']\n",
+                             interpolate=True, method=hiyapyco.METHOD_MERGE)
+        self.assertEqual(data['a'], '3x')
+        self.assertEqual(data['c'], 'plain')
+        self.assertEqual(data['d'], ['3x', 'no {markers}'])
+        self.assertIs(hiyapyco._compile('{{ b }}x'), hiyapyco._compile('{{ b }}x'))
+
+
+class TestDeepMerge(unittest.TestCase):
+    """
+    Property test: merging random documents all at once gives the same result,
+    or the same exception, of merging them one by one with the pairwise _deepmerge.
+    """
+    keys = ['a', 'b', 'c', 'd']
+    primitives = [0, 1, True, 1.0, 'x', 'y', '', None]
+
+    def random_value(self, rng, depth):
+        kind = rng.randint(0, 9 if depth > 0 else 3)
+        if kind < 4:
+            return rng.choice(self.primitives)
+        if kind < 7:
+            return OrderedDict((rng.choice(self.keys), self.random_value(rng, depth - 1))
+                               for _ in range(rng.randint(0, 3)))
+        return [self.random_value(rng, depth - 1) for _ in range(rng.randint(0, 4))]
+
+    def merge_both(self, docs):
+        merger = hiyapyco.HiYaPyCo.__new__(hiyapyco.HiYaPyCo)
+        results = []
+        for merge in (lambda d: merger._deepmergeall(d), self.pairwise(merger)):
+            try:
+                results.append(repr(merge(copy.deepcopy(docs))))
+            except hiyapyco.HiYaPyCoImplementationException:
+                results.append('HiYaPyCoImplementationException')
+        return results
+
+    @staticmethod
+    def pairwise(merger):
+        def merge(docs):
+            data = None
+            for doc in docs:
+                data = doc if data is None else merger._deepmerge(data, doc)
+            return data
+        return merge
+
+    def test_random_documents(self):
+        rng = random.Random(0)
+        for i in range(3000):
+            docs = [self.random_value(rng, 4) for _ in range(rng.randint(0, 5))]
+            allatonce, pairwise = self.merge_both(docs)
+            self.assertEqual(allatonce, pairwise, repr(docs))
+
+    def test_dict_documents(self):
+        # mostly dicts, as configuration files are
+        rng = random.Random(1)
+        for i in range(3000):
+            docs = [OrderedDict((rng.choice(self.keys), self.random_value(rng, 3)) for _ in range(4))
+                    for _ in range(rng.randint(1, 6))]
+            allatonce, pairwise = self.merge_both(docs)
+            self.assertEqual(allatonce, pairwise, repr(docs))
+
+
+@unittest.skipUnless(odyldo.__with_libyaml__, "libyaml not available")
+class TestLibyamlLoader(unittest.TestCase):
+    """
+    The libyaml loader must give the same ordered data of the pure python one.
+    """
+
+    def test_configuration_files(self):
+        files = glob.glob(os.path.join(current_path, '**', '*.yaml'), recursive=True)
+        self.assertTrue(files)
+        for path in files:
+            with open(path, 'r') as f:
+                content = f.read()
+            self.assertEqual(repr(yaml.load(content, odyldo.ODYCL)), repr(yaml.load(content, odyldo.ODYL)), path)
+
+    def test_documents(self):
+        for content in ["b: [1, 2.5, true, ~, '3', 0x1f]\na: {d: e, c: f}\n<<: {g: 1}\n",
+                        "- &x {b: 1, a: 2}\n- *x\n",
+                        "date: 2019-01-01\ntext: |\n  two\n  lines\n"]:
+            self.assertEqual(repr(yaml.load(content, odyldo.ODYCL)), repr(yaml.load(content, odyldo.ODYL)), content)
+        self.assertIsInstance(odyldo.safe_load("a: 1"), OrderedDict)
+        self.assertRaises(yaml.YAMLError, odyldo.safe_load, "a: [1")
+
+
+if __name__ == '__main__':
+    unittest.main()
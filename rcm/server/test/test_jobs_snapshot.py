@@ -0,0 +1,111 @@
+import unittest
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+# set prefix.
+current_file = os.path.realpath(os.path.expanduser(__file__))
+current_path = os.path.dirname(os.path.dirname(current_file))
+rcm_root_path = os.path.dirname(current_path)
+root_path = os.path.dirname(rcm_root_path)
+
+# Add lib folder in current prefix to default  import path
+current_lib_path = os.path.join(current_path, "lib")
+current_utils_path = os.path.join(rcm_root_path, "utils")
+
+sys.path.insert(0, current_path)
+sys.path.insert(0, current_lib_path)
+sys.path.insert(0, current_utils_path)
+sys.path.insert(0, rcm_root_path)
+
+import scheduler
+import jobs_snapshot
+
+
+class FakeSqueue(object):
+    """
+    Stands for the squeue executable, records its calls
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self.calls = []
+
+    def __call__(self, *params, **kwargs):
+        self.calls.append(params)
+        return self.output
+
+
+class TestJobsSnapshot(unittest.TestCase):
+    """
+    Users read their jobs from the shared snapshot while it is fresh, and query squeue
+    when it is missing or stale.
+    """
+    records = [('alice', '12', 'R', 'rcm-Slurm-a'),
+               ('bob', '7', 'PD', 'rcm-Slurm-b'),
+               ('al', '3', 'R', 'rcm-Slurm-c'),
+               ('alice', '10', 'R', 'other job'),
+               ('zed', '1', 'R', 'rcm-Slurm-z')]
+
+    def setUp(self):
+        # A fake slurm is needed in order to load the corresponding plugin
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = os.path.join(root_path, 'tests', 'fake_slurm') + os.pathsep + self.path
+        self.folder = tempfile.mkdtemp()
+        self.snapshot_file = os.path.join(self.folder, 'jobs_snapshot')
+        self.slurm = scheduler.SlurmScheduler(options={'jobs_snapshot': {'file': self.snapshot_file,
+                                                                         'max_age': 30}})
+        self.squeue = FakeSqueue("99#R#rcm-Slurm-live#account\n")
+        self.slurm.COMMANDS['squeue'] = self.squeue
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.folder)
+
+    def test_read_user_jobs(self):
+        jobs_snapshot.write_snapshot(self.snapshot_file, self.records)
+        self.assertEqual(jobs_snapshot.read_user_jobs(self.snapshot_file, 'alice'),
+                         [('10', 'R', 'other job'), ('12', 'R', 'rcm-Slurm-a')])
+        self.assertEqual(jobs_snapshot.read_user_jobs(self.snapshot_file, 'al'), [('3', 'R', 'rcm-Slurm-c')])
+        self.assertEqual(jobs_snapshot.read_user_jobs(self.snapshot_file, 'zed'), [('1', 'R', 'rcm-Slurm-z')])
+        self.assertEqual(jobs_snapshot.read_user_jobs(self.snapshot_file, 'nobody'), [])
+        self.assertEqual(sorted(jobs_snapshot.read_all_jobs(self.snapshot_file)), sorted(self.records))
+
+    def test_fresh(self):
+        jobs_snapshot.write_snapshot(self.snapshot_file, self.records, timestamp=time.time() - 20)
+        self.assertEqual(self.slurm.get_user_jobs('alice'), {'12': 'rcm-Slurm-a'})
+        self.assertEqual(self.slurm.get_all_jobs(), {'12': 'R', '7': 'PD', '3': 'R', '1': 'R'})
+        self.assertEqual(self.squeue.calls, [])
+
+    def test_expired(self):
+        jobs_snapshot.write_snapshot(self.snapshot_file, self.records, timestamp=time.time() - 40)
+        self.assertIsNone(jobs_snapshot.read_user_jobs(self.snapshot_file, 'alice'))
+        self.assertIsNone(jobs_snapshot.read_all_jobs(self.snapshot_file))
+        self.assertEqual(self.slurm.get_user_jobs('alice'), {'99': 'rcm-Slurm-live'})
+        self.assertEqual(len(self.squeue.calls), 1)
+        self.assertIn('alice', self.squeue.calls[0])
+
+    def test_missing(self):
+        self.assertIsNone(jobs_snapshot.read_user_jobs(self.snapshot_file, 'alice'))
+        self.assertEqual(self.slurm.get_user_jobs('alice'), {'99': 'rcm-Slurm-live'})
+        self.assertEqual(len(self.squeue.calls), 1)
+        # an empty or foreign file is not a snapshot either
+        for content in (b'', b'12#R#job\n'):
+            with open(self.snapshot_file, 'wb') as f:
+                f.write(content)
+            self.assertIsNone(jobs_snapshot.read_user_jobs(self.snapshot_file, 'alice'))
+            self.assertEqual(self.slurm.get_user_jobs('alice'), {'99': 'rcm-Slurm-live'})
+        self.assertEqual(len(self.squeue.calls), 3)
+
+    def test_broker(self):
+        squeue = FakeSqueue('\n'.join('#'.join(r) for r in self.records) + '\n')
+        jobs_snapshot.run_broker(self.snapshot_file, squeue, once=True)
+        self.assertEqual(squeue.calls, [tuple(jobs_snapshot.squeue_params)])
+        self.assertEqual(self.slurm.get_user_jobs('bob'), {'7': 'rcm-Slurm-b'})
+        self.assertEqual(self.squeue.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,115 @@
+import unittest
+import os
+import sys
+import io
+import json
+import shutil
+import tempfile
+
+# set prefix.
+current_file = os.path.realpath(os.path.expanduser(__file__))
+current_path = os.path.dirname(os.path.dirname(current_file))
+rcm_root_path = os.path.dirname(current_path)
+root_path = os.path.dirname(rcm_root_path)
+
+# Add lib folder in current prefix to default  import path
+current_lib_path = os.path.join(current_path, "lib")
+current_utils_path = os.path.join(rcm_root_path, "utils")
+
+sys.path.insert(0, current_path)
+sys.path.insert(0, current_lib_path)
+sys.path.insert(0, current_utils_path)
+
+import rcm
+import api
+import db
+import config
+import manager
+import scheduler
+import jobs_snapshot
+
+
+class TestListAll(unittest.TestCase):
+    """
+    list_all streams one NDJSON record per session of every user, without the vnc credentials,
+    joined with the shared jobs snapshot.
+    """
+    users = ['alice', 'bob', 'carol']
+
+    def setUp(self):
+        # A fake slurm is needed in order to load the corresponding plugin
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = os.path.join(root_path, 'tests', 'fake_slurm') + os.pathsep + self.path
+        self.folder = tempfile.mkdtemp()
+        self.iter_users_session_managers = db.iter_users_session_managers
+        db.iter_users_session_managers = self.session_managers
+
+        records = []
+        for user in self.users:
+            for i in range(2):
+                session = rcm.rcm_session(sessionid='%s-%d' % (user, i), state='valid', username=user,
+                                          jobid='%s%d' % (user, i), otp='otp', vncpassword='crypted')
+                session.hash['scheduler'] = 'Slurm'
+                session.hash['vncpassword_crypted'] = 'crypted'
+                session_file = self.session_manager(user).session_file_path('%s-%d' % (user, i))
+                os.makedirs(os.path.dirname(session_file))
+                session.serialize(session_file)
+            # the second session of every user has no job any more
+            records.append((user, '%s0' % user, 'R', 'rcm-Slurm'))
+        self.snapshot_file = os.path.join(self.folder, 'jobs_snapshot')
+        jobs_snapshot.write_snapshot(self.snapshot_file, records)
+
+        slurm = scheduler.SlurmScheduler(options={'jobs_snapshot': {'file': self.snapshot_file, 'max_age': 60}})
+        # no squeue: the jobs can only come from the snapshot
+        slurm.COMMANDS['squeue'] = None
+        server_manager = manager.ServerManager()
+        server_manager.configuration = config.MyOrderedDict({'admin': {'sessions_index': ''}})
+        server_manager.schedulers = {'Slurm': slurm}
+        self.apis = api.ServerAPIs()
+        self.apis.server_manager = server_manager
+
+    def tearDown(self):
+        db.iter_users_session_managers = self.iter_users_session_managers
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.folder)
+
+    def session_manager(self, user):
+        session_manager = db.DbSessionManager(username=user)
+        session_manager.sessions_dir = os.path.join(self.folder, user, 'sessions')
+        return session_manager
+
+    def session_managers(self, sessions_index=''):
+        for user in self.users:
+            yield self.session_manager(user)
+
+    def list_all(self):
+        stdout = sys.stdout
+        sys.stdout = io.StringIO()
+        try:
+            self.apis.list_all()
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        return [json.loads(line) for line in output.splitlines()]
+
+    def test_records(self):
+        records = self.list_all()
+        self.assertEqual(sorted(r['sessionid'] for r in records),
+                         sorted('%s-%d' % (user, i) for user in self.users for i in range(2)))
+        for record in records:
+            for field in manager.secret_session_fields:
+                self.assertNotIn(field, record)
+            self.assertEqual(record['username'], record['sessionid'].split('-')[0])
+            expected_state = 'R' if record['sessionid'].endswith('-0') else 'finished'
+            self.assertEqual(record['job_state'], expected_state)
+
+    def test_stale_snapshot(self):
+        jobs_snapshot.write_snapshot(self.snapshot_file, [], timestamp=0)
+        # the snapshot is too old and there is no squeue to fall back on
+        records = self.list_all()
+        self.assertEqual(len(records), 6)
+        self.assertTrue(all(r['job_state'] == 'unknown' for r in records))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,89 @@
+import unittest
+import os
+import sys
+import json
+import random
+from collections import OrderedDict
+
+# set prefix.
+current_file = os.path.realpath(os.path.expanduser(__file__))
+current_path = os.path.dirname(os.path.dirname(current_file))
+rcm_root_path = os.path.dirname(current_path)
+
+sys.path.insert(0, current_path)
+
+import rcm
+
+
+def plain(node):
+    # walk the tree through the dict methods, as the display dialog does
+    if isinstance(node, dict):
+        return [(k, plain(v)) for k, v in node.items()]
+    if isinstance(node, list):
+        return [plain(v) for v in node]
+    return node
+
+
+def accounts_menu(accounts, partitions):
+    qos = OrderedDict([('label', 'QOS'), ('type', 'combobox'),
+                       ('values', OrderedDict((q, OrderedDict([('description', q + ' qos'),
+                                                               ('substitutions', {'QOS': q})]))
+                                              for q in ('normal', 'debug', 'long')))])
+    partition = OrderedDict([('QOS', qos),
+                             ('TIME', OrderedDict([('type', 'timeslider'),
+                                                   ('values', OrderedDict([('min', '00:00:00'), ('max', '24:00:00')]))]))])
+    return OrderedDict([('SCHEDULER', OrderedDict([
+        ('type', 'combobox'),
+        ('values', OrderedDict([('Slurm', OrderedDict([('children', OrderedDict([
+            ('ACCOUNT', OrderedDict([
+                ('type', 'combobox'),
+                ('values', OrderedDict(('account%d' % a, OrderedDict([
+                    ('children', OrderedDict([('QUEUE', OrderedDict([
+                        ('type', 'combobox'),
+                        ('values', OrderedDict(('partition%d' % p, OrderedDict([('children', partition)]))
+                                               for p in range(partitions)))]))]))]))
+                    for a in range(accounts)))]))]))]))]))]))])
+
+
+class TestSharedMenu(unittest.TestCase):
+    """
+    The menu encoded with shared subtrees must decode to the same tree of the plain json.
+    """
+
+    def roundtrip(self, menu):
+        shared = json.dumps(rcm.share_subtrees(menu))
+        self.assertEqual(plain(rcm.load_json_menu(shared)), plain(rcm.load_json_menu(json.dumps(menu))))
+        return shared
+
+    def test_accounts(self):
+        menu = accounts_menu(40, 6)
+        shared = self.roundtrip(menu)
+        self.assertLess(len(shared) * 10, len(json.dumps(menu)))
+
+    def test_random_trees(self):
+        rng = random.Random(0)
+
+        def random_tree(depth):
+            if depth == 0 or rng.random() < 0.3:
+                return rng.choice(['a', 'bb', 1, None, True, ['x', 'y']])
+            if rng.random() < 0.2:
+                return [random_tree(depth - 1) for _ in range(rng.randint(0, 3))]
+            return OrderedDict((rng.choice('abcdef'), random_tree(depth - 1)) for _ in range(rng.randint(0, 4)))
+
+        for i in range(500):
+            self.roundtrip(OrderedDict([('root', random_tree(6)), ('copy', random_tree(6))]))
+
+    def test_plain_menu(self):
+        menu = rcm.load_json_menu('{"SERVICE": {"values": {"vnc": {}}}}')
+        self.assertEqual(list(menu['SERVICE'].get('values')), ['vnc'])
+
+    def test_lazy(self):
+        menu = rcm.load_json_menu(json.dumps(rcm.share_subtrees(accounts_menu(3, 2))))
+        accounts = menu['SCHEDULER']['values']['Slurm']['children']['ACCOUNT']['values']
+        self.assertIn(rcm.shared_ref_key, dict.__getitem__(accounts, 'account2'))
+        self.assertIs(accounts['account2'], accounts['account1'])
+        self.assertNotIn(rcm.shared_ref_key, dict.__getitem__(accounts, 'account2'))
+
+
+if __name__ == '__main__':
+    unittest.main()
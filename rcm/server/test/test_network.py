@@ -0,0 +1,78 @@
+import unittest
+import os
+import sys
+import re
+
+# set prefix.
+current_file = os.path.realpath(os.path.expanduser(__file__))
+current_path = os.path.dirname(os.path.dirname(current_file))
+rcm_root_path = os.path.dirname(current_path)
+
+# Add lib folder in current prefix to default  import path
+current_lib_path = os.path.join(current_path, "lib")
+current_utils_path = os.path.join(rcm_root_path, "utils")
+
+sys.path.insert(0, current_path)
+sys.path.insert(0, current_lib_path)
+sys.path.insert(0, current_utils_path)
+
+from collections import OrderedDict
+import manager
+
+
+def reference_use_tunnel(tunnel_map, nodename):
+    use_tunnel = True
+    for node_pattern in tunnel_map:
+        if re.match(node_pattern, nodename):
+            use_tunnel = tunnel_map[node_pattern]
+            break
+    return use_tunnel
+
+
+class TestNetworkRules(unittest.TestCase):
+    """
+    The compiled rules must give the same answers as matching the configured patterns one by one.
+    """
+    tunnel_map = OrderedDict([(r'r(\d+)c01s0[35]\..*', False),
+                              (r'(?P<name>node17[01])\.galileo', False),
+                              (r'node1', 'maybe'),
+                              (r'.*\.pri$', False),
+                              (r'.*', True)])
+    nodes = ['r033c01s03.galileo.cineca.it', 'r033c01s04.galileo.cineca.it', 'node170.galileo.cineca.it',
+             'node172.galileo.cineca.it', 'login06-galileo.cineca.pri', 'other', '']
+
+    def test_use_tunnel(self):
+        rules = manager.NetworkRules(tunnel=self.tunnel_map)
+        self.assertIsNotNone(rules.tunnel_regex)
+        for node in self.nodes:
+            self.assertEqual(rules.use_tunnel(node), reference_use_tunnel(self.tunnel_map, node))
+            # second lookup is served from cache
+            self.assertEqual(rules.use_tunnel(node), reference_use_tunnel(self.tunnel_map, node))
+
+    def test_back_reference_fallback(self):
+        tunnel_map = OrderedDict([(r"b", False), (r"(a)\1", False)])
+        rules = manager.NetworkRules(tunnel=tunnel_map)
+        for node in ['aa', 'ab', 'b', 'c']:
+            self.assertEqual(rules.use_tunnel(node), reference_use_tunnel(tunnel_map, node))
+
+    def test_tunnel_required(self):
+        required_map = OrderedDict([(r'.*\.pri$', True), (r'node17[01]', True), (r'node1', False)])
+        rules = manager.NetworkRules(tunnel=self.tunnel_map, tunnel_required=required_map)
+        for node in self.nodes:
+            self.assertEqual(rules.use_tunnel(node), reference_use_tunnel(self.tunnel_map, node))
+            required = False
+            for node_pattern in required_map:
+                if re.match(node_pattern, node):
+                    required = required_map[node_pattern]
+                    break
+            self.assertEqual(rules.tunnel_required(node), required)
+
+    def test_empty_rules(self):
+        rules = manager.NetworkRules()
+        self.assertEqual(rules.use_tunnel('node'), True)
+        self.assertEqual(rules.tunnel_required('node'), False)
+        self.assertEqual(rules.map_login_name('node'), 'node')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,88 @@
+import unittest
+import os
+import sys
+import time
+import socket
+import shutil
+import tempfile
+
+# set prefix.
+current_file = os.path.realpath(os.path.expanduser(__file__))
+current_path = os.path.dirname(os.path.dirname(current_file))
+
+# Add lib folder in current prefix to default  import path
+current_lib_path = os.path.join(current_path, "lib")
+
+sys.path.insert(0, current_lib_path)
+
+import resolver
+
+
+class TestExternalName(unittest.TestCase):
+    """
+    Reverse lookups with a stubbed gethostbyaddr: only the definitive answers are cached for the whole ttl.
+    """
+
+    def setUp(self):
+        self.cache_folder = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.cache_folder, 'resolver.json')
+        self.lookups = []
+        self.answers = dict()
+        self.gethostbyaddr = socket.gethostbyaddr
+        self.all_addresses = resolver.all_addresses
+        socket.gethostbyaddr = self.stub
+        resolver.all_addresses = lambda: [('eth0', '10.0.0.1'), ('eth1', '10.1.0.1')]
+
+    def tearDown(self):
+        socket.gethostbyaddr = self.gethostbyaddr
+        resolver.all_addresses = self.all_addresses
+        shutil.rmtree(self.cache_folder)
+
+    def stub(self, address):
+        self.lookups.append(address)
+        answer = self.answers[address]
+        if isinstance(answer, Exception):
+            raise answer
+        if isinstance(answer, float):
+            time.sleep(answer)
+            return 'late.cluster', [], [address]
+        return answer, [], [address]
+
+    def external_name(self, subnet):
+        return resolver.external_name(subnet, cache_path=self.cache_path, timeout=0.2, retry_ttl=0.5)
+
+    def test_cached_answer(self):
+        self.answers['10.0.0.1'] = 'login01.cluster'
+        self.assertEqual(self.external_name('10.0.'), 'login01.cluster')
+        self.assertEqual(self.external_name('10.0.'), 'login01.cluster')
+        self.assertEqual(self.lookups, ['10.0.0.1'])
+
+    def test_cached_failure(self):
+        self.answers['10.0.0.1'] = socket.herror(1, 'Unknown host')
+        self.assertIsNone(self.external_name('10.0.'))
+        time.sleep(0.6)
+        self.assertIsNone(self.external_name('10.0.'))
+        self.assertEqual(self.lookups, ['10.0.0.1'])
+
+    def test_timeout(self):
+        self.answers['10.1.0.1'] = 1.0
+        start = time.time()
+        self.assertIsNone(self.external_name('10.1.'))
+        self.assertLess(time.time() - start, 0.8)
+        # not retried within retry_ttl, retried after it
+        self.assertIsNone(self.external_name('10.1.'))
+        self.assertEqual(self.lookups, ['10.1.0.1'])
+        self.answers['10.1.0.1'] = 'login02.cluster'
+        time.sleep(0.6)
+        self.assertEqual(self.external_name('10.1.'), 'login02.cluster')
+
+    def test_temporary_failure(self):
+        self.answers['10.0.0.1'] = socket.herror(2, 'Host name lookup failure')
+        self.assertIsNone(self.external_name('10.0.'))
+        self.answers['10.0.0.1'] = 'login01.cluster'
+        time.sleep(0.6)
+        self.assertEqual(self.external_name('10.0.'), 'login01.cluster')
+
+
+if __name__ == '__main__':
+    unittest.main()
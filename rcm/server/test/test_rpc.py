@@ -0,0 +1,42 @@
+import unittest
+import os
+import sys
+import json
+import subprocess
+
+# set prefix.
+current_file = os.path.realpath(os.path.expanduser(__file__))
+current_path = os.path.dirname(os.path.dirname(current_file))
+server_bin = os.path.join(current_path, 'bin', 'server')
+
+
+class TestRpcServer(unittest.TestCase):
+    """
+    bin/server --rpc with the shipped configuration: stdout must carry the json responses only.
+    """
+
+    def serve(self, requests):
+        process = subprocess.Popen([sys.executable, server_bin, '--rpc'],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   universal_newlines=True)
+        out, err = process.communicate(''.join(json.dumps(r) + '\n' for r in requests), timeout=120)
+        self.assertEqual(process.returncode, 0, err)
+        return [json.loads(line) for line in out.splitlines()], err
+
+    def test_version(self):
+        responses, err = self.serve([{'id': 1, 'command': 'version'},
+                                     {'id': 2, 'command': 'version'},
+                                     {'id': 3, 'command': 'undefined'}])
+        self.assertEqual([r['id'] for r in responses], [1, 2, 3])
+        for response in responses[:2]:
+            self.assertEqual(response['status'], 0)
+            self.assertTrue(response['output'].endswith('server output->1.0.0'))
+            self.assertEqual(response['error'], '')
+        self.assertEqual(responses[2]['status'], 1)
+        # the logging, of the server start and of the commands, went to stderr
+        self.assertIn('started server from file', err)
+        self.assertNotIn('rcmServer', ''.join(r['output'] for r in responses))
+
+
+if __name__ == '__main__':
+    unittest.main()
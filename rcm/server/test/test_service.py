@@ -0,0 +1,82 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+
+# set prefix.
+current_file = os.path.realpath(os.path.expanduser(__file__))
+current_path = os.path.dirname(os.path.dirname(current_file))
+rcm_root_path = os.path.dirname(current_path)
+
+# Add lib folder in current prefix to default  import path
+current_lib_path = os.path.join(current_path, "lib")
+current_utils_path = os.path.join(rcm_root_path, "utils")
+
+sys.path.insert(0, current_path)
+sys.path.insert(0, current_lib_path)
+sys.path.insert(0, current_utils_path)
+sys.path.insert(0, rcm_root_path)
+
+import service
+
+
+class TestReadyFile(unittest.TestCase):
+    """
+    search_port waits for the readiness file written by the job script, the log regex is the fallback.
+    """
+
+    def setUp(self):
+        self.session_folder = tempfile.mkdtemp()
+        self.ready_file = os.path.join(self.session_folder, 'service_ready.json')
+        self.logfile = os.path.join(self.session_folder, 'service.log')
+        # VncService needs the vnc commands: its search_port is called on a service needing bash only
+        self.service = service.Fake()
+        self.service.templates = {'TIMEOUT': '2',
+                                  'HOSTNAME_TEMPLATE': '@{HOSTNAME}.cluster',
+                                  'START_REGEX_LIST': [r"^New desktop is (?P<node>\w+):(?P<display>\d+)"]}
+
+    def tearDown(self):
+        shutil.rmtree(self.session_folder)
+
+    def search_port(self):
+        return service.VncService.search_port(self.service, self.logfile, ready_file=self.ready_file)
+
+    def test_ready_file(self):
+        with open(self.ready_file, 'w') as f:
+            json.dump({'node': 'node01', 'display': 3, 'port': 5913, 'pid': 123,
+                       'started': 1560000000, 'ready': 1560000002}, f)
+        with open(self.logfile, 'w') as f:
+            f.write("New desktop is node02:1\n")
+        self.assertEqual(self.search_port(), {'node': 'node01.cluster', 'display': 3, 'port': 5913})
+
+    def test_regex_fallback(self):
+        with open(self.logfile, 'w') as f:
+            f.write("noise\nNew desktop is node02:1\n")
+        self.assertEqual(self.search_port(), {'node': 'node02.cluster', 'display': 1, 'port': 5901})
+
+    def test_partial_ready_file(self):
+        ready = {'node': 'node01', 'display': 3, 'port': 5913, 'pid': 123}
+        with open(self.ready_file, 'w') as f:
+            f.write(json.dumps(ready)[:20])
+        self.assertIsNone(self.service.read_ready_file(self.ready_file))
+        # a truncated file and no log: only the timeout ends the wait
+        self.service.templates['TIMEOUT'] = '0'
+        self.assertRaisesRegex(Exception, 'Timeouted', self.service.search_logfile, '', regex_list=[],
+                               ready_file=self.ready_file, wait=0.1, timeout=1)
+
+        # completed while waiting
+        def complete():
+            with open(self.ready_file, 'w') as f:
+                json.dump(ready, f)
+
+        timer = threading.Timer(0.3, complete)
+        timer.start()
+        found = self.service.search_logfile('', regex_list=[], ready_file=self.ready_file, wait=0.1, timeout=2)
+        timer.join()
+        self.assertEqual(found, ready)
+
+if __name__ == '__main__':
+    unittest.main()
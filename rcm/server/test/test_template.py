@@ -0,0 +1,77 @@
+import unittest
+import os
+import sys
+import re
+import string
+
+# set prefix.
+current_file = os.path.realpath(os.path.expanduser(__file__))
+current_path = os.path.dirname(os.path.dirname(current_file))
+rcm_root_path = os.path.dirname(current_path)
+
+sys.path.insert(0, rcm_root_path)
+
+from collections import OrderedDict
+import utils
+from utils.misc import parse_template, render_template, template_refs
+
+
+class ReferenceTemplate(string.Template):
+    """
+    The regex based template used before token caching
+    """
+    delimiter = '@'
+    pattern = r"""
+         \@(?:
+          (?P<escaped>\@) |   # Escape sequence of two delimiters
+          (?P<named>[_a-z][_a-z0-9]*)      |   # delimiter and a Python identifier
+          \{(?P<braced>[_\.\-a-z][_\.\-a-z0-9]*)\}   |   # delimiter and a braced identifier
+          (?P<invalid>\@)              # Other ill-formed delimiter exprs
+         )
+        """
+    flags = re.IGNORECASE
+
+
+class TestStringTemplate(unittest.TestCase):
+    """
+    Rendering the cached tokens must give the same output as the regex substitution.
+    """
+    mapping = OrderedDict([('general', 'BAD_SUBSTITUTE'),
+                           ('PKG_WORK_DIR', '${BA_PKG_WORK_DIR}'),
+                           ('general.download', 'http://www.my.url/pippo.tar.gz'),
+                           ('uu', 'OK_SUBSTITUTE'),
+                           ('uu.pp', 'BAD_SUBSTITUTE'),
+                           ('dddd', 3),
+                           ('RCM_SESSIONID', 'user-slurm-1'),
+                           ('nested', '@{RCM_SESSIONID}')])
+
+    templates = ["",
+                 "no references at all",
+                 "@",
+                 "@@",
+                 "@@@",
+                 "trailing @",
+                 "-- @@--{pp.qq} -- aa@uu.pp @dddd@",
+                 "cd @{PKG_WORK_DIR}; wget @{general.download}; echo @{missing.key} @missing",
+                 "@{nested} stays @{nested}, @{RCM_SESSIONID}@{RCM_SESSIONID}",
+                 "@{bad key} @{} @{-a} @1 @{Uu} @UU",
+                 "mail -s 'job @RCM_SESSIONID' user@@example.com"]
+
+    def test_same_output(self):
+        for t in self.templates:
+            self.assertEqual(utils.StringTemplate(t).safe_substitute(self.mapping),
+                             ReferenceTemplate(t).safe_substitute(self.mapping), t)
+
+    def test_keywords(self):
+        t = "@{uu} @{RCM_JOBLOG}"
+        self.assertEqual(utils.StringTemplate(t).safe_substitute(self.mapping, RCM_JOBLOG='log'),
+                         ReferenceTemplate(t).safe_substitute(self.mapping, RCM_JOBLOG='log'))
+
+    def test_tokens_cached(self):
+        t = "cd @{PKG_WORK_DIR} @@ @uu"
+        self.assertIs(parse_template(t), parse_template(t))
+        self.assertEqual(template_refs(t), ['PKG_WORK_DIR', 'uu'])
+        self.assertEqual(render_template(t, {}), ReferenceTemplate(t).safe_substitute({}))
+
+if __name__ == '__main__':
+    unittest.main()
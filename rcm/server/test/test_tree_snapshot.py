@@ -0,0 +1,115 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+# set prefix.
+current_file = os.path.realpath(os.path.expanduser(__file__))
+current_path = os.path.dirname(os.path.dirname(current_file))
+rcm_root_path = os.path.dirname(current_path)
+root_path = os.path.dirname(rcm_root_path)
+
+# Add lib folder in current prefix to default  import path
+current_lib_path = os.path.join(current_path, "lib")
+current_utils_path = os.path.join(rcm_root_path, "utils")
+
+sys.path.insert(0, current_path)
+sys.path.insert(0, current_lib_path)
+sys.path.insert(0, current_utils_path)
+
+import manager
+import scheduler
+import tree_snapshot
+
+
+class CheckedSlurmScheduler(scheduler.SlurmScheduler):
+    """
+    Slurm plugin on the fake slurm commands, every partition is allowed to every account
+    ( no lua job submit check table )
+    """
+
+    @property
+    def check_table(self):
+        return dict((account, {'partitions': list(self.partitions)}) for account in self.accounts)
+
+
+# state of the plugin filled by the PARAMS calls while building the tree
+params_state = ('_accounts', '_partitions', '_qos', '_reservations')
+
+
+class TestTreeSnapshot(unittest.TestCase):
+    """
+    The tree loaded from the snapshot must show the same gui options and render the same job script
+    of a fresh build, without the plugins being asked again for their parameters.
+    """
+
+    def setUp(self):
+        # A fake slurm is needed in order to load the corresponding plugin
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = os.path.join(root_path, 'tests', 'fake_slurm') + os.pathsep + self.path
+        self.base_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.base_dir)
+
+    def server_manager(self):
+        server_manager = manager.ServerManager()
+        server_manager.session_manager.base_dir = self.base_dir
+        server_manager.init()
+        server_manager.schedulers['Slurm'] = CheckedSlurmScheduler(username=server_manager.session_manager.username)
+        return server_manager
+
+    def choices(self, gui_options):
+        account, account_options = list(gui_options['SCHEDULER']['values']['Slurm']['children']['ACCOUNT']['values'].items())[0]
+        queue, queue_options = list(account_options['children']['QUEUE']['values'].items())[0]
+        qos = list(queue_options['children']['QOS']['values'])[0]
+        return json.dumps({'SCHEDULER': 'Slurm',
+                           'SCHEDULER.ACCOUNT': account,
+                           'SCHEDULER.ACCOUNT.QUEUE': queue,
+                           'SCHEDULER.ACCOUNT.QUEUE.QOS': qos,
+                           'SCHEDULER.ACCOUNT.QUEUE.QOS.MEMORY': '4',
+                           'SCHEDULER.ACCOUNT.QUEUE.QOS.CPU': '2',
+                           'SCHEDULER.ACCOUNT.QUEUE.QOS.TIME': '01:00:00',
+                           'SCHEDULER.ACCOUNT.QUEUE.QOS.TIMEOUT': '60'})
+
+    def test_load_root_node(self):
+        built = self.server_manager()
+        built_options = built.root_node.get_gui_options()
+        self.assertTrue(os.path.exists(os.path.join(self.base_dir, 'cache', 'jobscript_tree.pickle')))
+        built_plugin = built.schedulers['Slurm']
+        self.assertTrue(all(key in built_plugin.__dict__ for key in params_state))
+
+        loaded = self.server_manager()
+        loaded_options = loaded.root_node.get_gui_options()
+        self.assertEqual(json.dumps(loaded_options), json.dumps(built_options))
+
+        choices = self.choices(built_options)
+        built.handle_choices(choices)
+        loaded.handle_choices(choices)
+        self.assertIn('#SBATCH -A ', loaded.top_templates['SCRIPT'])
+        self.assertEqual(loaded.top_templates['SCRIPT'], built.top_templates['SCRIPT'])
+        self.assertEqual(loaded.top_templates, built.top_templates)
+
+        # the submit path uses the plugin selected and filled by the substitution of the loaded tree,
+        # not the state of the PARAMS calls, which never happened on this plugin
+        loaded_plugin = loaded.schedulers['Slurm']
+        self.assertIs(loaded.active_scheduler, loaded_plugin)
+        self.assertEqual(loaded_plugin.templates, built_plugin.templates)
+        self.assertFalse(any(key in loaded_plugin.__dict__ for key in params_state))
+
+    def test_invalid_snapshot(self):
+        path = os.path.join(self.base_dir, 'tree.pickle')
+        tree_snapshot.save(path, {'root': 'node'}, 'key', client_info={'client': '1'})
+        self.assertEqual(tree_snapshot.load(path, 'key'), {'root': 'node'})
+        self.assertEqual(tree_snapshot.load(path, 'key', client_info={'client': '1'}), {'root': 'node'})
+        self.assertIsNone(tree_snapshot.load(path, 'other key'))
+        self.assertIsNone(tree_snapshot.load(path, 'key', client_info={'client': '2'}))
+        self.assertIsNone(tree_snapshot.load(path, 'key', max_age=-1))
+        self.assertIsNone(tree_snapshot.load(os.path.join(self.base_dir, 'missing.pickle'), 'key'))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 
 from .misc import StringTemplate, notimeleft_string, timeleft_string
+from .misc import render_template, template_refs
 from .external import hiyapyco
 #from . import error
 #from .executable import which
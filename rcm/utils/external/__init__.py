@@ -1,10 +1,33 @@
 from __future__ import absolute_import
 import os,sys
 
+
+
+def system_yaml_with_libyaml():
+    """
+    True if an installed PyYAML comes with its libyaml extension: it is then used as a whole
+    in place of the vendored pure python one
+    """
+    try:
+        import importlib.util
+        import importlib.machinery
+        spec = importlib.util.find_spec('yaml')
+    except (ImportError, ValueError):
+        return False
+    if spec is None or not spec.submodule_search_locations:
+        return False
+    for location in spec.submodule_search_locations:
+        for suffix in importlib.machinery.EXTENSION_SUFFIXES:
+            if os.path.isfile(os.path.join(location, '_yaml' + suffix)):
+                return True
+    return False
+
+
 basepath = os.path.dirname(os.path.realpath(__file__))
 sys.path.insert(0, basepath)
 if sys.version_info.major == 3 :
-    sys.path.insert(0, os.path.join(basepath,'PyYAML-3.13','lib3'))
+    if not system_yaml_with_libyaml():
+        sys.path.insert(0, os.path.join(basepath,'PyYAML-3.13','lib3'))
 else:
     sys.path.insert(0, os.path.join(basepath,'PyYAML-3.13','lib'))
 #from . import hiyapyco,yaml
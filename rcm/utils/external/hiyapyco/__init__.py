@@ -25,7 +25,9 @@ import yaml
 import logging
 from distutils.util import strtobool
 import re
+from collections import OrderedDict
 from jinja2 import Environment, Undefined, DebugUndefined, StrictUndefined, TemplateError
+from jinja2.bccache import BytecodeCache
 
 from . import odyldo
 
@@ -63,6 +65,56 @@ listTypes = (list, tuple)
 # you may set this to something suitable for you
 jinja2env = Environment(undefined=Undefined)
 
+# compiled templates by source string
+_templatecache = {}
+
+_newline_re = re.compile(r'(\r\n|\r|\n)')
+
+def _hasmarkers(s):
+    """true if jinja2env may render s to something else than its plain text"""
+    if jinja2env.line_statement_prefix or jinja2env.line_comment_prefix:
+        return True
+    return (jinja2env.variable_start_string in s or
+            jinja2env.block_start_string in s or
+            jinja2env.comment_start_string in s)
+
+def _renderplain(s):
+    """what jinja2env renders for a string without markers: only the newlines are rewritten"""
+    lines = s.splitlines()
+    if jinja2env.keep_trailing_newline and s and s[-1] in '\r\n':
+        lines.append('')
+    return _newline_re.sub(jinja2env.newline_sequence, '\n'.join(lines))
+
+def _compile(s):
+    """
+    compiled template of the source string s, cached in memory and,
+    if jinja2env has a bytecode cache, across processes
+    """
+    try:
+        return _templatecache[s]
+    except KeyError:
+        pass
+    code = None
+    bucket = None
+    bcc = jinja2env.bytecode_cache
+    if bcc is not None:
+        try:
+            bucket = bcc.get_bucket(jinja2env, s, None, s)
+            code = bucket.code
+        except Exception as e:
+            logger.debug('bytecode cache lookup failed: %s', e)
+    if code is None:
+        code = jinja2env.compile(s)
+        if bucket is not None:
+            bucket.code = code
+            try:
+                bcc.set_bucket(bucket)
+            except Exception as e:
+                logger.debug('bytecode cache store failed: %s', e)
+    t = jinja2env.template_class.from_code(jinja2env, code, jinja2env.make_globals(None))
+    _templatecache[s] = t
+    return t
+
 METHODS = { 'METHOD_SIMPLE':0x0001, 'METHOD_MERGE':0x0002 }
 METHOD_SIMPLE = METHODS['METHOD_SIMPLE']
 METHOD_MERGE = METHODS['METHOD_MERGE']
@@ -80,6 +132,7 @@ class HiYaPyCo():
           * loglevel: one of  the valid levels from the logging module
           * failonmissingfiles: boolean (default: True)
           * loglevelmissingfiles
+          * bytecodecache: a jinja2 BytecodeCache used to compile interpolated strings (default: None)
 
         Returns a representation of the merged and (if requested) interpolated config.
         Will mostly be a OrderedDict (dict if usedefaultyamlloader), but can be of any other type, depending on the yaml files.
@@ -119,6 +172,15 @@ class HiYaPyCo():
                 self.castinterpolated = kwargs['castinterpolated']
                 del kwargs['castinterpolated']
 
+        if 'bytecodecache' in kwargs:
+            if not (kwargs['bytecodecache'] is None or isinstance(kwargs['bytecodecache'], BytecodeCache)):
+                raise HiYaPyCoInvocationException(
+                        'value of "bytecodecache" must be a jinja2 BytecodeCache (got: "%s" as %s)' %
+                        (kwargs['bytecodecache'], type(kwargs['bytecodecache']),)
+                        )
+            jinja2env.bytecode_cache = kwargs['bytecodecache']
+            del kwargs['bytecodecache']
+
         if 'usedefaultyamlloader' in kwargs:
             if not isinstance(kwargs['usedefaultyamlloader'], bool):
                 raise HiYaPyCoInvocationException(
@@ -161,8 +223,10 @@ class HiYaPyCo():
         for arg in args:
             self._updatefiles(arg)
 
+        # documents to deep merge, all at once when parsed
+        docs = []
         for yamlfile in self._files[:]:
-            logger.debug('yamlfile: %s ...' % yamlfile)
+            logger.debug('yamlfile: %s ...', yamlfile)
             if '\n' in yamlfile:
                 logger.debug('loading yaml doc from str ...')
                 f = yamlfile
@@ -170,18 +234,18 @@ class HiYaPyCo():
                 fn = yamlfile
                 if not os.path.isabs(yamlfile):
                     fn = os.path.join(os.getcwd(), yamlfile)
-                    logger.debug('path extended for yamlfile: %s' % fn)
+                    logger.debug('path extended for yamlfile: %s', fn)
                 try:
                     f = open(fn, 'r')
-                    logger.debug('open4reading: file %s' % f)
+                    logger.debug('open4reading: file %s', f)
                 except IOError as e:
                     logger.log(self.loglevelonmissingfiles, e)
                     if not fn == yamlfile:
                         logger.log(self.loglevelonmissingfiles,
-                                'file not found: %s (%s)' % (yamlfile, fn,))
+                                'file not found: %s (%s)', yamlfile, fn,)
                     else:
                         logger.log(self.loglevelonmissingfiles,
-                                'file not found: %s' % yamlfile)
+                                'file not found: %s', yamlfile)
                     if self.failonmissingfiles:
                         raise HiYaPyCoInvocationException(
                                 'yaml file not found: \'%s\'' % yamlfile
@@ -193,15 +257,18 @@ class HiYaPyCo():
             else:
                 ydata = odyldo.safe_load(f)
             if logger.isEnabledFor(logging.DEBUG):
-                logger.debug('yaml data: %s' % ydata)
-            if self._data is None:
+                logger.debug('yaml data: %s', ydata)
+            if self.method != METHOD_SIMPLE:
+                docs.append(ydata)
+            elif self._data is None:
                 self._data = ydata
             else:
-                if self.method == METHOD_SIMPLE:
-                    self._data = self._simplemerge(self._data, ydata)
-                else:
-                    self._data = self._deepmerge(self._data, ydata)
-                logger.debug('merged data: %s' % self._data)
+                self._data = self._simplemerge(self._data, ydata)
+                logger.debug('merged data: %s', self._data)
+
+        if self.method != METHOD_SIMPLE:
+            self._data = self._deepmergeall(docs)
+            logger.debug('merged data: %s', self._data)
 
         if self.interpolate:
             self._data = self._interpolate(self._data)
@@ -209,7 +276,7 @@ class HiYaPyCo():
     def _updatefiles(self, arg):
         if isinstance(arg, strTypes):
             if arg in self._files:
-                logger.warn('ignoring duplicated file %s' % arg)
+                logger.warn('ignoring duplicated file %s', arg)
                 return
             self._files.append(arg)
         elif isinstance(arg, listTypes):
@@ -219,7 +286,7 @@ class HiYaPyCo():
             raise HiYaPyCoInvocationException('unable to handle arg %s of type %s' % (arg, type(arg),))
 
     def _interpolate(self, d):
-        logger.debug('interpolate "%s" of type %s ...' % (d, type(d),))
+        logger.debug('interpolate "%s" of type %s ...', d, type(d),)
         if d is None:
             return None
         if isinstance(d, strTypes):
@@ -237,11 +304,15 @@ class HiYaPyCo():
         raise HiYaPyCoImplementationException('can not interpolate "%s" of type %s' % (d, type(d),))
 
     def _interpolatestr(self, s):
-        try:
-            si = jinja2env.from_string(s).render(self._data)
-        except TemplateError as e:
-            # FIXME: this seems to be broken for unicode str?
-            raise HiYaPyCoImplementationException('error interpolating string "%s" : %s' % (s, e,))
+        if not _hasmarkers(s):
+            # nothing to interpolate, no need to compile a template
+            si = _renderplain(s)
+        else:
+            try:
+                si = _compile(s).render(self._data)
+            except TemplateError as e:
+                # FIXME: this seems to be broken for unicode str?
+                raise HiYaPyCoImplementationException('error interpolating string "%s" : %s' % (s, e,))
         if not s == si:
             if self.castinterpolated:
                 if not re.match( r'^\d+\.*\d*$', si):
@@ -257,20 +328,20 @@ class HiYaPyCo():
                             si = int(si)
                     except ValueError:
                         pass
-            logger.debug('interpolated "%s" to "%s" (type: %s)' % (s, si, type(si),))
+            logger.debug('interpolated "%s" to "%s" (type: %s)', s, si, type(si),)
         return si
 
     def _simplemerge(self, a, b):
-        logger.debug('simplemerge %s (%s) and %s (%s)' % (a, type(a), b, type(b),))
+        logger.debug('simplemerge %s (%s) and %s (%s)', a, type(a), b, type(b),)
         # FIXME: make None usage configurable
         if b is None:
             logger.debug('pass as b is None')
             pass
         elif isinstance(b, primitiveTypes):
-            logger.debug('simplemerge: primitiveTypes replace a "%s"  w/ b "%s"' % (a, b,))
+            logger.debug('simplemerge: primitiveTypes replace a "%s"  w/ b "%s"', a, b,)
             a = b
         elif isinstance(b, listTypes):
-            logger.debug('simplemerge: listTypes a "%s"  w/ b "%s"' % (a, b,))
+            logger.debug('simplemerge: listTypes a "%s"  w/ b "%s"', a, b,)
             if isinstance(a, listTypes):
                 for k, v in enumerate(b):
                     try:
@@ -278,14 +349,14 @@ class HiYaPyCo():
                     except IndexError:
                         a[k] = b[k]
             else:
-                logger.debug('simplemerge: replace %s w/ list %s' % (a, b,))
+                logger.debug('simplemerge: replace %s w/ list %s', a, b,)
                 a = b
         elif isinstance(b, dict):
             if isinstance(a, dict):
-                logger.debug('simplemerge: update %s:"%s" by %s:"%s"' % (type(a), a, type(b), b,))
+                logger.debug('simplemerge: update %s:"%s" by %s:"%s"', type(a), a, type(b), b,)
                 a.update(b)
             else:
-                logger.debug('simplemerge: replace %s w/ dict %s' % (a, b,))
+                logger.debug('simplemerge: replace %s w/ dict %s', a, b,)
                 a = b
         else:
             raise HiYaPyCoImplementationException(
@@ -294,19 +365,115 @@ class HiYaPyCo():
                     )
         return a
 
+    def _deepmergeall(self, docs):
+        """
+        merge docs in order, the result is the same of merging them one by one with _deepmerge
+        (a and b are modified in place and share subtrees in the same way).
+        Consecutive dicts are merged key by key in a single pass: the value of a key found in
+        just one of them is taken as is, without walking it, only the values of keys found in more
+        documents are merged, again all at once.
+        """
+        a = None
+        i = 0
+        while i < len(docs):
+            if isinstance(a, dict) and isinstance(docs[i], dict):
+                j = i + 1
+                while j < len(docs) and isinstance(docs[j], dict):
+                    j += 1
+                a = self._mergedicts(a, docs[i:j])
+                i = j
+            else:
+                a = self._mergepair(a, docs[i])
+                i += 1
+        return a
+
+    def _mergedicts(self, a, dicts):
+        values = OrderedDict()
+        for b in dicts:
+            for k in b:
+                if k not in values:
+                    values[k] = [a[k]] if k in a else []
+                values[k].append(b[k])
+        for k, v in values.items():
+            if len(v) == 1:
+                a[k] = v[0]
+            else:
+                a[k] = self._deepmergeall(v)
+        return a
+
+    def _mergepair(self, a, b):
+        if a is None or isinstance(b, primitiveTypes):
+            return b
+        if isinstance(a, listTypes):
+            if isinstance(b, listTypes):
+                return self._mergelists(a, b)
+            raise HiYaPyCoImplementationException(
+                    'can not merge %s to %s (@ "%s"  try to merge "%s")' %
+                    (type(b), type(a), a, b,)
+                    )
+        if isinstance(a, dict):
+            if isinstance(b, dict):
+                return self._mergedicts(a, [b])
+            if isinstance(b, listTypes):
+                for bd in b:
+                    if isinstance(bd, dict):
+                        a = self._mergepair(a, bd)
+                    else:
+                        raise HiYaPyCoImplementationException(
+                                'can not merge element from list of type %s to dict (@ "%s" try to merge "%s")' %
+                                (type(b), a, b,)
+                                )
+                return a
+            raise HiYaPyCoImplementationException(
+                    'can not merge %s to %s (@ "%s" try to merge "%s")' %
+                    (type(b), type(a), a, b,)
+                    )
+        return a
+
+    def _mergelists(self, a, b):
+        # primitive and list elements of b not yet in a are appended, looked up by hash when hashable
+        seen = set()
+        unhashable = []
+        for ae in a:
+            try:
+                seen.add(ae)
+            except TypeError:
+                unhashable.append(ae)
+        for be in b:
+            if not (isinstance(be, primitiveTypes) or isinstance(be, listTypes)):
+                continue
+            try:
+                if be in seen:
+                    continue
+                seen.add(be)
+            except TypeError:
+                if be in unhashable:
+                    continue
+                unhashable.append(be)
+            a.append(be)
+        # dicts are merged with the dict at the same position in a, if they have at least a key in common
+        srcdicts = OrderedDict((k, bd) for k, bd in enumerate(b) if isinstance(bd, dict))
+        for k, ad in enumerate(a):
+            if isinstance(ad, dict) and k in srcdicts:
+                if any(ak in srcdicts[k] for ak in ad):
+                    a[k] = self._mergedicts(ad, [srcdicts.pop(k)])
+        a.extend(srcdicts.values())
+        return a
+
     def _deepmerge(self, a, b):
+        # pairwise merge, load uses the equivalent _deepmergeall
         logger.debug('>'*30)
-        logger.debug('deepmerge %s and %s' % (a, b,))
+        logger.debug('deepmerge %s and %s', a, b,)
         # FIXME: make None usage configurable
         if b is None:
             logger.debug('pass as b is None')
             pass
         if a is None or isinstance(b, primitiveTypes):
-            logger.debug('deepmerge: replace a "%s"  w/ b "%s"' % (a, b,))
+            logger.debug('deepmerge: replace a "%s"  w/ b "%s"', a, b,)
             a = b
         elif isinstance(a, listTypes):
             if isinstance(b, listTypes):
-                logger.debug('deepmerge: lists extend %s:"%s" by %s:"%s"' % (type(a), a, type(b), b,))
+                logger.debug('deepmerge: lists extend %s:"%s" by %s:"%s"', type(a), a, type(b), b,)
                 a.extend(be for be in b if be not in a and
                             (isinstance(be, primitiveTypes) or isinstance(be, listTypes))
                         )
@@ -314,9 +481,9 @@ class HiYaPyCo():
                 for k, bd in enumerate(b):
                     if isinstance(bd, dict):
                         srcdicts.update({k:bd})
-                logger.debug('srcdicts: %s' % srcdicts)
+                logger.debug('srcdicts: %s', srcdicts)
                 for k, ad in enumerate(a):
-                    logger.debug('deepmerge ad "%s" w/ k "%s" of type %s' % (ad, k, type(ad)))
+                    logger.debug('deepmerge ad "%s" w/ k "%s" of type %s', ad, k, type(ad))
                     if isinstance(ad, dict):
                         if k in srcdicts.keys():
                             # we merge only if at least one key in dict is matching
@@ -327,14 +494,14 @@ class HiYaPyCo():
                                     break
                             if merge:
                                 logger.debug(
-                                        'deepmerge ad: deep merge list dict elem w/ key:%s: "%s" and "%s"'
-                                        % (ak, ad, srcdicts[k],)
+                                        'deepmerge ad: deep merge list dict elem w/ key:%s: "%s" and "%s"',
+                                        ak, ad, srcdicts[k]
                                     )
                                 a[k] = self._deepmerge(ad, srcdicts[k])
                                 del srcdicts[k]
-                logger.debug('deepmerge list: remaining srcdicts elems: %s' % srcdicts)
+                logger.debug('deepmerge list: remaining srcdicts elems: %s', srcdicts)
                 for k in srcdicts.keys():
-                    logger.debug('deepmerge list: new dict append %s:%s' % (k, srcdicts[k]))
+                    logger.debug('deepmerge list: new dict append %s:%s', k, srcdicts[k])
                     a.append(srcdicts[k])
             else:
                 raise HiYaPyCoImplementationException(
@@ -343,16 +510,16 @@ class HiYaPyCo():
                         )
         elif isinstance(a, dict):
             if isinstance(b, dict):
-                logger.debug('deepmerge: dict ... "%s" and "%s"' % (a, b,))
+                logger.debug('deepmerge: dict ... "%s" and "%s"', a, b,)
                 for k in b:
                     if k in a:
-                        logger.debug('deepmerge dict: loop for key "%s": "%s" and "%s"' % (k, a[k], b[k],))
+                        logger.debug('deepmerge dict: loop for key "%s": "%s" and "%s"', k, a[k], b[k],)
                         a[k] = self._deepmerge(a[k], b[k])
                     else:
-                        logger.debug('deepmerge dict: set key %s' % k)
+                        logger.debug('deepmerge dict: set key %s', k)
                         a[k] = b[k]
             elif isinstance(b, listTypes):
-                logger.debug('deepmerge: dict <- list ... "%s" <- "%s"' % (a, b,))
+                logger.debug('deepmerge: dict <- list ... "%s" <- "%s"', a, b,)
                 for bd in b:
                     if isinstance(bd, dict):
                         a = self._deepmerge(a, bd)
@@ -366,7 +533,7 @@ class HiYaPyCo():
                         'can not merge %s to %s (@ "%s" try to merge "%s")' %
                         (type(b), type(a), a, b,)
                         )
-        logger.debug('end deepmerge part: return: "%s"' % a)
+        logger.debug('end deepmerge part: return: "%s"', a)
         logger.debug('<'*30)
         return a
 
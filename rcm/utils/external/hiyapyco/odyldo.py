@@ -26,6 +26,8 @@ import yaml
 import yaml.loader
 import yaml.dumper
 import yaml.representer
+import yaml.constructor
+import yaml.resolver
 
 # @see: yaml.resolver.DEFAULT_MAPPING_TAG
 ODYLDoYAMLMAPS = [
@@ -33,10 +35,13 @@ ODYLDoYAMLMAPS = [
     'tag:yaml.org,2002:omap',
     ]
 
-class ODYL(yaml.SafeLoader):
-    """Ordered Dict Yaml Loader"""
-    def __init__(self, *args, **kwargs):
-        yaml.SafeLoader.__init__(self, *args, **kwargs)
+# the libyaml based parser of the imported yaml package, if it was built with it
+CParser = yaml.cyaml.CParser if getattr(yaml, '__with_libyaml__', False) else None
+__with_libyaml__ = CParser is not None
+
+class ODYConstructor(object):
+    """Ordered Dict constructor, mixed in the pure python and in the libyaml loaders"""
+    def _odyinit(self):
         for mapping in ODYLDoYAMLMAPS:
             self.add_constructor(mapping, type(self)._odyload)
 
@@ -56,6 +61,23 @@ class ODYL(yaml.SafeLoader):
             m[self.construct_object(k, deep=deep)] = self.construct_object(v, deep=deep)
         return m
 
+class ODYL(ODYConstructor, yaml.SafeLoader):
+    """Ordered Dict Yaml Loader"""
+    def __init__(self, *args, **kwargs):
+        yaml.SafeLoader.__init__(self, *args, **kwargs)
+        self._odyinit()
+
+if __with_libyaml__:
+    class ODYCL(ODYConstructor, CParser, yaml.constructor.SafeConstructor, yaml.resolver.Resolver):
+        """Ordered Dict Yaml Loader on libyaml"""
+        def __init__(self, stream):
+            CParser.__init__(self, stream)
+            yaml.constructor.SafeConstructor.__init__(self)
+            yaml.resolver.Resolver.__init__(self)
+            self._odyinit()
+else:
+    ODYCL = None
+
 class ODYD(yaml.SafeDumper):
     """Ordered Dict Yaml Dumper"""
     def __init__(self, *args, **kwargs):
@@ -67,7 +89,7 @@ class ODYD(yaml.SafeDumper):
 
 def safe_load(stream):
     """implementation of safe loader using Ordered Dict Yaml Loader"""
-    return yaml.load(stream, ODYL)
+    return yaml.load(stream, ODYCL or ODYL)
 
 def safe_dump(data, stream=None, **kwds):
     """implementation of safe dumper using Ordered Dict Yaml Dumper"""
@@ -5,6 +5,10 @@ import os
 import datetime
 import time
 import logging
+try:
+    from collections import ChainMap
+except ImportError:
+    ChainMap = None
 
 logger = logging.getLogger('rcmServer' + '.' + __name__)
 notimeleft_string = "~"
@@ -29,9 +33,13 @@ def timeleft_string(walltime, created):
 
 
 class StringTemplate(string.Template):
-    def __init__(self, s=''):
-        string.Template.__init__(self, s)
-        rr = """
+    """
+    string.Template with @ delimiter and dotted braced names: @name, @{a.b-c}, @@ for a literal @.
+    The pattern is compiled once for the class and safe_substitute renders the cached token list
+    of the template ( see parse_template ), with the same output of string.Template.safe_substitute.
+    """
+    delimiter = '@'
+    pattern = r"""
          \@(?:
           (?P<escaped>\@) |   # Escape sequence of two delimiters
           (?P<named>[_a-z][_a-z0-9]*)      |   # delimiter and a Python identifier
@@ -39,13 +47,103 @@ class StringTemplate(string.Template):
           (?P<invalid>\@)              # Other ill-formed delimiter exprs
          )
         """
-        self.pattern = re.compile(rr, re.VERBOSE | re.IGNORECASE)
-        self.delimiter = '@'
+    flags = re.IGNORECASE
+
+    def __init__(self, s=''):
+        string.Template.__init__(self, s)
+        # python 2 does not compile the class pattern with the custom flags
+        if not hasattr(self.pattern, 'search'):
+            StringTemplate.pattern = re.compile(StringTemplate.pattern, re.VERBOSE | re.IGNORECASE)
 
     def templ_match(self, s=''):
         m = self.pattern.search(s)
         return m
 
+    def safe_substitute(self, *args, **kws):
+        if len(args) > 1:
+            raise TypeError('Too many positional arguments')
+        mapping = args[0] if args else dict()
+        if kws:
+            if ChainMap is not None:
+                mapping = ChainMap(kws, mapping)
+            else:
+                merged = dict(mapping)
+                merged.update(kws)
+                mapping = merged
+        return render_template(self.template, mapping)
+
+
+# parsed templates by source string
+_parsed_templates = dict()
+_parsed_templates_max = 4096
+
+
+def parse_template(s):
+    """
+    Return the template s as a tuple of tokens: literal strings and (name, source text) references.
+    Results are cached by source, so every distinct template is scanned once per process.
+    """
+    tokens = _parsed_templates.get(s, None)
+    if tokens is not None:
+        return tokens
+    pattern = StringTemplate('').pattern
+    tokens = []
+    literal = []
+    pos = 0
+    for mo in pattern.finditer(s):
+        literal.append(s[pos:mo.start()])
+        pos = mo.end()
+        named = mo.group('named') or mo.group('braced')
+        if named is not None:
+            if literal:
+                tokens.append(''.join(literal))
+                literal = []
+            tokens.append((named, mo.group()))
+        elif mo.group('escaped') is not None:
+            literal.append(StringTemplate.delimiter)
+        else:
+            literal.append(mo.group())
+    literal.append(s[pos:])
+    literal = ''.join(literal)
+    if literal:
+        tokens.append(literal)
+    tokens = tuple(tokens)
+    if len(_parsed_templates) >= _parsed_templates_max:
+        _parsed_templates.clear()
+    _parsed_templates[s] = tokens
+    return tokens
+
+
+def template_refs(s, braced_only=False):
+    """
+    Names referenced by the template s, in order of first appearance;
+    braced_only skips the @name form, which also matches things like user@host
+    """
+    refs = []
+    for token in parse_template(s):
+        if type(token) is tuple and token[0] not in refs:
+            if braced_only and not token[1].startswith(StringTemplate.delimiter + '{'):
+                continue
+            refs.append(token[0])
+    return refs
+
+
+def render_template(s, mapping):
+    """
+    Same as StringTemplate(s).safe_substitute(mapping): references missing from mapping are left as they are,
+    values are inserted as they are, without further expansion.
+    """
+    out = []
+    for token in parse_template(s):
+        if type(token) is tuple:
+            try:
+                out.append(str(mapping[token[0]]))
+            except KeyError:
+                out.append(token[1])
+        else:
+            out.append(token)
+    return ''.join(out)
+
 
 class filetemplate(StringTemplate):
     def __init__(self, file=''):